@@ -0,0 +1,550 @@
+"""Benchmarks for the MIDI → OBS controller.
+
+Run from app/:
+
+    python bench.py midi-input [--seconds 5] [--rate 20]
+    python bench.py trigger    [--notes 200] [--obs-latency 0.002] [--scenes 50] [--midi inject|virtual]
+    python bench.py tick       [--target loop|sequence|lanes] [--seconds 10] [--tick 0.05] [--lanes 24 ...]
+    python bench.py burst      [--bursts 20] [--roll 16] [--gap-ms 5]
+    python bench.py replay     SESSION.jsonl [--speed 1]
+    python bench.py compare BASELINE.json RESULTS.json
+
+midi-input compares the MIDI input modes in main.MIDI_INPUT_MODES (plus the
+dispatcher queue) on a synthetic port: process CPU use while idling between
+notes, and note-to-dispatch latency measured from the moment a message is
+handed to the "driver" to the moment the handler sees it.
+
+trigger, tick and burst run the real threaded engine against a local fake
+OBS server (fake_obs.FakeObsServer) with configurable response latency and
+scene count:
+
+  trigger  handle_midi → SetCurrentProgramScene → CurrentProgramSceneChanged
+           latency per stage, from main.LatencyTracker
+  tick     loop / sequence switch timing as seen by OBS, tick jitter, and
+           CPU seconds per hour of playback; "lanes" runs one loop on each
+           of --lanes lanes at once and reports the worst lane's jitter
+           (one run per value, to show how it grows with the lane count)
+  burst    pad rolls of closely spaced notes through handle_midi: trigger
+           throughput, superseded triggers, coalesced switches and OBS
+           requests actually sent
+  replay   a session recorded with main.RECORD_SESSION, fed back through
+           handle_midi at --speed times real time (loop tempos scaled to
+           match) with the recorded random seed, config and flags; reports
+           how many scene switches match the recording, plus latency and CPU
+
+Every benchmark prints JSON; --output also writes it to a file, and compare
+shows the relative change of each metric between two such files.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import queue
+import statistics
+import sys
+import threading
+import time
+from unittest.mock import patch
+
+import main
+from fake_obs import FakeObsServer
+
+
+# ---------------------------------------------------------------------------
+# Synthetic MIDI input
+# ---------------------------------------------------------------------------
+
+class SyntheticInput:
+    """Stand-in for an rtmidi input port driven by a generator thread.
+
+    Like mido's rtmidi backend, messages go to ``callback`` when one is set and
+    to an internal queue otherwise. Each message's ``time`` is set to the
+    perf_counter() value at which it was injected.
+    """
+
+    def __init__(self, rate: float, count: int, done: threading.Event):
+        self.callback = None
+        self._done = done
+        self._queue = queue.Queue()
+        self._interval = 1.0 / rate
+        self._count = count
+        self._thread = threading.Thread(target=self._generate, daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def _generate(self) -> None:
+        next_at = time.perf_counter()
+        for i in range(self._count):
+            next_at += self._interval
+            time.sleep(max(0.0, next_at - time.perf_counter()))
+            msg = main.mido.Message("note_on", note=36 + i % 16, velocity=100,
+                                    time=time.perf_counter())
+            (self.callback or self._queue.put)(msg)
+        # Wake a reader blocked in receive() once the run is over
+        self._done.wait()
+        self._queue.put(main.mido.Message("stop"))
+
+    def __iter__(self):
+        while True:
+            yield self._queue.get()
+
+    def iter_pending(self):
+        while True:
+            try:
+                yield self._queue.get_nowait()
+            except queue.Empty:
+                return
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def bench_midi_input(mode: str, use_queue: bool, seconds: float, rate: float) -> dict:
+    """Measure CPU use and note-to-dispatch latency for one input mode."""
+    count = max(1, int(seconds * rate))
+    stop = threading.Event()
+    port = SyntheticInput(rate, count, stop)
+    latencies = []
+
+    def handler(msg):
+        if msg.type != "note_on":
+            return
+        latencies.append(time.perf_counter() - msg.time)
+        if len(latencies) >= count:
+            stop.set()
+
+    dispatcher = main.MidiDispatcher(handler) if use_queue else None
+    cpu0, wall0 = time.process_time(), time.perf_counter()
+    port.start()
+    main.pump_midi(port, dispatcher.put if dispatcher else handler, mode=mode, stop=stop)
+    cpu, wall = time.process_time() - cpu0, time.perf_counter() - wall0
+    if dispatcher is not None:
+        dispatcher.close()
+
+    latencies_us = [v * 1e6 for v in latencies]
+    return {
+        "mode": mode + ("+queue" if use_queue else ""),
+        "messages": len(latencies),
+        "cpu_percent": round(100.0 * cpu / wall, 2),
+        "latency_us_p50": round(statistics.median(latencies_us), 1),
+        "latency_us_p99": round(_percentile(latencies_us, 99), 1),
+        "latency_us_max": round(max(latencies_us), 1),
+    }
+
+
+def run_midi_input(args) -> list[dict]:
+    results = []
+    for mode in main.MIDI_INPUT_MODES:
+        for use_queue in (False, True):
+            results.append(bench_midi_input(mode, use_queue, args.seconds, args.rate))
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Engine benchmarks against the fake OBS server
+# ---------------------------------------------------------------------------
+
+@contextlib.contextmanager
+def obs_session(scenes: int, obs_latency: float, scene_names: list[str] | None = None):
+    """Fake OBS server (with *scene_names*, or *scenes* generated ones) plus
+    a connected main.ObsConnection, with a live scene catalog and a fresh main.latency
+    tracker. Yields (server, client)."""
+    main._logger.configure("error")
+    tracker = main.LatencyTracker()
+    with FakeObsServer(scene_names, scene_count=scenes, latency=obs_latency) as server, \
+            patch.object(main, "latency", tracker), \
+            patch.object(main, "scene_catalog", main.SceneCatalog()):
+        client = main.ObsConnection(host="127.0.0.1", port=server.port, password="").connect()
+        try:
+            main.scene_catalog.attach(client)
+            main.scene_catalog.load(client)
+            tracker.attach(client)
+            yield server, client
+        finally:
+            main.lanes.stop(timeout=5)
+            client.close()
+            main._logger.flush()
+            main._logger.configure(main.LOG_LEVEL, main.LOG_TAG_LEVELS, main.LOG_FORMAT)
+
+
+class NoteSource:
+    """Plays notes into a MIDI handler.
+
+    "inject" calls the handler directly on the calling thread. "virtual"
+    sends through a virtual mido port read by main.pump_midi, exercising the
+    real input path (needs a backend with virtual ports, e.g. rtmidi on
+    macOS/Linux).
+    """
+
+    PORT_NAME = "midi-obs-bench"
+
+    def __init__(self, handler, kind: str = "inject"):
+        self.handler = handler
+        self.kind = kind
+        self._stop = threading.Event()
+        self._in = self._out = self._thread = None
+
+    def __enter__(self) -> "NoteSource":
+        if self.kind == "virtual":
+            self._in = main.mido.open_input(self.PORT_NAME, virtual=True)
+            self._out = main.mido.open_output(self.PORT_NAME)
+            self._thread = threading.Thread(
+                target=main.pump_midi, args=(self._in, self.handler),
+                kwargs={"mode": "callback", "stop": self._stop}, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *_):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._out.close()
+            self._in.close()
+
+    def send(self, note: int) -> None:
+        msg = main.mido.Message("note_on", note=note, velocity=100)
+        if self._out is not None:
+            self._out.send(msg)
+        else:
+            self.handler(msg)
+
+
+def _cpu_per_hour(cpu: float, wall: float) -> float:
+    return round(cpu / wall * 3600, 2)
+
+
+def _wait_for(predicate, timeout: float = 5.0) -> bool:
+    deadline = time.perf_counter() + timeout
+    while not predicate():
+        if time.perf_counter() > deadline:
+            return False
+        time.sleep(0.001)
+    return True
+
+
+def bench_trigger(notes: int, obs_latency: float, scenes: int, midi: str = "inject",
+                  gap: float = 0.02) -> dict:
+    """Latency of single triggers (static scene switches), one at a time."""
+    scenes = max(scenes, 2)
+    midi_map = {36 + i: {"action": "static", "scene": f"LOOP_A_{i + 1}"} for i in range(min(scenes, 16))}
+    with obs_session(scenes, obs_latency) as (server, client), \
+            patch.dict(main.MIDI_MAP, midi_map, clear=True), \
+            NoteSource(lambda msg: main.handle_midi(msg, client), midi) as source:
+        cpu0, wall0 = time.process_time(), time.perf_counter()
+        for i in range(notes):
+            sent = server.request_count("SetCurrentProgramScene")
+            source.send(36 + i % len(midi_map))
+            _wait_for(lambda: server.request_count("SetCurrentProgramScene") > sent)
+            main.lanes.wait_idle(timeout=5)
+            time.sleep(gap)  # let the confirmation event arrive before the next note
+        cpu, wall = time.process_time() - cpu0, time.perf_counter() - wall0
+        stages = main.latency.summary()
+    return {
+        "name": f"trigger/{midi}/obs={obs_latency * 1000:g}ms/scenes={scenes}",
+        "notes": notes,
+        "cpu_percent": round(100.0 * cpu / wall, 2),
+        **{f"{stage}_{key}": value for stage, s in stages.items()
+           for key, value in s.items() if key != "count"},
+    }
+
+
+def _interval_errors_ms(times: list[float], tick: float) -> list[float]:
+    return [abs((b - a) - tick) * 1000 for a, b in zip(times, times[1:])]
+
+
+def bench_tick(target: str, seconds: float, tick: float, obs_latency: float, scenes: int,
+               lanes: int = 24) -> dict:
+    """Switch timing and CPU cost of a running loop (or a sequence of loops,
+    or one loop on each of *lanes* lanes)."""
+    bpm = 60.0 / tick
+    with obs_session(scenes, obs_latency) as (server, client):
+        sequence = main.scene_catalog.scenes_for(client, "LOOP_A_")
+        clocks = [main.TickClock(tick) for _ in range(lanes if target == "lanes" else 1)]
+        if target == "sequence":
+            steps = [
+                {"action": "loop", "prefix": "LOOP_A_", "style": "cycle", "bpm": bpm, "steps": 1, "repeats": 2},
+                {"action": "loop", "prefix": "LOOP_A_", "style": "bounce", "bpm": bpm, "steps": 1, "repeats": 2},
+            ]
+            programs = [main.sequence_program(steps)]
+        else:
+            programs = [main.loop_program(sequence, tick, "cycle", clock=clock) for clock in clocks]
+        cpu0, wall0 = time.process_time(), time.perf_counter()
+        for n, program in enumerate(programs):
+            main.lanes.play(program, f"bench{n}", client=client)
+        time.sleep(seconds)
+        cpu, wall = time.process_time() - cpu0, time.perf_counter() - wall0
+        main.lanes.stop(timeout=5)
+        times = [at for at, _ in server.request_log("SetCurrentProgramScene")]
+
+    if target == "lanes":
+        # Switches from all lanes interleave at OBS; judge each lane by its own clock
+        worst = max((c.stats.summary() for c in clocks), key=lambda s: s["max_ms"])
+        return {
+            "name": f"tick/lanes={lanes}/tick={tick * 1000:g}ms/obs={obs_latency * 1000:g}ms",
+            "switches": len(times),
+            "cpu_s_per_hour": _cpu_per_hour(cpu, wall),
+            **{f"worst_lane_jitter_{k}": v for k, v in worst.items()},
+        }
+    errors = _interval_errors_ms(times, tick) or [0.0]
+    result = {
+        "name": f"tick/{target}/tick={tick * 1000:g}ms/obs={obs_latency * 1000:g}ms",
+        "switches": len(times),
+        "interval_error_ms_p50": round(statistics.median(errors), 3),
+        "interval_error_ms_p99": round(_percentile(errors, 99), 3),
+        "interval_error_ms_max": round(max(errors), 3),
+        "cpu_s_per_hour": _cpu_per_hour(cpu, wall),
+    }
+    if target == "loop":
+        result.update({f"jitter_{k}": v for k, v in clocks[0].stats.summary().items()})
+    return result
+
+
+def bench_burst(bursts: int, roll: int, gap: float, obs_latency: float, scenes: int,
+                rest: float = 0.25) -> dict:
+    """Pad rolls: *roll* notes *gap* seconds apart, *bursts* times."""
+    scenes = max(scenes, 2)
+    midi_map = {}
+    for i in range(roll):
+        if i % 2:
+            midi_map[36 + i] = {"action": "static", "scene": f"LOOP_A_{1 + i % scenes}"}
+        else:
+            midi_map[36 + i] = {"action": "loop", "prefix": "LOOP_A_", "style": "cycle", "bpm": 120, "steps": 1}
+    handle_ns = []
+    with obs_session(scenes, obs_latency) as (server, client), \
+            patch.dict(main.MIDI_MAP, midi_map, clear=True):
+        superseded0, coalesced0 = main.lanes.superseded, main.lanes.switches.coalesced
+        cpu0, wall0 = time.process_time(), time.perf_counter()
+        for _ in range(bursts):
+            for i in range(roll):
+                msg = main.mido.Message("note_on", note=36 + i, velocity=100)
+                started = time.perf_counter_ns()
+                main.handle_midi(msg, client)
+                handle_ns.append(time.perf_counter_ns() - started)
+                time.sleep(gap)
+            time.sleep(rest)
+        cpu, wall = time.process_time() - cpu0, time.perf_counter() - wall0
+        main.lanes.stop(timeout=5)
+        superseded = main.lanes.superseded - superseded0
+        coalesced = main.lanes.switches.coalesced - coalesced0
+        stages = main.latency.summary()
+        requests = server.request_count("SetCurrentProgramScene")
+
+    handle_us = [ns / 1000 for ns in handle_ns]
+    notes = bursts * roll
+    return {
+        "name": f"burst/roll={roll}/gap={gap * 1000:g}ms/obs={obs_latency * 1000:g}ms",
+        "notes": notes,
+        "handle_us_p50": round(statistics.median(handle_us), 1),
+        "handle_us_p99": round(_percentile(handle_us, 99), 1),
+        "handle_us_max": round(max(handle_us), 1),
+        "notes_per_s_handled": round(notes / (sum(handle_us) / 1e6), 1),
+        "superseded": superseded,
+        "coalesced": coalesced,
+        "obs_switch_requests": requests,
+        "note_to_switch_p50_ms": stages.get("note_to_switch", {}).get("p50_ms"),
+        "note_to_switch_p99_ms": stages.get("note_to_switch", {}).get("p99_ms"),
+        "cpu_percent": round(100.0 * cpu / wall, 2),
+    }
+
+
+def _recorded_scenes(records: list[dict]) -> list[str] | None:
+    """Scene names from the first GetSceneList response in a session, top-down."""
+    for record in records:
+        if record.get("request", {}).get("requestType") == "GetSceneList":
+            data = record["response"].get("responseData") or {}
+            return [scene["sceneName"] for scene in reversed(data.get("scenes", []))]
+    return None
+
+
+def _recorded_switches(records: list[dict]) -> list[str]:
+    """Every SetCurrentProgramScene a session sent, alone or inside a batch."""
+    switches = []
+    for record in records:
+        request = record.get("request")
+        for one in (request.get("requests", [request]) if request else ()):
+            if one.get("requestType") == "SetCurrentProgramScene":
+                switches.append(one["requestData"]["sceneName"])
+    return switches
+
+
+def replay_session(records: list[dict], client, speed: float = 1.0) -> None:
+    """Feed a session's MIDI messages and config reloads through handle_midi at
+    *speed* times real time, then play on until its last recorded request."""
+    start = time.perf_counter()
+    for record in records:
+        delay = start + record["us"] / 1e6 / speed - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        if "midi" in record:
+            main.handle_midi(main.mido.Message.from_bytes(record["midi"]), client, record.get("port"))
+        elif "config" in record:
+            new_map = main.build_action_map(main.scale_tempo(record["config"], speed), main.MIDI_MAP)
+            added, _, changed = new_map.diff(main.MIDI_MAP)
+            main.MIDI_MAP = new_map
+            if added or changed:
+                main.restart_changed_loop(client, added | changed)
+
+
+def bench_replay(path: str, speed: float, obs_latency: float, scenes: int) -> dict:
+    """Replay a recorded session against the fake OBS and compare its switches."""
+    header, records = main.read_session(path)
+    recorded = _recorded_switches(records)
+    with contextlib.ExitStack() as stack:
+        for name, value in header["flags"].items():
+            stack.enter_context(patch.object(main, name, value))
+        stack.enter_context(patch.object(main, "MIDI_MAP",
+                                         main.build_action_map(main.scale_tempo(header["config"], speed))))
+        stack.enter_context(patch.object(main, "midi_clock", main.MidiClock()))
+        server, client = stack.enter_context(obs_session(scenes, obs_latency, _recorded_scenes(records)))
+        superseded0 = main.lanes.superseded
+        main.playback_random.seed(header["seed"])
+        cpu0, wall0 = time.process_time(), time.perf_counter()
+        replay_session(records, client, speed)
+        main.lanes.stop(timeout=5)
+        cpu, wall = time.process_time() - cpu0, time.perf_counter() - wall0
+        superseded = main.lanes.superseded - superseded0
+        stages = main.latency.summary()
+        played = [data["sceneName"] for _, data in server.request_log("SetCurrentProgramScene")]
+
+    matching = next((i for i, (a, b) in enumerate(zip(recorded, played)) if a != b),
+                    min(len(recorded), len(played)))
+    return {
+        "name": f"replay/{os.path.basename(path)}/speed={speed:g}/obs={obs_latency * 1000:g}ms",
+        "midi_messages": sum(1 for r in records if "midi" in r),
+        "wall_s": round(wall, 3),
+        "recorded_switches": len(recorded),
+        "replayed_switches": len(played),
+        "matching_switches": matching,
+        "superseded": superseded,
+        "note_to_switch_p50_ms": stages.get("note_to_switch", {}).get("p50_ms"),
+        "note_to_switch_p99_ms": stages.get("note_to_switch", {}).get("p99_ms"),
+        "cpu_percent": round(100.0 * cpu / wall, 2),
+    }
+
+
+def run_trigger(args) -> list[dict]:
+    return [bench_trigger(args.notes, latency, args.scenes, args.midi)
+            for latency in args.obs_latency]
+
+
+def run_tick(args) -> list[dict]:
+    targets = ("loop", "sequence", "lanes") if args.target == "all" else (args.target,)
+    return [bench_tick(target, args.seconds, args.tick, latency, args.scenes, lanes)
+            for target in targets for latency in args.obs_latency
+            for lanes in (args.lanes if target == "lanes" else args.lanes[:1])]
+
+
+def run_burst(args) -> list[dict]:
+    return [bench_burst(args.bursts, args.roll, args.gap_ms / 1000, latency, args.scenes)
+            for latency in args.obs_latency]
+
+
+def run_replay(args) -> list[dict]:
+    return [bench_replay(args.session, args.speed, latency, args.scenes)
+            for latency in args.obs_latency]
+
+
+# ---------------------------------------------------------------------------
+# Result files
+# ---------------------------------------------------------------------------
+
+def _key(result: dict) -> str:
+    return result.get("name") or result.get("mode")
+
+
+def compare(baseline: dict, current: dict) -> list[dict]:
+    """Relative change of every numeric metric present in both result files."""
+    before = {_key(r): r for r in baseline["results"]}
+    rows = []
+    for result in current["results"]:
+        old = before.get(_key(result))
+        if old is None:
+            continue
+        for metric, value in result.items():
+            prev = old.get(metric)
+            if isinstance(value, (int, float)) and isinstance(prev, (int, float)) and metric != "name":
+                change = None if prev == 0 else round(100.0 * (value - prev) / prev, 1)
+                rows.append({"name": _key(result), "metric": metric,
+                             "baseline": prev, "current": value, "change_percent": change})
+    return rows
+
+
+def run_compare(args) -> list[dict]:
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+    return compare(baseline, current)
+
+
+def main_cli(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="bench", required=True)
+    p = sub.add_parser("midi-input", help="compare MIDI input modes")
+    p.add_argument("--seconds", type=float, default=5.0)
+    p.add_argument("--rate", type=float, default=20.0, help="notes per second")
+    p.add_argument("--output", help="also write the results to this JSON file")
+    p.set_defaults(run=run_midi_input)
+
+    def obs_options(p, latencies=(0.0, 0.002, 0.010)):
+        p.add_argument("--obs-latency", type=float, nargs="+", default=list(latencies),
+                       help="fake OBS response latency in seconds (one run per value)")
+        p.add_argument("--scenes", type=int, default=50, help="scenes in the fake OBS")
+        p.add_argument("--output", help="also write the results to this JSON file")
+
+    p = sub.add_parser("trigger", help="note → program scene latency per stage")
+    p.add_argument("--notes", type=int, default=200)
+    p.add_argument("--midi", choices=("inject", "virtual"), default="inject")
+    obs_options(p)
+    p.set_defaults(run=run_trigger)
+
+    p = sub.add_parser("tick", help="loop/sequence switch timing and CPU per hour")
+    p.add_argument("--target", choices=("loop", "sequence", "lanes", "all"), default="all")
+    p.add_argument("--seconds", type=float, default=10.0)
+    p.add_argument("--tick", type=float, default=0.05, help="seconds per scene switch")
+    p.add_argument("--lanes", type=int, nargs="+", default=[24],
+                   help="concurrent loops for --target lanes (one run per value)")
+    obs_options(p)
+    p.set_defaults(run=run_tick)
+
+    p = sub.add_parser("burst", help="pad-roll throughput through handle_midi")
+    p.add_argument("--bursts", type=int, default=20)
+    p.add_argument("--roll", type=int, default=16, help="notes per burst")
+    p.add_argument("--gap-ms", type=float, default=5.0, help="time between notes in a burst")
+    obs_options(p)
+    p.set_defaults(run=run_burst)
+
+    p = sub.add_parser("replay", help="replay a recorded session against the fake OBS")
+    p.add_argument("session", help="JSONL file written with main.RECORD_SESSION")
+    p.add_argument("--speed", type=float, default=1.0, help="playback speed (2 = twice as fast)")
+    obs_options(p, latencies=(0.0,))
+    p.set_defaults(run=run_replay)
+
+    p = sub.add_parser("compare", help="relative change between two --output files")
+    p.add_argument("baseline")
+    p.add_argument("current")
+    p.set_defaults(run=run_compare)
+
+    args = parser.parse_args(argv)
+    results = args.run(args)
+    if getattr(args, "output", None):
+        report = {
+            "bench": args.bench,
+            "params": {k: v for k, v in vars(args).items() if k not in ("run", "bench", "output")},
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main_cli()
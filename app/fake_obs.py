@@ -0,0 +1,354 @@
+"""Local stand-in for the OBS WebSocket v5 server, for tests and benchmarks.
+
+Speaks enough of the obs-websocket protocol (handshake with optional
+password, requests, request batches, events) for obsws_python's
+ReqClient/EventClient and main.AsyncObsClient, with configurable response
+latency and scene count:
+
+    with FakeObsServer(scene_count=300, latency=0.005) as server:
+        client = obs.ReqClient(host="127.0.0.1", port=server.port, password="")
+
+Use it as a context manager to run it on a background thread, or
+``await server.start()`` / ``await server.close()`` inside an event loop.
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import threading
+import time
+
+from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed
+
+# obs-websocket opcodes
+HELLO, IDENTIFY, IDENTIFIED, EVENT, REQUEST, REQUEST_RESPONSE = 0, 1, 2, 5, 6, 7
+REQUEST_BATCH, REQUEST_BATCH_RESPONSE = 8, 9
+
+# obs-websocket EventSubscription bits
+SUB_SCENES = 1 << 2
+SUB_TRANSITIONS = 1 << 4
+SUB_FILTERS = 1 << 5
+SUB_SCENEITEMS = 1 << 7
+
+# obs-websocket RequestStatus codes
+SUCCESS = 100
+UNKNOWN_REQUEST_TYPE = 204
+STUDIO_MODE_NOT_ACTIVE = 506
+RESOURCE_NOT_FOUND = 600
+
+
+class RequestFailed(Exception):
+    def __init__(self, code: int, comment: str):
+        super().__init__(comment)
+        self.code = code
+        self.comment = comment
+
+
+class FakeObsServer:
+    """In-process OBS WebSocket server with a scriptable scene list."""
+
+    def __init__(self, scenes=None, scene_count: int = 0, prefix: str = "LOOP_A_",
+                 latency: float = 0.0, password: str | None = None):
+        if scenes is None:
+            scenes = [f"{prefix}{i}" for i in range(1, scene_count + 1)]
+        self.scenes = list(scenes)
+        self.program_scene = self.scenes[0] if self.scenes else None
+        self.latency = latency      # seconds added before every response
+        self.password = password
+        self.requests = []          # (requestType, requestData) in arrival order
+        self.request_times = []     # time.perf_counter() at which each of them was applied
+        self.batches = []           # (executionType, request count) of every RequestBatch
+        self.filters = {}           # (sourceName, filterName) → enabled
+        self.volumes = {}           # inputName → inputVolumeMul
+        self.items = {}             # sceneName → [{"sourceName", "sceneItemId", "sceneItemEnabled"}]
+        self.refusing = False       # close new connections straight away, as if OBS were down
+        self.studio_mode = False
+        self.preview_scene = None
+        self.transition = "Fade"
+        self.port = None
+        self._sessions = {}         # websocket → event subscription mask
+        self._server = None
+        self._loop = None
+        self._thread = None
+
+    # --- lifecycle ---
+
+    async def start(self) -> "FakeObsServer":
+        self._loop = asyncio.get_running_loop()
+        self._server = await serve(self._session, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+    def __enter__(self) -> "FakeObsServer":
+        started = threading.Event()
+        loop = asyncio.new_event_loop()
+
+        def run():
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(self.start())
+            started.set()
+            loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="fake-obs", daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def __exit__(self, *_):
+        asyncio.run_coroutine_threadsafe(self.close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    @property
+    def url(self) -> str:
+        return f"ws://127.0.0.1:{self.port}"
+
+    def drop_connections(self) -> None:
+        """Close every client connection, as when OBS quits (thread-safe)."""
+        self._loop.call_soon_threadsafe(
+            lambda: [asyncio.ensure_future(ws.close(1001, "Going away")) for ws in list(self._sessions)])
+
+    def add_item(self, scene: str, source: str, enabled: bool = True) -> int:
+        """Put *source* in *scene* (without an event) and return its sceneItemId."""
+        items = self.items.setdefault(scene, [])
+        item_id = max((i["sceneItemId"] for i in items), default=0) + 1
+        items.append({"sourceName": source, "sceneItemId": item_id, "sceneItemEnabled": enabled})
+        return item_id
+
+    def request_count(self, request_type: str) -> int:
+        return sum(1 for t, _ in self.requests if t == request_type)
+
+    def request_log(self, request_type: str) -> list[tuple[float, dict]]:
+        """(perf_counter time, requestData) of every *request_type* request so far."""
+        return [(at, data) for at, (t, data) in zip(self.request_times, self.requests)
+                if t == request_type]
+
+    # --- events ---
+
+    def emit(self, event_type: str, data: dict, intent: int = SUB_SCENES) -> None:
+        """Send an event to every client subscribed to *intent* (thread-safe)."""
+        if self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._broadcast, event_type, data, intent)
+
+    def _broadcast(self, event_type: str, data: dict, intent: int) -> None:
+        frame = json.dumps({"op": EVENT, "d": {
+            "eventType": event_type, "eventIntent": intent, "eventData": data,
+        }})
+        for ws, subs in list(self._sessions.items()):
+            if subs & intent:
+                asyncio.ensure_future(self._send_quietly(ws, frame))
+
+    @staticmethod
+    async def _send_quietly(ws, frame: str) -> None:
+        try:
+            await ws.send(frame)
+        except ConnectionClosed:
+            pass
+
+    # --- connection handling ---
+
+    async def _session(self, ws) -> None:
+        if self.refusing:
+            await ws.close(1013, "Try again later")
+            return
+        hello = {"obsWebSocketVersion": "5.5.0", "rpcVersion": 1}
+        if self.password is not None:
+            hello["authentication"] = {"challenge": "fake-challenge", "salt": "fake-salt"}
+        await ws.send(json.dumps({"op": HELLO, "d": hello}))
+        try:
+            identify = json.loads(await ws.recv())
+            if identify.get("op") != IDENTIFY or not self._authenticated(identify["d"]):
+                await ws.close(4009, "Authentication failed.")
+                return
+            self._sessions[ws] = identify["d"].get("eventSubscriptions", 0)
+            await ws.send(json.dumps({"op": IDENTIFIED, "d": {"negotiatedRpcVersion": 1}}))
+            async for raw in ws:
+                msg = json.loads(raw)
+                if msg.get("op") == REQUEST:
+                    asyncio.ensure_future(self._respond(ws, msg["d"]))
+                elif msg.get("op") == REQUEST_BATCH:
+                    asyncio.ensure_future(self._respond_batch(ws, msg["d"]))
+        except ConnectionClosed:
+            pass
+        finally:
+            self._sessions.pop(ws, None)
+
+    def _authenticated(self, identify: dict) -> bool:
+        if self.password is None:
+            return True
+        secret = base64.b64encode(hashlib.sha256((self.password + "fake-salt").encode()).digest())
+        expected = base64.b64encode(hashlib.sha256(secret + b"fake-challenge").digest()).decode()
+        return identify.get("authentication") == expected
+
+    async def _respond(self, ws, req: dict) -> None:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        response = {"requestType": req["requestType"], "requestId": req["requestId"]}
+        response.update(self.execute(req["requestType"], req.get("requestData") or {}))
+        await self._send_quietly(ws, json.dumps({"op": REQUEST_RESPONSE, "d": response}))
+
+    async def _respond_batch(self, ws, batch: dict) -> None:
+        # One round of latency for the whole batch, as with a real OBS
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.batches.append((batch.get("executionType", 0), len(batch["requests"])))
+        results = []
+        for req in batch["requests"]:
+            result = {"requestType": req["requestType"]}
+            if "requestId" in req:
+                result["requestId"] = req["requestId"]
+            result.update(self.execute(req["requestType"], req.get("requestData") or {}))
+            results.append(result)
+            if batch.get("haltOnFailure") and not result["requestStatus"]["result"]:
+                break
+        await self._send_quietly(ws, json.dumps({"op": REQUEST_BATCH_RESPONSE, "d": {
+            "requestId": batch["requestId"], "results": results,
+        }}))
+
+    def execute(self, request_type: str, data: dict) -> dict:
+        """Apply one request and return its requestStatus/responseData fields."""
+        self.requests.append((request_type, data))
+        self.request_times.append(time.perf_counter())
+        handler = getattr(self, "_req_" + request_type, None)
+        if handler is None:
+            return {"requestStatus": {"result": False, "code": UNKNOWN_REQUEST_TYPE,
+                                      "comment": f"Unknown request type: {request_type}"}}
+        try:
+            result = handler(data)
+        except RequestFailed as e:
+            return {"requestStatus": {"result": False, "code": e.code, "comment": e.comment}}
+        out = {"requestStatus": {"result": True, "code": SUCCESS}}
+        if result is not None:
+            out["responseData"] = result
+        return out
+
+    # --- requests ---
+
+    def _require_scene(self, name: str) -> None:
+        if name not in self.scenes:
+            raise RequestFailed(RESOURCE_NOT_FOUND, f"No source was found by the name of `{name}`.")
+
+    def _req_GetVersion(self, _data):
+        return {"obsVersion": "30.0.0", "obsWebSocketVersion": "5.5.0", "rpcVersion": 1,
+                "availableRequests": sorted(n[5:] for n in dir(self) if n.startswith("_req_"))}
+
+    def _req_GetSceneList(self, _data):
+        # OBS lists scenes bottom-up, with the highest index first
+        count = len(self.scenes)
+        return {
+            "currentProgramSceneName": self.program_scene,
+            "currentPreviewSceneName": self.preview_scene,
+            "scenes": [{"sceneName": name, "sceneIndex": count - 1 - i}
+                       for i, name in enumerate(reversed(self.scenes))],
+        }
+
+    def _req_GetCurrentProgramScene(self, _data):
+        return {"currentProgramSceneName": self.program_scene, "sceneName": self.program_scene}
+
+    def _req_SetCurrentProgramScene(self, data):
+        name = data["sceneName"]
+        self._require_scene(name)
+        if name != self.program_scene:
+            self.program_scene = name
+            self.emit("CurrentProgramSceneChanged", {"sceneName": name})
+
+    def _req_SetStudioModeEnabled(self, data):
+        self.studio_mode = data["studioModeEnabled"]
+        self.preview_scene = self.program_scene if self.studio_mode else None
+
+    def _req_SetCurrentPreviewScene(self, data):
+        if not self.studio_mode:
+            raise RequestFailed(STUDIO_MODE_NOT_ACTIVE, "Studio mode is not active.")
+        name = data["sceneName"]
+        self._require_scene(name)
+        if name != self.preview_scene:
+            self.preview_scene = name
+            self.emit("CurrentPreviewSceneChanged", {"sceneName": name})
+
+    def _req_CreateScene(self, data):
+        name = data["sceneName"]
+        self.scenes.append(name)
+        self.emit("SceneCreated", {"sceneName": name, "isGroup": False})
+
+    def _req_RemoveScene(self, data):
+        name = data["sceneName"]
+        self._require_scene(name)
+        self.scenes.remove(name)
+        self.emit("SceneRemoved", {"sceneName": name, "isGroup": False})
+
+    def _req_SetSceneName(self, data):
+        old, new = data["sceneName"], data["newSceneName"]
+        self._require_scene(old)
+        self.scenes[self.scenes.index(old)] = new
+        if self.program_scene == old:
+            self.program_scene = new
+        self.emit("SceneNameChanged", {"oldSceneName": old, "sceneName": new})
+
+    def _find_item(self, data: dict) -> dict:
+        self._require_scene(data["sceneName"])
+        for item in self.items.get(data["sceneName"], ()):
+            if item["sceneItemId"] == data.get("sceneItemId") or \
+                    ("sceneItemId" not in data and item["sourceName"] == data.get("sourceName")):
+                return item
+        raise RequestFailed(RESOURCE_NOT_FOUND, "No scene items were found in the specified scene.")
+
+    def _req_GetSceneItemList(self, data):
+        self._require_scene(data["sceneName"])
+        return {"sceneItems": [dict(item, sceneItemIndex=i)
+                               for i, item in enumerate(self.items.get(data["sceneName"], ()))]}
+
+    def _req_GetSceneItemId(self, data):
+        return {"sceneItemId": self._find_item(data)["sceneItemId"]}
+
+    def _req_GetSceneItemEnabled(self, data):
+        return {"sceneItemEnabled": self._find_item(data)["sceneItemEnabled"]}
+
+    def _req_SetSceneItemEnabled(self, data):
+        item = self._find_item(data)
+        if item["sceneItemEnabled"] != data["sceneItemEnabled"]:
+            item["sceneItemEnabled"] = data["sceneItemEnabled"]
+            self.emit("SceneItemEnableStateChanged", {
+                "sceneName": data["sceneName"], "sceneItemId": item["sceneItemId"],
+                "sceneItemEnabled": item["sceneItemEnabled"],
+            }, SUB_SCENEITEMS)
+
+    def _req_CreateSceneItem(self, data):
+        self._require_scene(data["sceneName"])
+        item_id = self.add_item(data["sceneName"], data["sourceName"], data.get("sceneItemEnabled", True))
+        self.emit("SceneItemCreated", {"sceneName": data["sceneName"], "sourceName": data["sourceName"],
+                                       "sceneItemId": item_id, "sceneItemIndex": 0}, SUB_SCENEITEMS)
+        return {"sceneItemId": item_id}
+
+    def _req_RemoveSceneItem(self, data):
+        item = self._find_item(data)
+        self.items[data["sceneName"]].remove(item)
+        self.emit("SceneItemRemoved", {"sceneName": data["sceneName"], "sourceName": item["sourceName"],
+                                       "sceneItemId": item["sceneItemId"]}, SUB_SCENEITEMS)
+
+    def _req_SetSourceFilterEnabled(self, data):
+        key = (data["sourceName"], data["filterName"])
+        if self.filters.get(key) != data["filterEnabled"]:
+            self.filters[key] = data["filterEnabled"]
+            self.emit("SourceFilterEnableStateChanged", {
+                "sourceName": key[0], "filterName": key[1], "filterEnabled": data["filterEnabled"],
+            }, SUB_FILTERS)
+
+    def _req_GetCurrentSceneTransition(self, _data):
+        return {"transitionName": self.transition, "transitionKind": "fade_transition",
+                "transitionFixed": False, "transitionDuration": 300}
+
+    def _req_SetCurrentSceneTransition(self, data):
+        if data["transitionName"] != self.transition:
+            self.transition = data["transitionName"]
+            self.emit("CurrentSceneTransitionChanged", {"transitionName": self.transition},
+                      SUB_TRANSITIONS)
+
+    def _req_SetInputVolume(self, data):
+        self.volumes[data["inputName"]] = data["inputVolumeMul"]
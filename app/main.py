@@ -1,47 +1,215 @@
+from __future__ import annotations
+
+import atexit
+import base64
+import hashlib
+import heapq
+import itertools
 import json
+import math
 import os
+import queue
 import random
 import re
+import signal
 import sys
 import time
 import threading
+import types
+from dataclasses import dataclass, field
+from typing import ClassVar
+
+
+# ---------------------------------------------------------------------------
+# Lazy imports
+# ---------------------------------------------------------------------------
+# Importing this module must stay cheap and side-effect free (tests, bench.py
+# and the frozen exe's cold start all pay for it). The heavier dependencies
+# are imported on first use instead; main() does the rest of the setup.
+
+class _LazyModule:
+    """Stand-in for a module that *loader* imports on first attribute access."""
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._module = None
+
+    def __getattr__(self, name: str):
+        module = self._module
+        if module is None:
+            module = self._module = self._loader()
+        return getattr(module, name)
 
-from dotenv import load_dotenv
-load_dotenv()
 
-import mido
-mido.set_backend("mido.backends.rtmidi")
-import obsws_python as obs
+def _import_asyncio():
+    import asyncio
+    return asyncio
+
+
+def _import_mido():
+    import mido
+    mido.set_backend("mido.backends.rtmidi")
+    return mido
+
+
+def _import_obs():
+    import obsws_python
+    return obsws_python
+
+
+asyncio = _LazyModule(_import_asyncio)
+mido = _LazyModule(_import_mido)
+obs = _LazyModule(_import_obs)
 
 # ---------------------------------------------------------------------------
 # Coloured logging
 # ---------------------------------------------------------------------------
+# Log lines are queued and written in batches by a background thread, so a
+# slow console never stalls MIDI handling or loop timing. Filtering happens
+# at the call site before anything is formatted.
+
+# Minimum level to show: "debug", "info", "warning" or "error"
+LOG_LEVEL = "debug"
+
+# Per-tag minimum levels, e.g. {"loop": "warning"} hides per-tick scene switches
+LOG_TAG_LEVELS = {}
+
+# "text" for coloured console lines, "json" for one JSON object per line
+LOG_FORMAT = "text"
+
 # Disable colours when not writing to a terminal (e.g. redirected to a file).
 _COLOUR = sys.stdout.isatty()
 
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+_LEVEL_NAMES = {DEBUG: "debug", INFO: "info", WARNING: "warning", ERROR: "error"}
+_LEVELS = {name: level for level, name in _LEVEL_NAMES.items()}
+
+
+class _Colour(str):
+    """ANSI colour code that also carries the log level of its slot."""
+
+    def __new__(cls, code: str, level: int = INFO):
+        obj = super().__new__(cls, code if _COLOUR else "")
+        obj.level = level
+        return obj
+
 
 class _C:
     RESET  = "\033[0m"  if _COLOUR else ""
     BOLD   = "\033[1m"  if _COLOUR else ""
     # Semantic colour slots
-    OBS    = "\033[36m"  if _COLOUR else ""   # cyan   — OBS connection
-    MIDI   = "\033[35m"  if _COLOUR else ""   # magenta — MIDI events
-    SCENE  = "\033[32m"  if _COLOUR else ""   # green   — scene switches / loops
-    SEQ    = "\033[34m"  if _COLOUR else ""   # blue    — sequencer steps
-    WARN   = "\033[33m"  if _COLOUR else ""   # yellow  — warnings
-    ERR    = "\033[31m"  if _COLOUR else ""   # red     — errors
-    INFO   = "\033[37m"  if _COLOUR else ""   # light grey — misc info
-    DIM    = "\033[2m"   if _COLOUR else ""   # dim     — less important detail
+    OBS    = _Colour("\033[36m")            # cyan   — OBS connection
+    MIDI   = _Colour("\033[35m")            # magenta — MIDI events
+    SCENE  = _Colour("\033[32m")            # green   — scene switches / loops
+    SEQ    = _Colour("\033[34m")            # blue    — sequencer steps
+    WARN   = _Colour("\033[33m", WARNING)   # yellow  — warnings
+    ERR    = _Colour("\033[31m", ERROR)     # red     — errors
+    INFO   = _Colour("\033[37m")            # light grey — misc info
+    DIM    = _Colour("\033[2m", DEBUG)      # dim     — less important detail
+
+
+class _Logger:
+    """Queue-backed log writer with level/tag filtering.
+
+    emit() only enqueues the raw arguments; a background thread formats
+    them (including any %-style *args*) and writes whole batches at once.
+    """
+
+    _BATCH = 512
+
+    def __init__(self):
+        self.level = DEBUG
+        self.tag_levels = {}   # type: dict[str, int]
+        self.json = False
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def configure(self, level: str = "debug", tag_levels: dict | None = None,
+                  fmt: str = "text") -> None:
+        self.level = _LEVELS[level]
+        self.tag_levels = {tag: _LEVELS[lvl] for tag, lvl in (tag_levels or {}).items()}
+        self.json = fmt == "json"
+
+    def enabled(self, level: int, tag: str) -> bool:
+        return level >= self.tag_levels.get(tag, self.level)
+
+    def emit(self, level: int, colour: str, tag: str, msg: str, args: tuple) -> None:
+        if self._thread is None:
+            self._start()
+        self._queue.put((time.time(), level, colour, tag, msg, args))
+
+    def flush(self, timeout: float = 2.0) -> None:
+        """Block until everything queued so far has been written."""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def _start(self) -> None:
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < self._BATCH:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            lines, flushed = [], []
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    flushed.append(item)
+                else:
+                    lines.append(self._format(*item))
+            if lines:
+                try:
+                    sys.stdout.write("\n".join(lines) + "\n")
+                    sys.stdout.flush()
+                except (OSError, ValueError):
+                    pass  # console closed; nothing useful left to do
+            for done in flushed:
+                done.set()
+
+    def _format(self, ts: float, level: int, colour: str, tag: str, msg: str, args: tuple) -> str:
+        if args:
+            try:
+                msg = msg % args
+            except (TypeError, ValueError):
+                msg = f"{msg} {args}"
+        if self.json:
+            return json.dumps({"ts": round(ts, 6), "level": _LEVEL_NAMES[level], "tag": tag, "msg": msg},
+                              ensure_ascii=False)
+        return f"{colour}{_C.BOLD}[{tag}]{_C.RESET}{colour}  {msg}{_C.RESET}"
+
+
+_logger = _Logger()
+_logger.configure(LOG_LEVEL, LOG_TAG_LEVELS, LOG_FORMAT)
+
 
+def _log(colour: str, tag: str, msg: str, *args) -> None:
+    """Queue a log line. Pass values as %-style *args* on hot paths so nothing
+    is formatted when the level or tag is filtered out."""
+    level = getattr(colour, "level", INFO)
+    if level >= _logger.tag_levels.get(tag, _logger.level):
+        _logger.emit(level, colour, tag, msg, args)
 
-def _log(colour: str, tag: str, msg: str) -> None:
-    print(f"{colour}{_C.BOLD}[{tag}]{_C.RESET}{colour}  {msg}{_C.RESET}")
+
+def _log_enabled(colour: str, tag: str) -> bool:
+    """True if _log(colour, tag, …) would be shown; guards costly log arguments."""
+    return _logger.enabled(getattr(colour, "level", INFO), tag)
 
 # ---------------------------------------------------------------------------
 # Configuration
 # ---------------------------------------------------------------------------
 
-# OBS WebSocket connection (override via .env file)
+# OBS WebSocket connection (override via .env file, read by load_env())
 OBS_HOST = os.getenv("OBS_HOST", "localhost")
 OBS_PORT = int(os.getenv("OBS_PORT", "4455"))
 OBS_PASSWORD = os.getenv("OBS_PASSWORD", "HrCDuVNv7Sfxdxzi")
@@ -49,12 +217,99 @@ OBS_PASSWORD = os.getenv("OBS_PASSWORD", "HrCDuVNv7Sfxdxzi")
 # Set to a specific port name, or None to pick the first available input
 MIDI_PORT_NAME = None
 
+# Open several MIDI inputs at once (e.g. pad controller, keyboard, clock source):
+# a list of port names or name fragments. None opens just MIDI_PORT_NAME.
+# A config's "ports" section can give each of them its own note map.
+MIDI_PORTS = None
+
 # Set to True to skip MIDI and immediately start the first loop action
 TEST_MODE = False
 
 # Set to True to log all incoming MIDI messages and skip OBS connection
 MIDI_DEBUG = False
 
+# How MIDI input is read:
+#   "callback" – the MIDI driver thread delivers each message; the main thread sleeps
+#   "blocking" – the main thread blocks in receive() until a message arrives
+#                (Ctrl+C is only noticed on the next message on Windows)
+#   "poll"     – legacy 1 ms iter_pending() loop
+MIDI_INPUT_MODE = "callback"
+
+# Set to True to hand incoming messages to a dispatcher thread through a queue,
+# so the MIDI driver thread never waits on OBS
+MIDI_DISPATCH_QUEUE = False
+
+# Playback engine:
+#   "threaded" – lane scheduler thread (see Lanes) + ObsConnection
+#   "asyncio"  – one asyncio task per playback lane + AsyncObsClient
+#                (needs the websockets package)
+ENGINE = "threaded"
+
+# What a loop does after a tick fires late (e.g. a slow OBS request):
+#   "skip"     – drop the missed ticks and stay phase-locked to the beat grid
+#   "catch_up" – play every missed tick back-to-back until on time again
+LATE_TICK_POLICY = "skip"
+
+# Follow an external MIDI clock (24 pulses per beat, with start/stop/song
+# position) from a DAW or drum machine: bpm/steps loops switch every *steps*
+# beats of the incoming clock instead of at the config's fixed bpm, and hold
+# while the transport is stopped. Loops with a fixed "tick" keep wall-clock time.
+MIDI_CLOCK_SYNC = False
+
+# Stage each loop's next scene in OBS's preview this many milliseconds before
+# it is due, so its media sources are already loaded when it goes to program
+# on the beat. Needs studio mode turned on in OBS; 0 = switch straight to
+# program.
+PREVIEW_LOOKAHEAD_MS = 0
+
+# Hold each triggered action until the next boundary of the playing loop's
+# beat grid (or of the MIDI clock under MIDI_CLOCK_SYNC), so it lands in
+# time: "none", "beat", "bar" (BEATS_PER_BAR beats) or a number of beats.
+# The old loop plays on until then. An action's own "quantize" overrides it.
+LAUNCH_QUANTIZE = "none"
+
+# Record every MIDI message, OBS request/response and config reload of a run
+# to this JSONL file, for replaying later with ``python bench.py replay``
+# (None = off). See SessionRecorder.
+RECORD_SESSION = None
+
+# Record note → program-scene latency histograms (see LatencyTracker)
+LATENCY_STATS = True
+
+# Also time until OBS confirms the switch with a CurrentProgramSceneChanged event
+LATENCY_CONFIRM = True
+
+# How OBS runs the requests one trigger sends together as a RequestBatch:
+#   "serial_frame"    – in order, on the graphics thread: all land in the same frame
+#   "serial_realtime" – in order, as fast as possible
+#   "parallel"        – all at once, in no particular order
+OBS_BATCH_EXECUTION = "serial_frame"
+
+# Send at most one program scene switch per this many milliseconds (about a
+# frame at 60 fps). A switch asked for sooner waits for the window to end, and
+# is replaced if another comes first, so a storm of pad hits can't build a
+# backlog of stale switches. The first switch after a quiet spell goes out at
+# once. 0 = send every switch as it comes.
+SWITCH_COALESCE_MS = 16
+
+# Seconds of silence from OBS before the threaded engine's connection pings
+# it; no answer within another interval counts as a dead connection, which
+# is re-opened in the background (see ObsConnection)
+OBS_HEARTBEAT = 2.0
+
+# Keep a copy of the OBS state playback writes to (program and preview scene,
+# scene item visibility, filter on/off, transition), fed by OBS events, and
+# don't send a write that would leave it unchanged — a random loop picking
+# the live scene again, a held "once" loop, a step re-selecting the current
+# scene. The skipped requests are counted and logged on exit (see ObsMirror).
+OBS_MIRROR = True
+
+# How many times a second the latest MIDI CC values (the config's "cc"
+# section) are sent to OBS, all changed targets in one RequestBatch. A fader
+# sends far more messages than this; the ones in between are dropped (see
+# CcEngine).
+CC_FLUSH_HZ = 60
+
 # ---------------------------------------------------------------------------
 # MIDI Note → Action mapping
 # ---------------------------------------------------------------------------
@@ -91,6 +346,14 @@ MIDI_DEBUG = False
 # "shuffle" – randomizes scene order once, then cycles that order
 #   {"action": "loop", "prefix": "LOOP_A_", "style": "shuffle", "bpm": 120, "steps": 4}
 #
+# --- Source action (show/hide a source inside a scene) ---
+# "mode" is "show", "hide", "toggle" (default) or "strobe". A strobe flips the
+# source on and off every tick, sub-beat steps included, until its lane plays
+# something else, or for "flashes" flashes, ending hidden.
+#   {"action": "source", "scene": "STAGE", "source": "Laser", "mode": "toggle"}
+#   {"action": "source", "scene": "STAGE", "source": "Laser", "mode": "strobe",
+#    "bpm": 128, "steps": 0.25, "lane": "laser"}
+#
 # --- Sequence action (run a series of steps in order) ---
 # Sequences loop continuously by default. Each loop step uses its
 # "repeats" count (default 1) before advancing to the next step.
@@ -159,6 +422,451 @@ DEFAULT_MIDI_MAP = {
     51: {"action": "static", "scene": "STATIC_2"},                                                         # D#3
 }
 
+# ---------------------------------------------------------------------------
+# Action plans
+# ---------------------------------------------------------------------------
+# load_config() compiles every MIDI_MAP entry into an immutable plan, so a
+# note costs one lookup plus plan.program(): ticks, styles, batched requests
+# and log text are worked out, and the entry validated, when the config loads.
+
+class ConfigError(ValueError):
+    """A MIDI_MAP entry that cannot be compiled into a plan."""
+
+
+def calc_tick(bpm: float, steps: float) -> float:
+    """Convert BPM + steps (beats) into seconds per scene switch."""
+    return (60.0 / bpm) * steps
+
+
+# Bar length for "quantize": "bar"
+BEATS_PER_BAR = 4
+
+QUANTIZE_NAMES = {"none": 0, "beat": 1, "bar": BEATS_PER_BAR}
+
+
+def quantize_beats(value, where: str = "LAUNCH_QUANTIZE") -> float:
+    """Beats between launch boundaries for a "quantize" setting (0 = launch at once)."""
+    if isinstance(value, str) and value in QUANTIZE_NAMES:
+        return QUANTIZE_NAMES[value]
+    if not isinstance(value, bool) and isinstance(value, (int, float)) and value >= 0:
+        return value
+    raise ConfigError(f"{where}: 'quantize' must be \"none\", \"beat\", \"bar\" or a number of beats, "
+                      f"got {value!r}")
+
+
+@dataclass(frozen=True, slots=True)
+class StaticPlan:
+    kind: ClassVar[str] = "static"
+    entry: dict = field(repr=False, compare=False)
+    scene: str
+    requests: tuple
+    summary: str
+    lane: str = "main"
+    quantize: float | None = None   # launch boundary in beats; None follows LAUNCH_QUANTIZE
+
+    def program(self, note: int | None):
+        _log(_C.MIDI, "midi", "note %s – %s", note, self.summary)
+        return static_program(self.scene, self.requests)
+
+
+@dataclass(frozen=True, slots=True)
+class LoopPlan:
+    kind: ClassVar[str] = "loop"
+    entry: dict = field(repr=False, compare=False)
+    prefix: str
+    style: str
+    tick: float
+    beats: float | None   # beats per switch under MIDI_CLOCK_SYNC; None for a fixed "tick"
+    repeats: int      # passes when used as a sequence step
+    requests: tuple
+    summary: str
+    lane: str = "main"
+    seed: int | None = None   # own random generator, so every run picks the same scenes
+    options: dict = field(default=None, repr=False, compare=False)   # the style's own keys
+    quantize: float | None = None
+
+    def program(self, note: int | None):
+        _log(_C.MIDI, "midi", "note %s – %s", note, self.summary)
+        return prefix_loop_program(self.prefix, self.style, self.tick, self.requests, self.beats,
+                                   self.seed, self.options)
+
+
+@dataclass(frozen=True, slots=True)
+class SequencePlan:
+    kind: ClassVar[str] = "sequence"
+    entry: dict = field(repr=False, compare=False)
+    steps: tuple
+    summary: str
+    lane: str = "main"
+    quantize: float | None = None
+
+    def program(self, note: int | None):
+        _log(_C.MIDI, "midi", "note %s – %s", note, self.summary)
+        return sequence_program(self.steps, trigger_note=note)
+
+
+@dataclass(frozen=True, slots=True)
+class SourcePlan:
+    kind: ClassVar[str] = "source"
+    entry: dict = field(repr=False, compare=False)
+    scene: str
+    source: str
+    mode: str          # one of SOURCE_MODES
+    tick: float | None   # seconds per on/off change of a strobe
+    beats: float | None  # beats per change under MIDI_CLOCK_SYNC; None for a fixed "tick"
+    flashes: int | None  # strobe flashes before it ends hidden; None = until replaced
+    summary: str
+    lane: str = "main"
+    quantize: float | None = None
+
+    def program(self, note: int | None):
+        _log(_C.MIDI, "midi", "note %s – %s", note, self.summary)
+        return source_program(self.scene, self.source, self.mode, self.tick, self.beats, self.flashes)
+
+
+@dataclass(frozen=True, slots=True)
+class StopPlan:
+    kind: ClassVar[str] = "stop"
+    entry: dict = field(repr=False, compare=False)
+
+    def program(self, note: int | None):
+        return None   # only meaningful as a sequence step
+
+
+@dataclass(frozen=True, slots=True)
+class PausePlan:
+    kind: ClassVar[str] = "pause"
+    entry: dict = field(repr=False, compare=False)
+    resume_note: int | None   # None: the note that started the sequence
+
+    def program(self, note: int | None):
+        return None   # only meaningful as a sequence step
+
+
+_PLAN_TYPES = (StaticPlan, LoopPlan, SequencePlan, SourcePlan, StopPlan, PausePlan)
+
+
+# What a "source" action does to the source's visibility
+SOURCE_MODES = ("show", "hide", "toggle", "strobe")
+
+
+def _positive(entry: dict, key: str, where: str) -> float:
+    value = entry.get(key)
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+        raise ConfigError(f"{where}: '{key}' must be a positive number, got {value!r}")
+    return value
+
+
+def action_requests(entry: dict) -> tuple:
+    """Return the extra (requestType, requestData) pairs listed in an action's "requests"."""
+    return tuple((r["requestType"], r.get("requestData") or {}) for r in entry.get("requests", ()))
+
+
+def _compile_requests(entry: dict, where: str) -> tuple:
+    requests = entry.get("requests", [])
+    if not isinstance(requests, list) or not all(
+            isinstance(r, dict) and isinstance(r.get("requestType"), str) for r in requests):
+        raise ConfigError(f"{where}: 'requests' must be a list of {{\"requestType\": …, \"requestData\": …}} objects")
+    return action_requests(entry)
+
+
+def _compile_quantize(entry: dict, where: str) -> float | None:
+    return quantize_beats(entry["quantize"], where) if "quantize" in entry else None
+
+
+def _compile_lane(entry: dict, where: str) -> str:
+    lane = entry.get("lane", "main")
+    if not isinstance(lane, str) or not lane:
+        raise ConfigError(f"{where}: 'lane' must be a non-empty name, got {lane!r}")
+    return lane
+
+
+def compile_action(entry: dict, where: str = "action", in_sequence: bool = False):
+    """Validate one MIDI_MAP entry (or sequence step) and return its plan.
+
+    Raises ConfigError naming *where* the problem is.
+    """
+    if not isinstance(entry, dict) or "action" not in entry:
+        raise ConfigError(f"{where}: expected an object with an \"action\", got {entry!r}")
+    kind = entry["action"]
+
+    if kind == "static":
+        scene = entry.get("scene")
+        if not isinstance(scene, str) or not scene:
+            raise ConfigError(f"{where}: static action needs a \"scene\" name")
+        return StaticPlan(entry, scene, _compile_requests(entry, where), f"static scene → {scene}",
+                          _compile_lane(entry, where), _compile_quantize(entry, where))
+
+    if kind == "loop":
+        prefix = entry.get("prefix")
+        if not isinstance(prefix, str):
+            raise ConfigError(f"{where}: loop action needs a \"prefix\"")
+        style = entry.get("style", "cycle")
+        if style not in LOOP_STYLES:
+            raise ConfigError(f"{where}: unknown loop style '{style}' (expected one of {tuple(LOOP_STYLES)})")
+        options = LOOP_STYLES[style].compile_options(entry, where)
+        seed = entry.get("seed")
+        if seed is not None and (isinstance(seed, bool) or not isinstance(seed, int)):
+            raise ConfigError(f"{where}: 'seed' must be a whole number, got {seed!r}")
+        if "tick" in entry:
+            tick = _positive(entry, "tick", where)
+            beats = None
+            timing = f"tick={tick:.3f}s"
+        else:
+            beats = _positive(entry, "steps", where)
+            tick = calc_tick(_positive(entry, "bpm", where), beats)
+            timing = f"bpm={entry['bpm']}, steps={entry['steps']}, tick={tick:.3f}s"
+        repeats = entry.get("repeats", 1)
+        if isinstance(repeats, bool) or not isinstance(repeats, int) or repeats < 1:
+            raise ConfigError(f"{where}: 'repeats' must be a whole number >= 1, got {repeats!r}")
+        if in_sequence:
+            summary = f"{style} loop (prefix={prefix}, tick={tick:.3f}s, repeats={repeats})"
+        else:
+            summary = f"{style} loop (prefix={prefix}, {timing})"
+        return LoopPlan(entry, prefix, style, tick, beats, repeats, _compile_requests(entry, where), summary,
+                        _compile_lane(entry, where), seed, options, _compile_quantize(entry, where))
+
+    if kind == "sequence":
+        if in_sequence:
+            raise ConfigError(f"{where}: sequences cannot be nested")
+        steps = entry.get("steps")
+        if not isinstance(steps, list) or not steps:
+            raise ConfigError(f"{where}: sequence action needs a non-empty \"steps\" list")
+        return SequencePlan(entry, compile_steps(steps, where), f"sequence ({len(steps)} steps)",
+                            _compile_lane(entry, where), _compile_quantize(entry, where))
+
+    if kind == "source":
+        if in_sequence:
+            raise ConfigError(f"{where}: source actions can't be sequence steps")
+        scene, source = entry.get("scene"), entry.get("source")
+        if not isinstance(scene, str) or not scene or not isinstance(source, str) or not source:
+            raise ConfigError(f"{where}: source action needs a \"scene\" and a \"source\" name")
+        mode = entry.get("mode", "toggle")
+        if mode not in SOURCE_MODES:
+            raise ConfigError(f"{where}: unknown source mode '{mode}' (expected one of {SOURCE_MODES})")
+        tick = beats = flashes = None
+        timing = ""
+        if mode == "strobe":
+            if "tick" in entry:
+                tick = _positive(entry, "tick", where)
+                timing = f", tick={tick:.3f}s"
+            else:
+                beats = _positive(entry, "steps", where)
+                tick = calc_tick(_positive(entry, "bpm", where), beats)
+                timing = f", bpm={entry['bpm']}, steps={entry['steps']}, tick={tick:.3f}s"
+            flashes = entry.get("flashes")
+            if flashes is not None and (isinstance(flashes, bool) or not isinstance(flashes, int) or flashes < 1):
+                raise ConfigError(f"{where}: 'flashes' must be a whole number >= 1, got {flashes!r}")
+        return SourcePlan(entry, scene, source, mode, tick, beats, flashes,
+                          f"{mode} source {source} in {scene}{timing}",
+                          _compile_lane(entry, where), _compile_quantize(entry, where))
+
+    if kind == "stop":
+        return StopPlan(entry)
+
+    if kind == "pause":
+        resume_note = entry.get("resume_note")
+        if resume_note is not None and (isinstance(resume_note, bool) or not isinstance(resume_note, int)):
+            raise ConfigError(f"{where}: 'resume_note' must be a MIDI note number, got {resume_note!r}")
+        return PausePlan(entry, resume_note)
+
+    raise ConfigError(f"{where}: unknown action '{kind}'")
+
+
+def compile_steps(steps, where: str = "sequence") -> tuple:
+    """Compile sequence steps; steps that are already plans pass through."""
+    return tuple(
+        step if isinstance(step, _PLAN_TYPES) else compile_action(step, f"{where} step {i + 1}", in_sequence=True)
+        for i, step in enumerate(steps)
+    )
+
+
+# Response curves for CC mappings: controller position 0..1 → 0..1 of the range
+CC_CURVES = {
+    "linear": lambda x: x,
+    "exp": lambda x: x * x,             # fine control at the low end, e.g. volume
+    "log": lambda x: x ** 0.5,          # fine control at the high end
+    "s": lambda x: x * x * (3 - 2 * x),
+}
+
+# Placeholder in a CC mapping's requestData for the value being set
+CC_VALUE = "$value"
+
+
+@dataclass(frozen=True, slots=True)
+class CcPlan:
+    """A MIDI controller mapped onto one continuous OBS parameter (see CcEngine)."""
+    entry: dict = field(repr=False, compare=False)
+    request_type: str
+    request_data: dict = field(repr=False, compare=False)
+    low: float
+    high: float
+    curve: str
+    smoothing: float   # seconds to cover ~63% of a jump; 0 = jump straight there
+    integer: bool
+    target: str        # the OBS parameter; mappings naming the same one share its value
+
+    def value(self, raw: int) -> float:
+        """Map a 0–127 controller value through the curve onto the range."""
+        return self.low + (self.high - self.low) * CC_CURVES[self.curve](raw / 127)
+
+    def request(self, value: float) -> tuple:
+        """Return the (requestType, requestData) pair setting the parameter to *value*."""
+        return self.request_type, _fill_value(self.request_data, round(value) if self.integer else value)
+
+
+def _fill_value(data, value):
+    if data == CC_VALUE:
+        return value
+    if isinstance(data, dict):
+        return {k: _fill_value(v, value) for k, v in data.items()}
+    if isinstance(data, list):
+        return [_fill_value(v, value) for v in data]
+    return data
+
+
+def _has_value(data) -> bool:
+    if data == CC_VALUE:
+        return True
+    if isinstance(data, dict):
+        return any(_has_value(v) for v in data.values())
+    if isinstance(data, list):
+        return any(_has_value(v) for v in data)
+    return False
+
+
+def _number(value) -> bool:
+    return not isinstance(value, bool) and isinstance(value, (int, float))
+
+
+def compile_cc(entry: dict, where: str = "cc") -> CcPlan:
+    """Validate one "cc" mapping and return its plan.
+
+    Raises ConfigError naming *where* the problem is.
+    """
+    if not isinstance(entry, dict) or not isinstance(entry.get("requestType"), str):
+        raise ConfigError(f"{where}: expected an object with a \"requestType\", got {entry!r}")
+    data = entry.get("requestData")
+    if not isinstance(data, dict) or not _has_value(data):
+        raise ConfigError(f"{where}: 'requestData' must contain a \"{CC_VALUE}\" placeholder")
+    value_range = entry.get("range", [0, 1])
+    if not isinstance(value_range, list) or len(value_range) != 2 or not all(map(_number, value_range)):
+        raise ConfigError(f"{where}: 'range' must be [low, high], got {value_range!r}")
+    curve = entry.get("curve", "linear")
+    if curve not in CC_CURVES:
+        raise ConfigError(f"{where}: unknown curve '{curve}' (expected one of {tuple(CC_CURVES)})")
+    smoothing = entry.get("smoothing", 0)
+    if not _number(smoothing) or smoothing < 0:
+        raise ConfigError(f"{where}: 'smoothing' must be a number of seconds >= 0, got {smoothing!r}")
+    integer = entry.get("integer", False)
+    if not isinstance(integer, bool):
+        raise ConfigError(f"{where}: 'integer' must be true or false, got {integer!r}")
+    target = f"{entry['requestType']} {json.dumps(data, sort_keys=True, separators=(',', ':'))}"
+    return CcPlan(entry, entry["requestType"], data, value_range[0], value_range[1], curve, smoothing,
+                  integer, target)
+
+
+class ActionMap(dict):
+    """MIDI_MAP: note → action dict, plus a compiled plan for every entry.
+
+    Behaves as a plain dict of the config's action dicts. Plans are compiled
+    up front (so a bad entry fails the load) and re-compiled on demand if an
+    entry is replaced in place. Entries equal to those of *previous* (the map
+    being reloaded) keep its entry objects and plans.
+
+    *ports* maps a MIDI port name (or fragment of one) to that port's own note
+    map; messages from other ports use this map (see for_port()). *cc* maps
+    controller numbers to CC mappings, compiled into .cc as CcPlans; they
+    apply to every port.
+    """
+
+    def __init__(self, entries=(), previous: "ActionMap | None" = None,
+                 ports: dict | None = None, port: str | None = None, cc: dict | None = None):
+        super().__init__(entries)
+        self.port = port   # name pattern this map serves, None for the default map
+        self._plans = {}
+        for note, entry in self.items():
+            old = previous.get(note) if previous is not None else None
+            if old is not None and old == entry:
+                self[note] = old
+                self._plans[note] = previous.plan(note)
+            else:
+                self._plans[note] = compile_action(entry, self._where(note))
+        old_ports = previous.ports if previous is not None else {}
+        self.ports = {
+            pattern: ActionMap(notes, old_ports.get(pattern), port=pattern)
+            for pattern, notes in (ports or {}).items()
+        }
+        self._by_port = {}  # actual port name → map, filled in by for_port()
+        old_cc = previous.cc if previous is not None else {}
+        self.cc = {}
+        for control, entry in (cc or {}).items():
+            old = old_cc.get(control)
+            self.cc[control] = old if old is not None and old.entry == entry else compile_cc(entry, f"cc {control}")
+
+    def _where(self, note: int) -> str:
+        return f"note {note}" if self.port is None else f"port '{self.port}' note {note}"
+
+    def key(self, note: int):
+        """Player key for *note* from this map: the note, or (port pattern, note)."""
+        return note if self.port is None else (self.port, note)
+
+    def for_port(self, port_name: str | None) -> "ActionMap":
+        """Return the note map for messages from *port_name*.
+
+        A "ports" pattern matches a port whose name equals or contains it
+        (case-insensitive); unmatched ports use this default map. The answer
+        is cached per port name, so routing stays a dict lookup.
+        """
+        if port_name is None or not self.ports:
+            return self
+        midi_map = self._by_port.get(port_name)
+        if midi_map is None:
+            name = port_name.lower()
+            midi_map = self.ports.get(port_name) or next(
+                (m for pattern, m in self.ports.items() if pattern.lower() in name), self)
+            self._by_port[port_name] = midi_map
+        return midi_map
+
+    def diff(self, previous: dict) -> tuple[set, set, set]:
+        """Return the (added, removed, changed) keys relative to *previous*.
+
+        Keys are notes for the default map and (port pattern, note) for port maps.
+        """
+        added = self.keys() - previous.keys()
+        removed = previous.keys() - self.keys()
+        changed = {note for note in self.keys() & previous.keys() if self[note] != previous[note]}
+        old_ports = getattr(previous, "ports", {})
+        for pattern in self.ports.keys() | old_ports.keys():
+            new = self.ports.get(pattern, {})
+            old = old_ports.get(pattern, {})
+            added |= {(pattern, note) for note in new.keys() - old.keys()}
+            removed |= {(pattern, note) for note in old.keys() - new.keys()}
+            changed |= {(pattern, note) for note in new.keys() & old.keys() if new[note] != old[note]}
+        return added, removed, changed
+
+    def plan(self, note: int):
+        """Return the plan for *note*, or None if it is unmapped."""
+        entry = self.get(note)
+        if entry is None:
+            return None
+        plan = self._plans.get(note)
+        if plan is None or plan.entry is not entry:
+            plan = self._plans[note] = compile_action(entry, self._where(note))
+        return plan
+
+    def plan_for(self, key):
+        """Return the plan for a key() from this map or one of its port maps."""
+        if isinstance(key, tuple):
+            midi_map = self.ports.get(key[0])
+            return midi_map.plan(key[1]) if midi_map is not None else None
+        return self.plan(key)
+
+
+# ---------------------------------------------------------------------------
+# Config loading
+# ---------------------------------------------------------------------------
+
 _base_dir = (
     os.path.dirname(sys.executable)
     if getattr(sys, "frozen", False)
@@ -168,28 +876,62 @@ CONFIG_PATH = os.path.join(_base_dir, "config.json")
 EXAMPLE_CONFIG = "config.example.json"
 
 
-def load_config(path: str = CONFIG_PATH) -> dict[int, dict]:
+def load_config(path: str = CONFIG_PATH, previous: ActionMap | None = None) -> ActionMap:
     """Load MIDI_MAP from a JSON config file.
 
     The JSON file should have string keys (MIDI note numbers) mapping to
-    action dicts. Keys are converted to integers on load.
+    action dicts. Keys are converted to integers on load and every action is
+    compiled into a plan (see ActionMap).
 
     Returns DEFAULT_MIDI_MAP if the file does not exist.
-    Raises on invalid JSON or malformed content.
+    Raises on invalid JSON or malformed content (ConfigError).
     """
     if not os.path.exists(path):
         _log(_C.INFO, "config", f"No config file found at {path}, using defaults")
-        return dict(DEFAULT_MIDI_MAP)
+        return ActionMap(DEFAULT_MIDI_MAP)
 
     with open(path, "r") as f:
         raw = json.load(f)
 
-    midi_map = {int(k): v for k, v in raw.items()}
+    midi_map = build_action_map(raw, previous)
 
-    _log(_C.INFO, "config", f"Loaded {len(midi_map)} mappings from {path}")
+    _log(_C.INFO, "config", f"Loaded {len(midi_map)} mappings"
+         + (f" and {len(midi_map.cc)} CC mappings" if midi_map.cc else "") + f" from {path}")
     return midi_map
 
 
+def build_action_map(raw: dict, previous: ActionMap | None = None) -> ActionMap:
+    """Compile parsed config JSON (note strings → actions) into an ActionMap.
+
+    An optional "ports" object maps MIDI port names (or fragments) to
+    per-port note maps in the same format, and an optional "cc" object maps
+    controller numbers to CC mappings (see CcPlan).
+    """
+    if not isinstance(raw, dict):
+        raise ConfigError("config must be a JSON object of note → action")
+    raw = dict(raw)
+    ports = raw.pop("ports", {})
+    if not isinstance(ports, dict) or not all(isinstance(m, dict) for m in ports.values()):
+        raise ConfigError("ports must be a JSON object of port name → note map")
+    cc = raw.pop("cc", {})
+    if not isinstance(cc, dict):
+        raise ConfigError("cc must be a JSON object of controller number → mapping")
+    try:
+        cc = {int(k): v for k, v in cc.items()}
+    except ValueError as e:
+        raise ConfigError(f"cc keys must be MIDI controller numbers: {e}") from e
+    try:
+        return ActionMap(
+            ((int(k), v) for k, v in raw.items()), previous,
+            ports={name: [(int(k), v) for k, v in notes.items()] for name, notes in ports.items()},
+            cc=cc,
+        )
+    except ValueError as e:
+        if isinstance(e, ConfigError):
+            raise
+        raise ConfigError(f"note keys must be MIDI note numbers: {e}") from e
+
+
 def find_config_files(directory: str = _base_dir) -> list[str]:
     """Return sorted absolute paths of all *.json files in *directory*,
     excluding config.example.json."""
@@ -211,6 +953,7 @@ def pick_config_file(config_files: list[str]) -> str | None:
     if len(config_files) == 1:
         return config_files[0]
     import questionary
+    _logger.flush()  # keep queued log lines above the prompt
     chosen = questionary.select(
         "Multiple config files found — choose one:",
         choices=[os.path.basename(p) for p in config_files],
@@ -220,316 +963,3778 @@ def pick_config_file(config_files: list[str]) -> str | None:
     return next(p for p in config_files if os.path.basename(p) == chosen)
 
 
-_config_files = find_config_files()
-_chosen = pick_config_file(_config_files)
-_active_config = _chosen if _chosen is not None else CONFIG_PATH
-MIDI_MAP = load_config(_active_config)
+def load_env() -> None:
+    """Apply OBS connection settings from the environment / a .env file."""
+    global OBS_HOST, OBS_PORT, OBS_PASSWORD
+    from dotenv import load_dotenv
+    load_dotenv()
+    OBS_HOST = os.getenv("OBS_HOST", OBS_HOST)
+    OBS_PORT = int(os.getenv("OBS_PORT", str(OBS_PORT)))
+    OBS_PASSWORD = os.getenv("OBS_PASSWORD", OBS_PASSWORD)
+
+
+def select_config() -> None:
+    """Choose the config file (prompting if there are several) and load MIDI_MAP from it."""
+    global _active_config, MIDI_MAP
+    chosen = pick_config_file(find_config_files())
+    _active_config = chosen if chosen is not None else CONFIG_PATH
+    MIDI_MAP = load_config(_active_config)
+
+
+# Filled in by select_config() when main() starts
+_active_config = CONFIG_PATH
+MIDI_MAP = ActionMap()
 
 # ---------------------------------------------------------------------------
 # Globals
 # ---------------------------------------------------------------------------
 
-stop_event = threading.Event()    # set() to signal the loop to stop
-resume_event = threading.Event()  # set() to resume from a pause
-pause_resume_note = None  # type: int | None  — MIDI note that resumes the current pause
-loop_thread = None  # type: threading.Thread | None
 _shutdown_event = threading.Event()  # set() only on full program exit (not between loops)
 
 
-def _watch_config(path: str) -> None:
-    """Background thread: reload MIDI_MAP whenever the config file changes on disk."""
-    global MIDI_MAP
-    try:
-        mtime = os.path.getmtime(path)
-    except OSError:
-        mtime = 0.0
-    while not _shutdown_event.wait(1.0):
-        try:
-            new_mtime = os.path.getmtime(path)
-        except OSError:
-            continue
-        if new_mtime != mtime:
-            try:
-                new_map = load_config(path)
-                MIDI_MAP = new_map   # atomic reference swap under the GIL
-                mtime = new_mtime    # only advance after a clean load
-                _log(_C.INFO, "config", f"Config reloaded ({len(MIDI_MAP)} mappings) from {os.path.basename(path)}")
-            except Exception as exc:
-                _log(_C.WARN, "config", f"Config reload failed (will retry): {exc}")
+class SwitchCoalescer:
+    """Thins program scene switches out to at most one per window (see SWITCH_COALESCE_MS).
 
+    Engines offer() each switch: it goes out at once if the last one left a
+    whole window ago, else it is held until the window ends, replacing any
+    switch already held. Only one scene can be live, so a replaced switch
+    was stale before OBS could have shown it; ``coalesced`` counts them.
+    """
 
-def calc_tick(bpm: float, steps: float) -> float:
-    """Convert BPM + steps (beats) into seconds per scene switch."""
-    return (60.0 / bpm) * steps
+    def __init__(self, window_ms: float | None = None, clock=None):
+        self.window_ms = window_ms   # None: follow SWITCH_COALESCE_MS
+        self._now = clock or time.perf_counter_ns
+        self._last = None            # when the last switch went out
+        self.held = None             # switch waiting for its window, as passed to offer()
+        self.sent = 0
+        self.coalesced = 0
 
+    @property
+    def window_ns(self) -> int:
+        return round((SWITCH_COALESCE_MS if self.window_ms is None else self.window_ms) * 1_000_000)
 
-def natural_sort_key(s: str):
-    """Sort key that handles embedded numbers naturally (e.g. 2 before 10)."""
-    return [int(c) if c.isdigit() else c.lower() for c in re.split(r"(\d+)", s)]
+    def offer(self, switch) -> int | None:
+        """Take a *switch*. Returns None if it should be sent now; otherwise it is
+        held, and the result is the deadline (ns) at which to call take(), or 0
+        if a take() is already due."""
+        now = self._now()
+        window = self.window_ns
+        if self.held is None and (self._last is None or now - self._last >= window):
+            self._last = now
+            self.sent += 1
+            return None
+        if self.held is not None:
+            self.coalesced += 1
+            self.held = switch
+            return 0
+        self.held = switch
+        return self._last + window
 
+    def take(self):
+        """The held switch, which is now due (None if there is none)."""
+        switch, self.held = self.held, None
+        if switch is not None:
+            self._last = self._now()
+            self.sent += 1
+        return switch
 
-def get_scenes_by_prefix(client: obs.ReqClient, prefix: str) -> list[str]:
-    """Return scene names that start with *prefix*, natural-sorted."""
-    resp = client.get_scene_list()
-    return sorted(
-        (s["sceneName"] for s in resp.scenes if s["sceneName"].startswith(prefix)),
-        key=natural_sort_key,
-    )
+    def drop(self) -> None:
+        """Forget the held switch without sending it (its engine is stopping)."""
+        if self.held is not None:
+            self.held = None
+            self.coalesced += 1
 
+    def bypassed(self) -> None:
+        """A switch went out some other way (e.g. in a batch): it supersedes the held one."""
+        if self.held is not None:
+            self.held = None
+            self.coalesced += 1
+        self._last = self._now()
 
-def build_sequence(scenes: list[str], style: str) -> list[str]:
-    """Build the playback sequence from a list of scenes and a loop style."""
-    if style == "bounce" and len(scenes) > 2:
-        return scenes + scenes[-2:0:-1]
-    if style == "reverse":
-        return list(reversed(scenes))
-    if style == "strobe" and len(scenes) >= 2:
-        return [scenes[0], scenes[-1]]
-    if style == "shuffle":
-        shuffled = list(scenes)
-        random.shuffle(shuffled)
-        return shuffled
-    # "cycle", "random", "random_no_repeat", "once" use scenes as-is
-    # (their special behaviour is handled in scene_loop)
-    return list(scenes)
 
+def _switches_program(kind: str, arg) -> bool:
+    return kind == "batch" and arg[0][0] == "SetCurrentProgramScene"
 
-def scene_loop(client: obs.ReqClient, sequence: list[str], tick: float, style: str,
-               max_repeats=None):
-    """Cycle through *sequence* until stop_event is set or max_repeats reached.
 
-    One "repeat" = one full pass through the sequence list.
-    If max_repeats is None, loops forever (until stop_event).
-    """
-    idx = 0
-    last_scene = None
-    seq_len = len(sequence)
-    repeat_info = f", repeats={max_repeats}" if max_repeats is not None else ""
-    _log(_C.SCENE, "loop", f"Starting {style} loop – {seq_len} steps, tick={tick}s{repeat_info}")
-    while not stop_event.is_set():
-        # Check if we've completed enough repeats
-        if max_repeats is not None and style != "once":
-            if idx // seq_len >= max_repeats:
-                _log(_C.SCENE, "loop", f"Completed {max_repeats} repeat(s).")
-                break
+class Lane:
+    """What one playback lane is doing (see Lanes)."""
 
-        # Pick the next scene based on style
-        if style == "random":
-            scene = random.choice(sequence)
-            idx += 1
-        elif style == "random_no_repeat":
-            choices = [s for s in sequence if s != last_scene] or sequence
-            scene = random.choice(choices)
-            idx += 1
-        elif style == "once":
-            if idx >= seq_len:
-                _log(_C.SCENE, "loop", f"Finished (once) – holding on {last_scene}")
-                break
-            scene = sequence[idx]
-            idx += 1
-        else:
-            # cycle, bounce, reverse, strobe, shuffle all just wrap around
-            scene = sequence[idx % seq_len]
-            idx += 1
+    __slots__ = ("name", "client", "program", "note", "trace", "pending", "resume_note",
+                 "token", "queued", "reply", "timeline", "launch", "requests")
 
-        _log(_C.SCENE, "loop", f"→ {scene}")
-        client.set_current_program_scene(scene)
-        last_scene = scene
-        # Use wait() instead of sleep() so we can interrupt immediately
-        stop_event.wait(tick)
-    _log(_C.DIM, "loop", "Stopped.")
+    def __init__(self, name: str):
+        self.name = name
+        self.client = None
+        self.program = None      # running playback program (generator), or None when idle
+        self.note = None         # ActionMap key of the trigger that started it, if any
+        self.trace = None
+        self.pending = None      # next (client, program, note, trace) to start, set by play()/stop()
+        self.resume_note = None  # set while paused: the MIDI note that resumes it
+        self.token = 0           # bumped whenever the lane is rescheduled; stale timers carry an old one
+        self.queued = False      # in the ready queue
+        self.reply = None        # value to send into the program when it next runs
+        self.timeline = None     # clock of the loop it plays, for quantized launches
+        self.launch = None       # _Launch waiting for its boundary, if any
+        self.requests = 0        # OBS requests in flight on Lanes' request threads
 
 
-def start_loop(client: obs.ReqClient, prefix: str, style: str, tick: float):
-    """Stop any existing loop, fetch matching scenes, start a new one."""
-    global loop_thread
+class _Launch:
+    """A quantized play() waiting in the timer heap for its boundary (see Lanes.play())."""
 
-    # Stop existing loop and wait for it to finish
-    stop_loop()
+    __slots__ = ("lane", "pending", "token")
 
-    scenes = get_scenes_by_prefix(client, prefix)
-    if not scenes:
-        _log(_C.WARN, "warn", f"No scenes found with prefix '{prefix}'")
-        return
-    sequence = build_sequence(scenes, style)
-    _log(_C.INFO, "info", f"Found scenes: {scenes} (style={style}, tick={tick}s)")
+    def __init__(self, lane: Lane, pending: tuple):
+        self.lane = lane
+        self.pending = pending   # (client, program, note, trace) to start
+        self.token = 0           # timer token; never bumped, a superseded launch is simply dropped
 
-    stop_event.clear()
-    loop_thread = threading.Thread(
-        target=scene_loop, args=(client, sequence, tick, style), daemon=True
-    )
-    loop_thread.start()
 
+class Lanes:
+    """Independent playback lanes, all driven by one scheduler thread.
 
-def stop_loop():
-    """Signal the loop thread to stop and wait for it to exit."""
-    global loop_thread, pause_resume_note
-    stop_event.set()
-    resume_event.set()  # unblock any pause wait
-    if loop_thread is not None:
-        loop_thread.join()
-        loop_thread = None
-    pause_resume_note = None
+    Each named lane plays one program at a time: play() replaces what that
+    lane is doing and leaves the other lanes alone, so a background loop, an
+    overlay strobe and a filter sweep can run side by side and be stopped
+    separately. The newest trigger on a lane always wins; play() never blocks.
+    A quantized play() waits in the timer heap, leaving the lane's current
+    program running until its boundary.
 
+    Programs are stepped cooperatively on the scheduler thread. A program's
+    ("wait", s) becomes an entry in one heap of deadlines shared by every
+    lane, so dozens of lanes cost one thread and one timed wait, and an idle
+    scheduler sleeps until something is played. A paused lane is simply not
+    scheduled until resume() is called with its note, and a held one until its
+    source calls back, so neither costs a wakeup while it waits.
 
-def switch_to_static_scene(client: obs.ReqClient, scene_name: str):
-    """Stop any running loop and switch to a specific static scene."""
-    stop_loop()
-    _log(_C.SCENE, "static", f"Switching to scene: {scene_name}")
-    try:
-        client.set_current_program_scene(scene_name)
-    except Exception as e:
-        _log(_C.ERR, "static", f"Failed to switch to '{scene_name}': {e}")
+    OBS requests to an ObsConnection, which pipelines requests from any
+    thread over its one socket, are handed to a pool of request threads:
+    the lane sleeps until its reply comes back while the scheduler steps
+    the others, so a slow reply only delays its own lane. A blocking
+    ReqClient must not be used concurrently, so its requests are sent from
+    the scheduler thread itself. Program scene switches from every lane pass
+    through one SwitchCoalescer, whose held switch is sent from the same
+    timer heap.
+    """
 
+    _IDLE = (None, None, None, None)
+    LAUNCH_GUARD_NS = 2_000_000   # a quantized launch replaces the old program this early
+    REQUEST_THREADS = 32          # most requests in flight at once, across all lanes
 
-def run_sequence(client: obs.ReqClient, steps: list[dict], trigger_note: int = None):
-    """Run a sequence of loop/static/stop/pause steps, looping continuously.
+    def __init__(self, clock=time.perf_counter_ns):
+        self._now = clock
+        self._cond = threading.Condition()
+        self._lanes = {}            # type: dict[str, Lane]
+        self._ready = []            # lanes to step as soon as possible, in order
+        self._timers = []           # heap of (deadline ns, seq, lane, token)
+        self._seq = itertools.count()
+        self._stepping = None       # lane being stepped right now
+        self._thread = None
+        self._switcher = Lane("")   # timer owner for the coalesced switch; never plays
+        self._requests = None       # ThreadPoolExecutor for ObsConnection requests, made on first use
+        self.switches = SwitchCoalescer(clock=clock)
+        self.superseded = 0         # triggers replaced before they ever started
+        self.wakeups = 0            # times the scheduler thread woke from waiting
 
-    The sequence repeats from the beginning after all steps complete.
-    Terminal actions (end the sequence when reached):
-      - static: switch to a static scene and end.
-      - stop: end without changing the scene.
-    Pause action:
-      - pause: hold the current scene until the resume note is pressed.
-        Defaults to trigger_note; override with "resume_note" in the action.
-    If the last step is a loop, the sequence wraps back to step 1.
-    Aborts early if stop_event is set (e.g. another MIDI note pressed).
-    """
-    global pause_resume_note
+    def play(self, program, lane: str = "main", note=None, trace: LatencyTrace | None = None,
+             client: obs.ReqClient | None = None, at: int | None = None) -> None:
+        """Cancel whatever *lane* is playing and start *program* on it next.
 
-    pass_num = 0
-    while not stop_event.is_set():
-        pass_num += 1
-        _log(_C.SEQ, "seq", f"Pass {pass_num}")
-
-        for i, step in enumerate(steps):
-            if stop_event.is_set():
-                _log(_C.DIM, "seq", "Cancelled.")
-                pause_resume_note = None
-                return
+        *note* is the ActionMap key of the trigger, *client* the OBS client
+        the program's requests go to. With *at* (a perf_counter_ns time, see
+        launch_deadline()) the lane plays on until then: the old program is
+        cancelled just before *at* and *program* starts exactly on it, so the
+        handover lands on the boundary without a gap.
+        """
+        with self._cond:
+            state = self._lanes.get(lane)
+            if state is None:
+                state = self._lanes[lane] = Lane(lane)
+            if state.launch is not None or (state.pending is not None and state.pending[1] is not None):
+                self.superseded += 1
+            state.launch = None
+            if at is not None:
+                launch = state.launch = _Launch(state, (client, launch_program(program, at, self._now), note,
+                                                        trace))
+                heapq.heappush(self._timers, (at - self.LAUNCH_GUARD_NS, next(self._seq), launch, 0))
+                self._cond.notify_all()
+            else:
+                state.pending = (client, program, note, trace)
+                self._wake(state)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="lanes", daemon=True)
+                self._thread.start()
 
-            kind = step["action"]
+    def stop(self, lane: str | None = None, timeout: float | None = None) -> bool:
+        """Cancel *lane* (default: every lane) and wait until it is idle.
 
-            if kind == "stop":
-                _log(_C.SEQ, "seq", f"Step {i + 1}/{len(steps)} – stop")
-                _log(_C.SEQ, "seq", "Sequence complete (terminal stop).")
-                return
+        Returns False if something was still running after *timeout* seconds.
+        """
+        with self._cond:
+            names = list(self._lanes) if lane is None else [lane]
+            for name in names:
+                state = self._lanes.get(name)
+                if state is not None:
+                    state.launch = None
+                if state is not None and (state.program is not None or state.pending is not None):
+                    state.pending = self._IDLE
+                    self._wake(state)
+        return self.wait_idle(timeout, lane)
 
-            elif kind == "static":
-                scene = step["scene"]
-                _log(_C.SEQ, "seq", f"Step {i + 1}/{len(steps)} – static (scene={scene})")
-                try:
-                    client.set_current_program_scene(scene)
-                except Exception as e:
-                    _log(_C.ERR, "seq", f"Failed to switch to '{scene}': {e}")
-                _log(_C.SEQ, "seq", "Sequence complete (terminal static).")
-                return
+    def resume(self, note) -> bool:
+        """Resume every lane paused on *note*; returns True if there was one."""
+        resumed = False
+        with self._cond:
+            for state in self._lanes.values():
+                if state.resume_note is not None and state.resume_note == note:
+                    state.resume_note = None
+                    self._wake(state)
+                    resumed = True
+        return resumed
 
-            elif kind == "pause":
-                note = step.get("resume_note", trigger_note)
-                _log(_C.WARN, "seq", f"Step {i + 1}/{len(steps)} – paused (resume_note={note})")
-                pause_resume_note = note
-                resume_event.clear()
+    def wait_idle(self, timeout: float | None = None, lane: str | None = None) -> bool:
+        """Block until *lane* (default: every lane) has nothing running or pending."""
+        def idle():
+            lanes = self._lanes.values() if lane is None else filter(None, [self._lanes.get(lane)])
+            return self.switches.held is None and self._switcher.requests == 0 and all(
+                s.program is None and s.pending is None and s.launch is None and s.requests == 0
+                and s is not self._stepping
+                for s in lanes)
+        with self._cond:
+            return self._cond.wait_for(idle, timeout)
 
-                # Wait until resumed or cancelled
-                while not stop_event.is_set() and not resume_event.is_set():
-                    resume_event.wait(0.1)
+    def timeline(self, lane: str = "main"):
+        """Clock of the loop playing on *lane*, else on any lane (None if none is)."""
+        with self._cond:
+            state = self._lanes.get(lane)
+            if state is not None and state.timeline is not None:
+                return state.timeline
+            return next((s.timeline for s in self._lanes.values() if s.timeline is not None), None)
 
-                pause_resume_note = None
+    def notes(self) -> dict:
+        """Lane name → trigger key of every lane that is playing something."""
+        with self._cond:
+            return {name: s.note for name, s in self._lanes.items() if s.program is not None}
 
-                if stop_event.is_set():
-                    _log(_C.DIM, "seq", "Cancelled during pause.")
-                    return
-                _log(_C.SEQ, "seq", "Resumed.")
+    def paused(self) -> dict:
+        """Lane name → resume note of every paused lane."""
+        with self._cond:
+            return {name: s.resume_note for name, s in self._lanes.items() if s.resume_note is not None}
+
+    # --- scheduler thread ---
 
-            elif kind == "loop":
-                prefix = step["prefix"]
-                style = step.get("style", "cycle")
-                tick = calc_tick(step["bpm"], step["steps"])
-                repeats = step.get("repeats", 1)
+    def _wake(self, state: Lane) -> None:
+        # Caller holds self._cond
+        state.token += 1   # drop its timer, if any
+        if not state.queued:
+            state.queued = True
+            self._ready.append(state)
+        self._cond.notify_all()
 
-                scenes = get_scenes_by_prefix(client, prefix)
-                if not scenes:
-                    _log(_C.WARN, "seq", f"Step {i + 1}/{len(steps)} – no scenes for '{prefix}', skipping")
+    def _next(self) -> Lane:
+        # Caller holds self._cond
+        while True:
+            if self._ready:
+                state = self._ready.pop(0)
+                state.queued = False
+                return state
+            timeout = None
+            if self._timers:
+                deadline, _, state, token = self._timers[0]
+                if state.token != token:
+                    heapq.heappop(self._timers)
                     continue
+                wait_ns = deadline - self._now()
+                if wait_ns <= 0:
+                    heapq.heappop(self._timers)
+                    return state
+                timeout = wait_ns / 1_000_000_000
+            self._cond.wait(timeout)
+            self.wakeups += 1
 
-                sequence = build_sequence(scenes, style)
-                _log(_C.SEQ, "seq", f"Step {i + 1}/{len(steps)} – {style} loop (prefix={prefix}, tick={tick:.3f}s, repeats={repeats})")
-                scene_loop(client, sequence, tick, style, max_repeats=repeats)
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                state = self._next()
+                if isinstance(state, _Launch):
+                    self._commit(state)
+                    continue
+                self._stepping = state
+                pending, state.pending = state.pending, None
+                reply, state.reply = state.reply, None
+                state.resume_note = None
+            try:
+                if state is self._switcher:
+                    self._send_held_switch()
+                    continue
+                if pending is not None:
+                    self._close(state)
+                    state.client, state.program, state.note, state.trace = pending
+                    reply = None
+                    if state.program is not None:
+                        latency.started(state.trace)
+                if state.program is not None:
+                    self._advance(state, reply)
+            finally:
+                with self._cond:
+                    self._stepping = None
+                    self._cond.notify_all()
 
-    _log(_C.DIM, "seq", "Cancelled.")
+    def _advance(self, state: Lane, reply) -> None:
+        """Run *state*'s program until it waits, pauses, finishes or is replaced."""
+        program = state.program
+        while state.pending is None:
+            try:
+                kind, arg = program.send(reply)
+            except StopIteration:
+                self._finish(state)
+                return
+            except Exception as e:
+                _log(_C.ERR, "player", f"Playback failed on lane '{state.name}': {e}")
+                self._finish(state)
+                return
+            if kind == "wait":
+                with self._cond:
+                    if state.pending is None:
+                        deadline = self._now() + round(arg * 1_000_000_000)
+                        heapq.heappush(self._timers, (deadline, next(self._seq), state, state.token))
+                return
+            if kind == "pause":
+                with self._cond:
+                    if state.pending is None:
+                        state.resume_note = arg
+                return
+            if kind == "hold":
+                with self._cond:
+                    token = state.token
+                arg.when_running(lambda: self._release(state, token))
+                return
+            if kind == "timeline":
+                state.timeline = arg
+                reply = None
+                continue
+            if kind == "scene":
+                due = self.switches.offer((state.client, arg, state.trace))
+                if due is not None:
+                    if due:
+                        with self._cond:
+                            heapq.heappush(self._timers, (due, next(self._seq), self._switcher,
+                                                          self._switcher.token))
+                    # Held: the program moves on; a failure is logged when it is sent
+                    reply = None
+                    continue
+            elif _switches_program(kind, arg):
+                self.switches.bypassed()
+            if isinstance(state.client, ObsConnection):
+                # The reply wakes the lane again (see _answered())
+                self._request(state, state.client, kind, arg, state.trace)
+                return
+            reply = execute_command(state.client, kind, arg, state.trace)
 
+    def _send_held_switch(self) -> None:
+        switch = self.switches.take()
+        if switch is not None:
+            client, scene, trace = switch
+            if isinstance(client, ObsConnection):
+                self._request(self._switcher, client, "scene", scene, trace)
+                return
+            error = execute_command(client, "scene", scene, trace)
+            if error is not None:
+                _log(_C.ERR, "obs", f"Failed to switch to '{scene}': {error}")
 
-def start_sequence(client: obs.ReqClient, steps: list[dict], trigger_note: int = None):
-    """Stop any existing loop/sequence and start a new sequence."""
-    global loop_thread
+    def _request(self, state: Lane, client, kind: str, arg, trace: LatencyTrace | None) -> None:
+        # Run execute_command() on a request thread and hand its reply back to *state*
+        with self._cond:
+            token = state.token
+            state.requests += 1
+            if self._requests is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self._requests = ThreadPoolExecutor(self.REQUEST_THREADS, thread_name_prefix="lane-request")
+        future = self._requests.submit(execute_command, client, kind, arg, trace)
+        future.add_done_callback(lambda f: self._answered(state, token, f, arg))
 
-    stop_loop()
+    def _answered(self, state: Lane, token: int, future, arg) -> None:
+        # Called on the request thread. A lane replaced or stopped since the
+        # request was sent has a new token, and its stale reply is dropped.
+        reply = future.exception() or future.result()
+        with self._cond:
+            state.requests -= 1
+            if state is not self._switcher and state.token == token:
+                state.reply = reply
+                self._wake(state)
+                return
+            self._cond.notify_all()
+        if state is self._switcher and reply is not None:
+            _log(_C.ERR, "obs", f"Failed to switch to '{arg}': {reply}")
 
-    stop_event.clear()
-    resume_event.clear()
-    loop_thread = threading.Thread(
-        target=run_sequence, args=(client, steps, trigger_note), daemon=True
-    )
-    loop_thread.start()
+    def _commit(self, launch: _Launch) -> None:
+        # Caller holds self._cond. A later play() or stop() on the lane drops the launch.
+        state = launch.lane
+        if state.launch is not launch:
+            return
+        state.launch = None
+        state.pending = launch.pending
+        self._wake(state)
 
+    def _release(self, state: Lane, token: int) -> None:
+        # Called back by a "hold" source, from whichever thread it runs on
+        with self._cond:
+            if state.token == token:
+                self._wake(state)
 
-def handle_midi(msg, client: obs.ReqClient):
-    """React to incoming MIDI messages using MIDI_MAP."""
-    global pause_resume_note
+    def _close(self, state: Lane) -> None:
+        if state.program is not None:
+            try:
+                state.program.close()
+            except Exception as e:
+                _log(_C.ERR, "player", f"Playback failed on lane '{state.name}': {e}")
+        self._finish(state)
 
-    if msg.type != "note_on" or msg.velocity == 0:
-        return
+    def _finish(self, state: Lane) -> None:
+        with self._cond:
+            state.program = state.client = state.note = state.trace = state.timeline = None
+            state.resume_note = None
 
-    # If a sequence is paused and this is the resume note, resume it
-    if pause_resume_note is not None and msg.note == pause_resume_note:
-        _log(_C.MIDI, "midi", f"note {msg.note} – resuming paused sequence")
-        resume_event.set()
-        return
 
-    entry = MIDI_MAP.get(msg.note)
-    if entry is None:
-        _log(_C.DIM, "midi", f"note {msg.note} – unmapped, ignoring")
-        return
+lanes = Lanes()
 
-    kind = entry["action"]
 
-    if kind == "loop":
-        prefix = entry["prefix"]
-        style = entry.get("style", "cycle")
-        tick = calc_tick(entry["bpm"], entry["steps"])
-        _log(_C.MIDI, "midi", f"note {msg.note} – {style} loop (prefix={prefix}, bpm={entry['bpm']}, steps={entry['steps']}, tick={tick:.3f}s)")
-        start_loop(client, prefix, style, tick)
-    elif kind == "static":
-        scene = entry["scene"]
-        _log(_C.MIDI, "midi", f"note {msg.note} – static scene → {scene}")
-        switch_to_static_scene(client, scene)
-    elif kind == "sequence":
-        steps = entry["steps"]
-        _log(_C.MIDI, "midi", f"note {msg.note} – sequence ({len(steps)} steps)")
+# ---------------------------------------------------------------------------
+# Config watching
+# ---------------------------------------------------------------------------
 
+# Quiet time after the last write before a changed config is reloaded, so an
+# editor's multi-step save is read once, complete
+CONFIG_DEBOUNCE = 0.25
 
-def midi_debug_loop(port_name: str):
-    """Open a MIDI port and log every incoming message."""
-    NOTE_NAMES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
-    with mido.open_input(port_name) as inport:
-        _log(_C.DIM, "debug", f"Listening on: {port_name}")
-        _log(_C.DIM, "debug", "Press keys on your MIDI device … (Ctrl+C to quit)")
-        while True:
-            for msg in inport.iter_pending():
-                if hasattr(msg, "note"):
-                    name = NOTE_NAMES[msg.note % 12] + str(msg.note // 12 - 1)
-                    _log(_C.MIDI, "debug", f"{msg}  (note_name={name})")
-                else:
-                    _log(_C.DIM, "debug", str(msg))
-            time.sleep(0.001)
 
+class _Inotify:
+    """Directory change notifications from Linux inotify, through ctypes."""
 
-def main():
-    # --- MIDI debug mode ---
-    if MIDI_DEBUG:
-        available = mido.get_input_names()
-        _log(_C.DIM, "debug", f"Available MIDI inputs: {available}")
+    IN_MODIFY, IN_CLOSE_WRITE, IN_MOVED_TO, IN_CREATE = 0x002, 0x008, 0x080, 0x100
+    _HEADER = 16   # struct inotify_event: int wd; uint32 mask, cookie, len
+
+    def __init__(self, directory: str):
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            err = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(err, f"inotify_add_watch failed for {directory}")
+
+    def names(self) -> list[str]:
+        """Names of the files changed since the last call (non-blocking)."""
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        names, pos = [], 0
+        while pos + self._HEADER <= len(data):
+            length = int.from_bytes(data[pos + 12:pos + 16], sys.byteorder)
+            names.append(os.fsdecode(data[pos + self._HEADER:pos + self._HEADER + length].rstrip(b"\0")))
+            pos += self._HEADER + length
+        return names
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class ConfigWatcher:
+    """Reload MIDI_MAP when the config file changes, touching only what changed.
+
+    Uses inotify on Linux, so an edit is noticed immediately without waking
+    up in between; elsewhere it polls the file's mtime/size every
+    *poll_interval* seconds. Bursts of writes are debounced, a save that does
+    not change the file's content is ignored, and unchanged notes keep their
+    plans. *on_change* is called with the set of added or changed notes.
+    """
+
+    def __init__(self, path: str, on_change=None, debounce: float = CONFIG_DEBOUNCE,
+                 poll_interval: float = 1.0, use_inotify: bool | None = None):
+        self.path = path
+        self.on_change = on_change
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.use_inotify = sys.platform.startswith("linux") if use_inotify is None else use_inotify
+        self.reloads = 0
+        self._digest = self._read_digest()[1]
+        self._stop = threading.Event()
+        self._wake_lock = threading.Lock()
+        self._wake_r, self._wake_w = os.pipe()
+
+    def close(self) -> None:
+        """Stop run() (from any thread)."""
+        with self._wake_lock:
+            self._stop.set()
+            if self._wake_w is not None:
+                os.write(self._wake_w, b"x")
+
+    def run(self) -> None:
+        """Watch until close() is called or the program shuts down."""
+        notify = None
+        if self.use_inotify:
+            try:
+                notify = _Inotify(os.path.dirname(os.path.abspath(self.path)))
+            except (OSError, AttributeError) as e:
+                _log(_C.DIM, "config", "inotify unavailable (%s), polling instead", e)
+        try:
+            if notify is not None:
+                self._run_inotify(notify)
+            else:
+                self._run_polling()
+        finally:
+            if notify is not None:
+                notify.close()
+            with self._wake_lock:
+                os.close(self._wake_r)
+                os.close(self._wake_w)
+                self._wake_w = None
+
+    def _stopped(self) -> bool:
+        return self._stop.is_set() or _shutdown_event.is_set()
+
+    def _run_inotify(self, notify: _Inotify) -> None:
+        import select
+        name = os.path.basename(self.path)
+        while not self._stopped():
+            ready, _, _ = select.select([notify.fd, self._wake_r], [], [])
+            if self._wake_r in ready or name not in notify.names():
+                continue
+            # Debounce: wait until the file has been quiet for a while
+            while not self._stopped():
+                ready, _, _ = select.select([notify.fd, self._wake_r], [], [], self.debounce)
+                if not ready or self._wake_r in ready:
+                    break
+                notify.names()
+            if not self._stopped():
+                self.reload()
+
+    def _run_polling(self) -> None:
+        last = self._stat()
+        while not self._stop.wait(self.poll_interval) and not _shutdown_event.is_set():
+            current = self._stat()
+            if current == last:
+                continue
+            # Debounce: reload once the file has stopped changing
+            while not self._stop.wait(self.debounce):
+                settled = self._stat()
+                if settled == current:
+                    break
+                current = settled
+            last = current
+            self.reload()
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _read_digest(self) -> tuple[bytes | None, str | None]:
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None, None
+        return data, hashlib.sha256(data).hexdigest()
+
+    def reload(self) -> bool:
+        """Re-read the config now; returns True if MIDI_MAP was replaced."""
+        global MIDI_MAP
+        data, digest = self._read_digest()
+        if data is None or digest == self._digest:
+            return False
+        try:
+            raw = json.loads(data)
+            new_map = build_action_map(raw, MIDI_MAP)
+        except Exception as exc:
+            # Keep the digest unchanged so the next save is tried again
+            _log(_C.WARN, "config", "Config reload failed (keeping the current mappings): %s", exc)
+            return False
+        added, removed, changed = new_map.diff(MIDI_MAP)
+        MIDI_MAP = new_map   # atomic reference swap under the GIL
+        self._digest = digest
+        recorder.config(raw)
+        self.reloads += 1
+        _log(_C.INFO, "config", "Config reloaded from %s: %d added, %d changed, %d removed",
+             os.path.basename(self.path), len(added), len(changed), len(removed))
+        if self.on_change is not None and (added or changed):
+            self.on_change(added | changed)
+        return True
+
+
+def restart_changed_loop(client: obs.ReqClient, notes: set) -> None:
+    """After a reload, restart any running loop whose note's mapping changed.
+
+    *notes* holds ActionMap keys (see ActionMap.diff). Anything else that is
+    playing (unchanged loops, sequences, pauses) keeps going as it was.
+    """
+    for lane, key in lanes.notes().items():
+        if key not in notes:
+            continue
+        plan = MIDI_MAP.plan_for(key)
+        if plan is None or plan.kind != "loop":
+            continue
+        note = key[1] if isinstance(key, tuple) else key
+        _log(_C.INFO, "config", "Restarting loop on note %s with its new mapping", note)
+        lanes.play(plan.program(note), plan.lane, note=key, client=client)
+
+
+# ---------------------------------------------------------------------------
+# Timing
+# ---------------------------------------------------------------------------
+
+class JitterStats:
+    """Running lateness statistics for a TickClock (all values in nanoseconds)."""
+
+    LATE_THRESHOLD_NS = 2_000_000
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.total_sq = 0
+        self.worst = 0
+        self.late = 0      # ticks that fired more than LATE_THRESHOLD_NS after their deadline
+        self.early = 0     # ticks that fired before their deadline (counted as on time)
+        self.skipped = 0   # ticks dropped by the "skip" policy
+
+    def record(self, lateness_ns: int, skipped: int = 0) -> None:
+        self.count += 1
+        if lateness_ns < 0:
+            self.early += 1
+            lateness_ns = 0
+        self.total += lateness_ns
+        self.total_sq += lateness_ns * lateness_ns
+        if lateness_ns > self.worst:
+            self.worst = lateness_ns
+        if lateness_ns > self.LATE_THRESHOLD_NS:
+            self.late += 1
+        self.skipped += skipped
+
+    def summary(self) -> dict:
+        """Return mean/stddev/max lateness in milliseconds plus tick counters."""
+        if not self.count:
+            return {"ticks": 0, "mean_ms": 0.0, "stdev_ms": 0.0, "max_ms": 0.0, "late": 0, "early": 0,
+                    "skipped": 0}
+        mean = self.total / self.count
+        var = max(0.0, self.total_sq / self.count - mean * mean)
+        return {
+            "ticks": self.count,
+            "mean_ms": round(mean / 1e6, 3),
+            "stdev_ms": round(var ** 0.5 / 1e6, 3),
+            "max_ms": round(self.worst / 1e6, 3),
+            "late": self.late,
+            "early": self.early,
+            "skipped": self.skipped,
+        }
+
+    def __str__(self) -> str:
+        s = self.summary()
+        return (f"jitter: {s['ticks']} ticks, mean={s['mean_ms']}ms, stdev={s['stdev_ms']}ms, "
+                f"max={s['max_ms']}ms, late={s['late']}, early={s['early']}, skipped={s['skipped']}")
+
+
+class TickClock:
+    """Drift-free tick scheduler working from absolute deadlines.
+
+    Tick *n* is due at ``origin + n * tick``, measured with
+    time.perf_counter_ns(), so time spent switching scenes or logging never
+    pushes later ticks back. When a tick fires a whole tick or more behind
+    its deadline, *policy* decides what happens to the missed ones (see
+    LATE_TICK_POLICY).
+    """
+
+    POLICIES = ("skip", "catch_up")
+
+    def __init__(self, tick: float, policy: str | None = None, clock=None, beats: float | None = None):
+        policy = policy or LATE_TICK_POLICY
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown late tick policy '{policy}' (expected one of {self.POLICIES})")
+        self.tick_ns = max(1, round(tick * 1_000_000_000))
+        self.beats = beats or 1.0   # beats per tick, for boundary(); a bare "tick" counts as one
+        self.policy = policy
+        self._now = clock or time.perf_counter_ns
+        self.origin = self._now()
+        self.index = 0   # tick whose deadline is next (or currently firing)
+        self.stats = JitterStats()
+
+    def deadline(self, index: int | None = None) -> int:
+        """Absolute deadline of tick *index* (default: the current tick)."""
+        return self.origin + (self.index if index is None else index) * self.tick_ns
+
+    def fire(self) -> int:
+        """Record that the current tick is firing now.
+
+        Returns how many ticks were skipped to get back on the grid (always 0
+        for "catch_up"), so callers can advance their own position to match.
+        """
+        late = self._now() - self.deadline()
+        skipped = 0
+        if self.policy == "skip" and late >= self.tick_ns:
+            skipped = late // self.tick_ns
+            self.index += skipped
+            late -= skipped * self.tick_ns
+        self.stats.record(late, skipped)
+        return skipped
+
+    def remaining(self, lead: float = 0.0) -> float:
+        """Move on to the next tick and return seconds until *lead* seconds
+        before it is due (>= 0)."""
+        self.index += 1
+        return max(0, self.deadline() - round(lead * 1_000_000_000) - self._now()) / 1_000_000_000
+
+    def pending(self, lead: float = 0.0) -> float:
+        """Seconds still to wait after remaining() has elapsed; always 0 for a wall clock."""
+        return 0.0
+
+    def left(self) -> float:
+        """Seconds from now until the current tick is due (>= 0)."""
+        return max(0, self.deadline() - self._now()) / 1_000_000_000
+
+    def boundary(self, beats: float) -> int:
+        """Time of the next point on this clock's grid a multiple of *beats*
+        beats from its origin (now, if that is one)."""
+        step = self.tick_ns * beats / self.beats
+        return round(self.origin + math.ceil((self._now() - self.origin) / step) * step)
+
+
+class MidiClock:
+    """Follows an external MIDI clock: 24 pulses per beat plus transport messages.
+
+    Pulse arrival times jitter by a millisecond or more (USB polling, driver
+    threads), so tempo and phase come from a second-order delay-locked loop,
+    the filter used for audio clock recovery: each pulse moves the predicted
+    time of the next one by a fraction of its error. The result is a smoothed
+    pulse period (the tempo) and a pulse grid that can be scheduled against
+    ahead of the pulses themselves (see time_of() and BeatClock).
+
+    Fed from the MIDI input thread, read from playback; a lock keeps the
+    filter state consistent between them.
+    """
+
+    PPQN = 24
+    MESSAGES = frozenset({"clock", "start", "stop", "continue", "songpos"})
+    BANDWIDTH_HZ = 1.0   # DLL bandwidth: lower is smoother, higher follows tempo changes faster
+
+    def __init__(self, clock=None):
+        self._now = clock or time.perf_counter_ns
+        self._lock = threading.Lock()
+        self.running = False
+        self.pulse = -1       # song position of the last pulse, in pulses (-1: before the first)
+        self.period = None    # filtered pulse period in ns, once two pulses have been seen
+        self.epoch = 0        # bumped when the song position jumps (start, songpos)
+        self._t0 = None       # filtered time of pulse self.pulse
+        self._t1 = None       # predicted time of the next pulse
+        self._last = None     # raw arrival time of the previous pulse
+        self._waiters = []    # callbacks for when_running()
+
+    @property
+    def locked(self) -> bool:
+        """True while the transport runs and the pulse grid is known."""
+        return self.running and self._t1 is not None
+
+    @property
+    def bpm(self) -> float | None:
+        period = self.period
+        return 60e9 / (period * self.PPQN) if period else None
+
+    def feed(self, msg, now_ns: int | None = None) -> None:
+        """Apply one clock/start/stop/continue/songpos message received at *now_ns*."""
+        now = self._now() if now_ns is None else now_ns
+        kind = msg.type
+        if kind == "clock":
+            with self._lock:
+                if not self.running:
+                    return
+                self._pulse(now)
+                if not self._waiters or self._t1 is None:
+                    return
+                waiters, self._waiters = self._waiters, []
+            for callback in waiters:
+                callback()
+            return
+        with self._lock:
+            if kind == "start":
+                self.pulse = -1   # the next pulse is the song's first
+                self.running = True
+                self.epoch += 1
+            elif kind == "continue":
+                self.running = True
+            elif kind == "stop":
+                self.running = False
+            elif kind == "songpos":
+                self.pulse = msg.pos * (self.PPQN // 4) - 1   # songpos counts 16th notes
+                self.epoch += 1
+            else:
+                return
+            # Re-acquire the phase from the next pulse; the tempo estimate carries over
+            self._t1 = self._last = None
+        _log(_C.MIDI, "clock", "%s (pulse %d, %s bpm)", kind, self.pulse + 1,
+             f"{self.bpm:.1f}" if self.bpm else "?")
+
+    def _pulse(self, now: int) -> None:
+        self.pulse += 1
+        period = self.period
+        if self._t1 is None:
+            if period is None and self._last is not None:
+                period = self.period = now - self._last
+            if period:
+                self._t0, self._t1 = now, now + period
+        else:
+            error = now - self._t1
+            if abs(error) > period:
+                # Tempo jump or dropped pulses: re-lock on the raw interval
+                period = self.period = max(1, now - self._last)
+                self._t0, self._t1 = now, now + period
+            else:
+                omega = 2 * math.pi * self.BANDWIDTH_HZ * period / 1e9
+                self._t0 = self._t1
+                self._t1 += math.sqrt(2) * omega * error + period
+                self.period = period + omega * omega * error
+        self._last = now
+
+    def when_running(self, callback) -> None:
+        """Call *callback* once the transport runs and the grid is known: right
+        away if it is now, else from the MIDI thread on the pulse that locks it."""
+        with self._lock:
+            if not self.locked:
+                self._waiters.append(callback)
+                return
+        callback()
+
+    def time_of(self, pulse: int) -> int | None:
+        """Predicted perf_counter_ns time of song position *pulse*, or None until locked."""
+        with self._lock:
+            if self._t1 is None:
+                return None
+            return round(self._t0 + (pulse - self.pulse) * self.period)
+
+    def boundary(self, beats: float) -> int | None:
+        """Predicted time of the next song position that is a whole multiple
+        of *beats* beats, or None until locked."""
+        step = max(1, round(beats * self.PPQN))
+        return self.time_of((self.pulse // step + 1) * step)
+
+
+class BeatClock:
+    """TickClock counterpart that ticks every *beats* beats of a MidiClock.
+
+    Tick *n* is song position ``n * beats * 24`` pulses, so switches land on
+    the music's beat and bar lines. Its wall-clock time is the MidiClock's
+    prediction rather than the pulse's arrival, so it is waited for ahead of
+    time like any TickClock deadline. Waits are cut into slices of at most
+    MAX_WAIT seconds and re-predicted (see pending()), so tempo changes during
+    a long tick still land on the beat. While the transport is stopped the
+    loop holds its scene without polling (see the "hold" program command);
+    after a start or song position change the grid re-aligns to the new
+    position.
+    """
+
+    MAX_WAIT = 0.25
+
+    def __init__(self, midi_clock: MidiClock, beats: float, policy: str | None = None, clock=None):
+        policy = policy or LATE_TICK_POLICY
+        if policy not in TickClock.POLICIES:
+            raise ValueError(f"Unknown late tick policy '{policy}' (expected one of {TickClock.POLICIES})")
+        self.midi_clock = midi_clock
+        self.pulses = max(1, round(beats * MidiClock.PPQN))
+        self.policy = policy
+        self._now = clock or time.perf_counter_ns
+        self._epoch = midi_clock.epoch
+        # The first tick fires on trigger; later ones follow the grid from there
+        self.index = max(0, midi_clock.pulse) // self.pulses
+        self._first = True
+        self.stats = JitterStats()
+
+    def deadline(self, index: int | None = None) -> int | None:
+        """Predicted time of tick *index* (default: the current tick), or None if not locked."""
+        return self.midi_clock.time_of((self.index if index is None else index) * self.pulses)
+
+    def _align(self) -> None:
+        self._epoch = self.midi_clock.epoch
+        # Next boundary at or after the current position, so the downbeat
+        # whose pulse just released a hold still fires
+        self.index = -(-max(0, self.midi_clock.pulse) // self.pulses)
+
+    def fire(self) -> int:
+        """Record that the current tick is firing now; returns ticks skipped (see TickClock.fire)."""
+        if self._first:
+            self._first = False
+            return 0
+        skipped = 0
+        behind = self.midi_clock.pulse - self.index * self.pulses
+        if self.policy == "skip" and behind >= self.pulses:
+            skipped = behind // self.pulses
+            self.index += skipped
+        deadline = self.deadline()
+        self.stats.record(self._now() - deadline if deadline is not None else 0, skipped)
+        return skipped
+
+    def remaining(self, lead: float = 0.0) -> float | None:
+        """Move on to the next tick and return seconds to wait before checking pending()."""
+        self.index += 1
+        return self.pending(lead)
+
+    def pending(self, lead: float = 0.0) -> float | None:
+        """Seconds still to wait until *lead* seconds before the current tick:
+        0 once due, None while the transport is stopped (hold until
+        midi_clock.when_running()), otherwise at most MAX_WAIT."""
+        if self._epoch != self.midi_clock.epoch and self.midi_clock.locked:
+            self._align()
+        deadline = self.deadline() if self.midi_clock.running else None
+        if deadline is None:
+            return None
+        left = (deadline - self._now()) / 1_000_000_000 - lead
+        return 0.0 if left <= 0.0005 else min(left, self.MAX_WAIT)
+
+    def left(self) -> float | None:
+        """Seconds to wait before checking pending() again for the tick itself."""
+        return self.pending()
+
+    def boundary(self, beats: float) -> int | None:
+        """See MidiClock.boundary()."""
+        return self.midi_clock.boundary(beats)
+
+
+def beat_clock(beats: float | None) -> BeatClock | None:
+    """Clock for a loop switching every *beats* beats: a BeatClock on midi_clock
+    under MIDI_CLOCK_SYNC, else None (a wall-clock TickClock)."""
+    if not MIDI_CLOCK_SYNC or beats is None:
+        return None
+    return BeatClock(midi_clock, beats)
+
+
+midi_clock = MidiClock()
+
+
+def launch_deadline(quantize: float | None, timeline) -> int | None:
+    """perf_counter_ns time at which a trigger quantized to *quantize* beats
+    (None: LAUNCH_QUANTIZE) should start, or None to start it at once.
+
+    Boundaries follow the MIDI clock under MIDI_CLOCK_SYNC, otherwise
+    *timeline*, the clock of a playing loop (see Lanes.timeline()). With
+    neither there is no grid to land on.
+    """
+    beats = quantize_beats(LAUNCH_QUANTIZE) if quantize is None else quantize
+    if not beats:
+        return None
+    if MIDI_CLOCK_SYNC and midi_clock.locked:
+        return midi_clock.boundary(beats)
+    return timeline.boundary(beats) if timeline is not None else None
+
+
+class LatencyHistogram:
+    """Log-linear (HDR-style) histogram of durations in microseconds.
+
+    Values below 64 µs get their own bucket; above that each power of two is
+    split into 32 buckets, so percentiles are within ~3% of the true value
+    while record() stays a couple of integer operations.
+    """
+
+    SUB_BITS = 5
+    _BUCKETS = (40 << SUB_BITS) + (2 << SUB_BITS)   # up to ~2^40 µs (12 days)
+
+    def __init__(self):
+        self.counts = [0] * self._BUCKETS
+        self.count = 0
+        self.max_us = 0
+
+    @classmethod
+    def _index(cls, us: int) -> int:
+        shift = us.bit_length() - cls.SUB_BITS - 1
+        if shift <= 0:
+            return us
+        return min(cls._BUCKETS - 1, (shift << cls.SUB_BITS) + (us >> shift))
+
+    @classmethod
+    def _upper(cls, index: int) -> int:
+        """Largest value that lands in bucket *index*."""
+        if index < 2 << cls.SUB_BITS:
+            return index
+        shift = (index >> cls.SUB_BITS) - 1
+        return ((index - (shift << cls.SUB_BITS) + 1) << shift) - 1
+
+    def record(self, us: int) -> None:
+        self.counts[self._index(us)] += 1
+        self.count += 1
+        if us > self.max_us:
+            self.max_us = us
+
+    def merge(self, other: "LatencyHistogram") -> "LatencyHistogram":
+        """Add *other*'s samples to this histogram and return it."""
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.max_us = max(self.max_us, other.max_us)
+        return self
+
+    def percentile(self, pct: float) -> int:
+        """Value (µs) at or below which *pct* percent of the samples fall."""
+        if not self.count:
+            return 0
+        rank = max(1, -(-self.count * pct // 100))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(self._upper(index), self.max_us)
+        return self.max_us
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "p50_ms": round(self.percentile(50) / 1000, 3),
+            "p99_ms": round(self.percentile(99) / 1000, 3),
+            "max_ms": round(self.max_us / 1000, 3),
+        }
+
+
+class LatencyTrace:
+    """Timestamps for one MIDI trigger, passed along with its playback job."""
+
+    __slots__ = ("note", "t0", "switched")
+
+    def __init__(self, note: int | None, t0: int):
+        self.note = note
+        self.t0 = t0            # perf_counter_ns() when the note was handled
+        self.switched = False   # first scene switch already recorded
+
+
+class LatencyTracker:
+    """Per-stage latency histograms for the trigger → program scene path.
+
+    Stages:
+      handle           note received → handle_midi() returns
+      dispatch         note received → its playback job starts running
+      scene_list       one scene catalog lookup (a loop's playback order)
+      scene_item       one GetSceneItemId round trip on a scene item index miss
+      obs_request      one SetCurrentProgramScene round trip
+      note_to_switch   note received → first SetCurrentProgramScene answered
+      note_to_program  note received → OBS reports the new program scene
+                       (LATENCY_CONFIRM, needs scene events)
+
+    Each stage keeps a lifetime histogram plus a rolling one covering the
+    last one to two *window*s, available at runtime through summary().
+    """
+
+    CONFIRM_TIMEOUT_NS = 2_000_000_000
+
+    def __init__(self, window: float = 60.0, clock=None):
+        self.enabled = LATENCY_STATS
+        self.window_ns = round(window * 1_000_000_000)
+        self._now = clock or time.perf_counter_ns
+        self._lock = threading.Lock()
+        self._total = {}     # type: dict[str, LatencyHistogram]
+        self._current = {}   # type: dict[str, LatencyHistogram]
+        self._previous = {}  # type: dict[str, LatencyHistogram]
+        self._window_start = self._now()
+        self._confirm = None  # (scene, trace) awaiting CurrentProgramSceneChanged
+        self._early = None    # (scene, ns) of a CurrentProgramSceneChanged that beat its response
+
+    def record(self, stage: str, start_ns: int, end_ns: int | None = None) -> None:
+        """Add the duration from *start_ns* to *end_ns* (default: now) to *stage*."""
+        if not self.enabled:
+            return
+        now = self._now() if end_ns is None else end_ns
+        us = max(0, now - start_ns) // 1000
+        with self._lock:
+            if now - self._window_start >= self.window_ns:
+                self._previous, self._current = self._current, {}
+                self._window_start = now
+            for hists in (self._total, self._current):
+                hist = hists.get(stage)
+                if hist is None:
+                    hist = hists[stage] = LatencyHistogram()
+                hist.record(us)
+
+    # --- trigger path hooks ---
+
+    def begin(self, note: int | None) -> LatencyTrace | None:
+        return LatencyTrace(note, self._now()) if self.enabled else None
+
+    def started(self, trace: LatencyTrace | None) -> None:
+        if trace is not None:
+            self.record("dispatch", trace.t0)
+
+    def switched(self, trace: LatencyTrace | None, scene: str, sent_ns: int) -> None:
+        """Record a finished SetCurrentProgramScene sent at *sent_ns*."""
+        if not self.enabled:
+            return
+        now = self._now()
+        self.record("obs_request", sent_ns, now)
+        if trace is not None and not trace.switched:
+            trace.switched = True
+            self.record("note_to_switch", trace.t0, now)
+            if LATENCY_CONFIRM:
+                with self._lock:
+                    early, self._early = self._early, None
+                    confirmed = early is not None and early[0] == scene and early[1] >= sent_ns
+                    if not confirmed:
+                        self._confirm = (scene, trace)
+                if confirmed:
+                    # Events share the request socket, so OBS's event can arrive first
+                    self.record("note_to_program", trace.t0, early[1])
+
+    def attach(self, event_client) -> None:
+        """Time OBS confirmations from an EventClient/AsyncObsClient's events."""
+        event_client.callback.register(self.on_current_program_scene_changed)
+
+    def on_current_program_scene_changed(self, data) -> None:
+        now = self._now()
+        with self._lock:
+            pending, self._confirm = self._confirm, None
+            if pending is None or pending[0] != data.scene_name:
+                self._early = (data.scene_name, now)
+                return
+        if now - pending[1].t0 <= self.CONFIRM_TIMEOUT_NS:
+            self.record("note_to_program", pending[1].t0, now)
+
+    # --- reporting ---
+
+    def summary(self, recent: bool = False) -> dict:
+        """Return {stage: {count, p50_ms, p99_ms, max_ms}}.
+
+        *recent* limits it to the rolling window instead of the whole run.
+        """
+        with self._lock:
+            if recent:
+                merged = {}
+                for hists in (self._previous, self._current):
+                    for stage, hist in hists.items():
+                        merged.setdefault(stage, LatencyHistogram()).merge(hist)
+            else:
+                merged = self._total
+            return {stage: hist.summary() for stage, hist in merged.items()}
+
+    def report(self, recent: bool = False) -> None:
+        """Log one line per stage."""
+        stats = self.summary(recent)
+        if not stats:
+            return
+        _log(_C.INFO, "latency", "Trigger latency (%s):", "recent" if recent else "this run")
+        for stage, s in stats.items():
+            _log(_C.INFO, "latency", "  %-16s n=%-6d p50=%.3fms  p99=%.3fms  max=%.3fms",
+                 stage, s["count"], s["p50_ms"], s["p99_ms"], s["max_ms"])
+
+
+latency = LatencyTracker()
+
+
+def natural_sort_key(s: str):
+    """Sort key that handles embedded numbers naturally (e.g. 2 before 10)."""
+    return [int(c) if c.isdigit() else c.lower() for c in re.split(r"(\d+)", s)]
+
+
+class SceneCatalog:
+    """Cached set of OBS scene names with memoised prefix → sorted-scene lookups.
+
+    The catalog is filled by one GetSceneList request and then kept current by
+    OBS scene events (see attach()). Until it is attached to an event source it
+    cannot tell when scenes change, so every lookup re-fetches the list — the
+    same behaviour as querying OBS directly.
+
+    Hits are lock-free. Event handlers never edit the published scene set,
+    they swap in a fresh (scene set, memo) snapshot; a lookup that misses
+    fills in its snapshot's memo under the lock. A result computed from a
+    snapshot that has since been replaced lands in the retired memo and is
+    never served.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._client = None
+        # (scene set, prefix → sorted scenes memo), swapped as one unit
+        self._snapshot = (None, {})  # type: tuple[frozenset[str] | None, dict[str, tuple[str, ...]]]
+        self.live = False     # True once scene events keep the cache current
+        self.version = 0      # bumped on every change to the scene set
+
+    def __len__(self) -> int:
+        return len(self._snapshot[0] or ())
+
+    def load(self, client: obs.ReqClient) -> None:
+        """Fetch the full scene list from OBS and reset all prefix lookups."""
+        resp = client.get_scene_list()
+        self.set_scenes((s["sceneName"] for s in resp.scenes), client)
+
+    def set_scenes(self, names, client=None) -> None:
+        """Replace the scene set, e.g. with a list fetched by another client."""
+        with self._lock:
+            self._client = client
+            self._publish(set(names))
+
+    def scenes_for(self, client: obs.ReqClient, prefix: str) -> list[str]:
+        """Return scene names that start with *prefix*, natural-sorted."""
+        self._refresh(client)
+        return self.lookup(prefix)
+
+    def order_for(self, client: obs.ReqClient, prefix: str, style: str,
+                  seed: int | None = None) -> tuple[str, ...]:
+        """Return the playback order of a *style* loop over *prefix* (see order())."""
+        self._refresh(client)
+        return self.order(prefix, style, seed)
+
+    def order(self, prefix: str, style: str, seed: int | None = None) -> tuple[str, ...]:
+        """Like order_for(), but never touches OBS.
+
+        Orders are built once per scene set and reused, except for styles
+        that must be re-randomised every time they start (shuffle) and are
+        not pinned by a *seed*.
+        """
+        scenes, memo = self._snapshot
+        key = (prefix, style, seed)
+        found = memo.get(key)
+        if found is None:
+            found = tuple(build_sequence(self.lookup(prefix), style, loop_random(seed)))
+            if seed is not None or not LOOP_STYLES[style].fresh:
+                with self._lock:
+                    found = memo.setdefault(key, found)
+        return found
+
+    def _refresh(self, client: obs.ReqClient) -> None:
+        if not self.live or self._snapshot[0] is None or client is not self._client:
+            self.load(client)
+
+    def lookup(self, prefix: str) -> list[str]:
+        """Like scenes_for(), but never touches OBS (empty until loaded)."""
+        scenes, memo = self._snapshot
+        if scenes is None:
+            return []
+        found = memo.get(prefix)
+        if found is None:
+            found = tuple(sorted(
+                (s for s in scenes if s.startswith(prefix)),
+                key=natural_sort_key,
+            ))
+            with self._lock:
+                found = memo.setdefault(prefix, found)
+        return list(found)
+
+    def attach(self, event_client) -> None:
+        """Subscribe to scene events on an obsws_python EventClient."""
+        event_client.callback.register([
+            self.on_scene_created,
+            self.on_scene_removed,
+            self.on_scene_name_changed,
+            self.on_scene_list_changed,
+        ])
+        self.live = True
+
+    def _publish(self, scenes: set[str]) -> None:
+        # Caller holds self._lock.
+        self._snapshot = (frozenset(scenes), {})
+        self.version += 1
+
+    def _edit(self, remove: str | None = None, add: str | None = None) -> None:
+        with self._lock:
+            if self._snapshot[0] is None:
+                return
+            scenes = set(self._snapshot[0])
+            scenes.discard(remove)
+            if add is not None:
+                scenes.add(add)
+            self._publish(scenes)
+
+    # --- obsws_python EventClient callbacks (matched by function name) ---
+
+    def on_scene_created(self, data) -> None:
+        if not getattr(data, "is_group", False):
+            self._edit(add=data.scene_name)
+
+    def on_scene_removed(self, data) -> None:
+        if not getattr(data, "is_group", False):
+            self._edit(remove=data.scene_name)
+
+    def on_scene_name_changed(self, data) -> None:
+        self._edit(remove=data.old_scene_name, add=data.scene_name)
+
+    def on_scene_list_changed(self, data) -> None:
+        with self._lock:
+            self._publish({s["sceneName"] for s in data.scenes})
+
+
+scene_catalog = SceneCatalog()
+
+
+class SceneItemIndex:
+    """(scene, source) → sceneItemId, so showing or hiding a source is one request.
+
+    SetSceneItemEnabled addresses a source by its numeric id in the scene,
+    which OBS otherwise hands out one GetSceneItemId round trip at a time.
+    load() fetches every scene's items in one RequestBatch, and once attached
+    to an event source SceneItemCreated/SceneItemRemoved and renames keep
+    the index current. A source the index lacks is looked up in OBS (see
+    resolve()), and remembered only while events keep the index live.
+
+    When a source appears in a scene more than once, the first item listed
+    stands for it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._items = {}   # type: dict[tuple[str, str], int]
+        self.live = False  # True once scene item events keep the index current
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def load(self, client: obs.ReqClient, scenes, mirror: "ObsMirror | None" = None) -> None:
+        """Index the items of *scenes* with one GetSceneItemList batch; with a
+        *mirror*, also tell it whether each item is visible."""
+        scenes = list(scenes)
+        since = mirror.events if mirror is not None else None
+        results = send_batch(client, [("GetSceneItemList", {"sceneName": s}) for s in scenes]) if scenes else []
+        listed = {}
+        for scene, result in zip(scenes, results):
+            if isinstance(result, Exception):
+                _log(_C.WARN, "obs", f"Could not list the sources of '{scene}': {result}")
+                continue
+            listed[scene] = result.get("sceneItems", ())
+        self.set_items(listed)
+        if mirror is not None:
+            mirror.seed_items(((scene, item["sceneItemId"], item["sceneItemEnabled"])
+                               for scene, items in listed.items() for item in items
+                               if "sceneItemEnabled" in item), since)
+
+    def set_items(self, listed: dict) -> None:
+        """Replace the index with scene → GetSceneItemList "sceneItems" lists."""
+        items = {}
+        for scene, scene_items in listed.items():
+            for item in scene_items:
+                items.setdefault((scene, item["sourceName"]), item["sceneItemId"])
+        with self._lock:
+            self._items = items
+
+    def lookup(self, scene: str, source: str) -> int | None:
+        """sceneItemId of *source* in *scene*, or None; never touches OBS."""
+        return self._items.get((scene, source))
+
+    def remember(self, scene: str, source: str, item_id: int) -> None:
+        """Record an id looked up in OBS, if scene item events will keep it current."""
+        if self.live:
+            with self._lock:
+                self._items.setdefault((scene, source), item_id)
+
+    def resolve(self, client: obs.ReqClient, scene: str, source: str) -> int:
+        """sceneItemId of *source* in *scene*, asking OBS only on an index miss.
+
+        Raises ObsRequestError (or ConnectionError) if OBS can't find it.
+        """
+        item_id = self._items.get((scene, source))
+        if item_id is None:
+            started = time.perf_counter_ns()
+            result = send_batch(client, [("GetSceneItemId", {"sceneName": scene, "sourceName": source})])[0]
+            latency.record("scene_item", started)
+            if isinstance(result, Exception):
+                raise result
+            item_id = result["sceneItemId"]
+            self.remember(scene, source, item_id)
+        return item_id
+
+    def attach(self, event_client) -> None:
+        """Subscribe to scene item events on an obsws_python EventClient."""
+        event_client.callback.register([
+            self.on_scene_item_created,
+            self.on_scene_item_removed,
+            self.on_scene_removed,
+            self.on_scene_name_changed,
+            self.on_input_name_changed,
+        ])
+        self.live = True
+
+    def _rename(self, old: str, new: str, field: int) -> None:
+        # Re-key entries whose scene (field 0) or source (field 1) was renamed
+        with self._lock:
+            for key in [k for k in self._items if k[field] == old]:
+                renamed = (new, key[1]) if field == 0 else (key[0], new)
+                self._items[renamed] = self._items.pop(key)
+
+    # --- obsws_python EventClient callbacks (matched by function name) ---
+
+    def on_scene_item_created(self, data) -> None:
+        with self._lock:
+            self._items.setdefault((data.scene_name, data.source_name), data.scene_item_id)
+
+    def on_scene_item_removed(self, data) -> None:
+        key = (data.scene_name, data.source_name)
+        with self._lock:
+            if self._items.get(key) == data.scene_item_id:
+                del self._items[key]
+
+    def on_scene_removed(self, data) -> None:
+        with self._lock:
+            for key in [k for k in self._items if k[0] == data.scene_name]:
+                del self._items[key]
+
+    def on_scene_name_changed(self, data) -> None:
+        # A scene can also be a source nested in other scenes
+        self._rename(data.old_scene_name, data.scene_name, 0)
+        self._rename(data.old_scene_name, data.scene_name, 1)
+
+    def on_input_name_changed(self, data) -> None:
+        self._rename(data.old_input_name, data.input_name, 1)
+
+
+scene_items = SceneItemIndex()
+
+
+# ---------------------------------------------------------------------------
+# OBS state mirror
+# ---------------------------------------------------------------------------
+
+# obs.Subs SCENES | INPUTS | TRANSITIONS | FILTERS | SCENEITEMS: the event
+# groups the scene catalog, scene item index and state mirror follow
+OBS_EVENT_SUBS = (1 << 2) | (1 << 3) | (1 << 4) | (1 << 5) | (1 << 7)
+
+_UNKNOWN = object()
+
+
+class ObsMirror:
+    """Shadow copy of the OBS state that playback writes, for skipping no-op writes.
+
+    Covers the program and preview scene, scene items' enabled flags,
+    filters' enabled flags and the current transition. It only believes OBS:
+    the scene list read by load() and the events that follow attach(), never
+    its own writes, so a change made in OBS itself, or a write OBS refused,
+    can't leave it wrong. Anything it hasn't been told is unknown, and writes
+    to it go out. So do writes to a value with a write of its own still
+    unconfirmed by an event, and every write while the attached connection
+    is down; a reconnect forgets everything, since events were missed.
+
+    redundant()/needed() are asked before each write, by whichever engine
+    sends it, for the client the mirror is attached to (other clients are
+    never skipped). ``saved`` counts the requests spared, ``saved_by_type``
+    splits them by request type.
+    """
+
+    # write request type → (state key of its requestData, field it sets)
+    WRITES = {
+        "SetCurrentProgramScene": (lambda d: ("program",), "sceneName"),
+        "SetCurrentPreviewScene": (lambda d: ("preview",), "sceneName"),
+        "SetSceneItemEnabled": (lambda d: ("item", d["sceneName"], d["sceneItemId"]), "sceneItemEnabled"),
+        "SetSourceFilterEnabled": (lambda d: ("filter", d["sourceName"], d["filterName"]), "filterEnabled"),
+        "SetCurrentSceneTransition": (lambda d: ("transition",), "transitionName"),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._client = None
+        self._epoch = 0
+        self._state = {}      # key → value OBS last reported
+        self._in_flight = {}  # key → value last written and not yet reported back
+        self.events = 0       # state events seen; see seed()
+        self.saved = 0
+        self.saved_by_type = {}  # type: dict[str, int]
+
+    def attach(self, event_client) -> None:
+        """Follow OBS state through *event_client*'s events and trust it for skipping."""
+        with self._lock:
+            self._client = event_client
+            self._epoch = getattr(event_client, "reconnects", 0)
+            self._state.clear()
+            self._in_flight.clear()
+        event_client.callback.register([
+            self.on_current_program_scene_changed,
+            self.on_current_preview_scene_changed,
+            self.on_scene_item_enable_state_changed,
+            self.on_source_filter_enable_state_changed,
+            self.on_current_scene_transition_changed,
+            self.on_scene_item_removed,
+            self.on_source_filter_removed,
+            self.on_source_filter_name_changed,
+            self.on_scene_removed,
+            self.on_scene_name_changed,
+            self.on_input_removed,
+            self.on_input_name_changed,
+        ])
+
+    def load(self, client: obs.ReqClient) -> None:
+        """Read the program and preview scene from OBS (after attach() and each reconnect)."""
+        since = self.events
+        resp = client.get_scene_list()
+        self.seed(resp.current_program_scene_name, getattr(resp, "current_preview_scene_name", None), since)
+
+    def seed(self, program: str | None, preview: str | None = None, since: int | None = None) -> None:
+        """Take the program/preview scene from a GetSceneList reply, unless an
+        event has arrived since the request went out (``events`` was *since*)."""
+        with self._lock:
+            if since is not None and self.events != since:
+                return
+            for key, value in ((("program",), program), (("preview",), preview)):
+                if value is not None and key not in self._in_flight:
+                    self._state[key] = value
+
+    def seed_items(self, items, since: int | None = None) -> None:
+        """Take scene items' enabled flags, (sceneName, sceneItemId, enabled)
+        triples from GetSceneItemList replies, on the same terms as seed()."""
+        with self._lock:
+            if since is not None and self.events != since:
+                return
+            for scene, item_id, enabled in items:
+                key = ("item", scene, item_id)
+                if key not in self._in_flight:
+                    self._state[key] = enabled
+
+    def item_enabled(self, client, scene: str, item_id: int) -> bool | None:
+        """Whether a scene item is (or is being made) visible, None if unknown."""
+        if not self._live(client):
+            return None
+        key = ("item", scene, item_id)
+        with self._lock:
+            value = self._in_flight.get(key, self._state.get(key))
+        return value if isinstance(value, bool) else None
+
+    def redundant(self, client, request_type: str, data: dict) -> bool:
+        """True (and counted) if OBS is known to be in the state *request_type*
+        would set already; otherwise the write is noted as in flight."""
+        write = self.WRITES.get(request_type)
+        if write is None or not self._live(client):
+            return False
+        key, field = write
+        try:
+            key, value = key(data), data[field]
+        except (KeyError, TypeError):
+            return False
+        with self._lock:
+            if key not in self._in_flight and self._state.get(key, _UNKNOWN) == value:
+                self.saved += 1
+                self.saved_by_type[request_type] = self.saved_by_type.get(request_type, 0) + 1
+                return True
+            self._in_flight[key] = value
+        return False
+
+    def needed(self, client, requests) -> list[int]:
+        """Indexes of the (requestType, requestData) pairs that aren't redundant()."""
+        return [i for i, (request_type, data) in enumerate(requests)
+                if not self.redundant(client, request_type, data)]
+
+    def _live(self, client) -> bool:
+        if client is not self._client or self._client is None:
+            return False
+        if getattr(client, "connected", True) and getattr(client, "reconnects", 0) == self._epoch:
+            return True
+        with self._lock:
+            self._state.clear()
+            self._in_flight.clear()
+            if getattr(client, "connected", True):
+                self._epoch = client.reconnects
+        return False
+
+    def report(self) -> None:
+        if self.saved:
+            split = ", ".join(f"{n} {t}" for t, n in sorted(self.saved_by_type.items()))
+            _log(_C.INFO, "obs", f"Skipped {self.saved} redundant OBS requests ({split})")
+
+    def _set(self, key: tuple, value) -> None:
+        with self._lock:
+            self.events += 1
+            self._state[key] = value
+            if key in self._in_flight and self._in_flight[key] == value:
+                del self._in_flight[key]
+
+    def _forget(self, name: str, kinds=("item", "filter")) -> None:
+        # A renamed or removed scene/source: drop what was keyed by its name
+        with self._lock:
+            self.events += 1
+            for table in (self._state, self._in_flight):
+                for key in [k for k in table if k[0] in kinds and k[1] == name]:
+                    del table[key]
+
+    # --- obsws_python EventClient callbacks (matched by function name) ---
+
+    def on_current_program_scene_changed(self, data) -> None:
+        self._set(("program",), data.scene_name)
+
+    def on_current_preview_scene_changed(self, data) -> None:
+        self._set(("preview",), data.scene_name)
+
+    def on_scene_item_enable_state_changed(self, data) -> None:
+        self._set(("item", data.scene_name, data.scene_item_id), data.scene_item_enabled)
+
+    def on_source_filter_enable_state_changed(self, data) -> None:
+        self._set(("filter", data.source_name, data.filter_name), data.filter_enabled)
+
+    def on_current_scene_transition_changed(self, data) -> None:
+        self._set(("transition",), data.transition_name)
+
+    def on_scene_item_removed(self, data) -> None:
+        with self._lock:
+            self.events += 1
+            self._state.pop(("item", data.scene_name, data.scene_item_id), None)
+
+    def on_source_filter_removed(self, data) -> None:
+        with self._lock:
+            self.events += 1
+            self._state.pop(("filter", data.source_name, data.filter_name), None)
+
+    def on_source_filter_name_changed(self, data) -> None:
+        with self._lock:
+            self.events += 1
+            self._state.pop(("filter", data.source_name, data.old_filter_name), None)
+
+    def on_scene_removed(self, data) -> None:
+        self._forget(data.scene_name)
+
+    def on_scene_name_changed(self, data) -> None:
+        # The program/preview scene keeps going under its new name; OBS sends
+        # no separate change event for that
+        self._forget(data.old_scene_name)
+        with self._lock:
+            for key in (("program",), ("preview",)):
+                if self._state.get(key) == data.old_scene_name:
+                    self._state[key] = data.scene_name
+
+    def on_input_removed(self, data) -> None:
+        self._forget(data.input_name, ("filter",))
+
+    def on_input_name_changed(self, data) -> None:
+        self._forget(data.old_input_name, ("filter",))
+
+
+obs_mirror = ObsMirror()
+
+
+def _spread_results(results: list, keep: list[int], count: int) -> list:
+    """Place the results of the requests actually sent (indexes *keep*) among
+    *count*; skipped redundant requests read as a success with no data."""
+    out = [{} for _ in range(count)]
+    for i, result in zip(keep, results):
+        out[i] = result
+    return out
+
+
+# ---------------------------------------------------------------------------
+# OBS request batches
+# ---------------------------------------------------------------------------
+# An action can list extra OBS requests (filter toggles, source visibility,
+# …) under "requests". They travel in one RequestBatch with the action's
+# scene switch: one round trip instead of one per request, and with
+# "serial_frame" execution OBS applies them all in the same frame.
+
+BATCH_EXECUTION_TYPES = {"serial_realtime": 0, "serial_frame": 1, "parallel": 2}
+_batch_ids = itertools.count(1)
+
+
+class ObsRequestError(Exception):
+    """An OBS request completed with requestStatus.result == false."""
+
+    def __init__(self, request_type: str, code: int, comment: str | None):
+        super().__init__(f"{request_type} failed with code {code}: {comment}")
+        self.request_type = request_type
+        self.code = code
+        self.comment = comment
+
+
+def _batch_payload(request_id: str, requests, execution: str | None, halt_on_failure: bool) -> dict:
+    execution = execution or OBS_BATCH_EXECUTION
+    if execution not in BATCH_EXECUTION_TYPES:
+        raise ValueError(f"Unknown batch execution '{execution}' (expected one of {tuple(BATCH_EXECUTION_TYPES)})")
+    return {"op": 8, "d": {
+        "requestId": request_id,
+        "haltOnFailure": halt_on_failure,
+        "executionType": BATCH_EXECUTION_TYPES[execution],
+        "requests": [{"requestType": t, "requestData": d} if d else {"requestType": t}
+                     for t, d in requests],
+    }}
+
+
+def _batch_results(results: list[dict]) -> list:
+    """responseData dict (empty if none) or ObsRequestError for each batch result."""
+    out = []
+    for r in results:
+        status = r["requestStatus"]
+        if status["result"]:
+            out.append(r.get("responseData") or {})
+        else:
+            out.append(ObsRequestError(r["requestType"], status["code"], status.get("comment")))
+    return out
+
+
+def send_batch(client: obs.ReqClient, requests, execution: str | None = None,
+               halt_on_failure: bool = False) -> list:
+    """Send *requests* ((requestType, requestData) pairs) as one RequestBatch.
+
+    An ObsConnection sends it itself. obsws_python has no batch call, so for
+    a ReqClient this speaks op 8/9 on its socket directly; like every
+    ReqClient call it must only be used from one thread at a time. Returns
+    one result per request (see _batch_results).
+    """
+    if isinstance(client, ObsConnection):
+        return client.request_batch(requests, execution, halt_on_failure)
+    request_id = f"batch-{next(_batch_ids)}"
+    ws = client.base_client.ws
+    payload = _batch_payload(request_id, requests, execution, halt_on_failure)
+    sent = time.perf_counter_ns()
+    ws.send(json.dumps(payload))
+    while True:
+        msg = json.loads(ws.recv())
+        if msg.get("op") == 9 and msg["d"].get("requestId") == request_id:
+            recorder.request(payload["d"], msg["d"], sent)
+            return _batch_results(msg["d"]["results"])
+
+
+# ---------------------------------------------------------------------------
+# Loop styles
+# ---------------------------------------------------------------------------
+# Each loop style is a LoopStyle subclass registered in LOOP_STYLES. The
+# scene order is arranged once per scene set, and a fresh instance picks one
+# scene per tick in O(1), however many scenes match the prefix.
+
+# Source of random scene picks and shuffle orders. Separate from the global
+# ``random`` (obsws_python draws request ids from it), so seeding it (see
+# SessionRecorder) makes random styles repeat exactly. A loop with a "seed"
+# uses its own generator instead.
+playback_random = random.Random()
+
+# Style name → LoopStyle subclass, filled in by @loop_style
+LOOP_STYLES = {}
+
+_UNPICKED = object()
+
+
+def loop_style(name: str):
+    """Class decorator registering a LoopStyle under *name*."""
+    def register(cls):
+        cls.name = name
+        LOOP_STYLES[name] = cls
+        return cls
+    return register
+
+
+def loop_random(seed: int | None) -> random.Random:
+    """The generator a loop draws from: its own for a *seed*, else playback_random."""
+    return playback_random if seed is None else random.Random(seed)
+
+
+class LoopStyle:
+    """How a loop arranges its scenes and picks one per tick.
+
+    order() arranges the scenes matching the prefix; SceneCatalog caches the
+    result unless the style is *fresh*. One instance then plays one run of
+    the loop: next() returns the scene for the coming tick, or None to hold
+    the current one for that tick. peek() looks at it early (for preview
+    look-ahead) and next() returns the same scene. Subclasses override
+    _choose(), and skip() if they keep their own position.
+    """
+
+    name = ""
+    fresh = False   # arrange anew every time the loop starts
+    once = False    # one pass, then hold; max_repeats does not apply
+
+    def __init__(self, sequence, rng: random.Random | None = None, options: dict | None = None):
+        self.sequence = sequence
+        self.rng = rng or playback_random
+        self.options = options or {}
+        self.ticks = 0       # ticks played (or skipped) so far
+        self.last = None     # scene last switched to
+        self._next = _UNPICKED
+
+    @classmethod
+    def order(cls, scenes: list[str], rng: random.Random | None = None) -> list[str]:
+        """Arrange the scenes matching a loop's prefix into its playback order."""
+        return list(scenes)
+
+    @classmethod
+    def compile_options(cls, entry: dict, where: str) -> dict:
+        """Validate this style's own keys of a loop action; raises ConfigError."""
+        return {}
+
+    def finished(self, max_repeats: int | None = None) -> bool:
+        """True once a run is over: after one pass for *once*, else after
+        *max_repeats* passes (a pass being one tick per scene)."""
+        if self.once:
+            return self.ticks >= len(self.sequence)
+        return max_repeats is not None and self.ticks // len(self.sequence) >= max_repeats
+
+    def peek(self) -> str | None:
+        if self._next is _UNPICKED:
+            self._next = self._choose()
+        return self._next
+
+    def next(self) -> str | None:
+        scene = self.peek()
+        self._next = _UNPICKED
+        self.ticks += 1
+        if scene is not None:
+            self.last = scene
+        return scene
+
+    def skip(self, count: int) -> None:
+        """Pass over *count* late ticks (see LATE_TICK_POLICY)."""
+        self.ticks += count
+        self._next = _UNPICKED
+
+    def _choose(self) -> str | None:
+        return self.sequence[self.ticks % len(self.sequence)]
+
+
+class _AliasTable:
+    """Walker's alias method: a weighted choice of an index in O(1)."""
+    __slots__ = ("prob", "alias")
+
+    def __init__(self, weights: list[float]):
+        count = len(weights)
+        total = sum(weights)
+        scaled = [w * count / total for w in weights] if total > 0 else [1.0] * count
+        self.prob = [1.0] * count
+        self.alias = list(range(count))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.prob[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            (small if scaled[more] < 1.0 else large).append(more)
+
+    def pick(self, rng: random.Random) -> int:
+        i = rng.randrange(len(self.prob))
+        return i if rng.random() < self.prob[i] else self.alias[i]
+
+
+def _other_than(sequence, index: dict, last, rng: random.Random):
+    # A random scene other than *last*, in O(1): draw from every slot but
+    # last's, then step over it
+    if last is None or len(sequence) < 2:
+        return rng.choice(sequence)
+    i = rng.randrange(len(sequence) - 1)
+    return sequence[i + 1 if i >= index[last] else i]
+
+
+def _scene_weights(entry: dict, key: str, where: str) -> dict:
+    weights = entry.get(key, {})
+    if not isinstance(weights, dict) or not all(_number(w) and w >= 0 for w in weights.values()):
+        raise ConfigError(f"{where}: '{key}' must be an object of scene name → weight >= 0")
+    return weights
+
+
+def _whole(entry: dict, key: str, default: int, where: str, least: int = 1) -> int:
+    value = entry.get(key, default)
+    if isinstance(value, bool) or not isinstance(value, int) or value < least:
+        raise ConfigError(f"{where}: '{key}' must be a whole number >= {least}, got {value!r}")
+    return value
+
+
+@loop_style("cycle")
+class CycleStyle(LoopStyle):
+    """Forward loop: 1, 2, 3, 1, 2, 3 …"""
+
+
+@loop_style("bounce")
+class BounceStyle(LoopStyle):
+    """Ping-pong: 1, 2, 3, 2, 1, 2, 3 …"""
+
+    @classmethod
+    def order(cls, scenes, rng=None):
+        return scenes + scenes[-2:0:-1] if len(scenes) > 2 else list(scenes)
+
+
+@loop_style("reverse")
+class ReverseStyle(LoopStyle):
+    """Backward loop: 3, 2, 1, 3, 2, 1 …"""
+
+    @classmethod
+    def order(cls, scenes, rng=None):
+        return list(reversed(scenes))
+
+
+@loop_style("once")
+class OnceStyle(LoopStyle):
+    """Play forward, then hold on the last scene."""
+    once = True
+
+    def skip(self, count):
+        seq_len = len(self.sequence)
+        self.ticks = min(self.ticks + count, seq_len - 1) if self.ticks < seq_len else self.ticks + count
+        self._next = _UNPICKED
+
+
+@loop_style("random")
+class RandomStyle(LoopStyle):
+    """A random scene each tick."""
+
+    def skip(self, count):
+        self.ticks += count   # any pick already staged in preview is as good as a new one
+
+    def _choose(self):
+        return self.rng.choice(self.sequence)
+
+
+@loop_style("random_no_repeat")
+class RandomNoRepeatStyle(RandomStyle):
+    """Random, never the same scene twice in a row."""
+
+    def __init__(self, sequence, rng=None, options=None):
+        super().__init__(sequence, rng, options)
+        self._index = {scene: i for i, scene in enumerate(sequence)}
+
+    def _choose(self):
+        return _other_than(self.sequence, self._index, self.last, self.rng)
+
+
+@loop_style("strobe")
+class StrobeStyle(LoopStyle):
+    """Alternate between the first and last scene."""
+
+    @classmethod
+    def order(cls, scenes, rng=None):
+        return [scenes[0], scenes[-1]] if len(scenes) >= 2 else list(scenes)
+
+
+@loop_style("shuffle")
+class ShuffleStyle(LoopStyle):
+    """Shuffle the order each time the loop starts, then cycle it."""
+    fresh = True
+
+    @classmethod
+    def order(cls, scenes, rng=None):
+        shuffled = list(scenes)
+        (rng or playback_random).shuffle(shuffled)
+        return shuffled
+
+
+@loop_style("weighted")
+class WeightedStyle(RandomStyle):
+    """Random, favouring scenes by their "weights" (scene name → weight, default 1)."""
+
+    def __init__(self, sequence, rng=None, options=None):
+        super().__init__(sequence, rng, options)
+        weights = self.options.get("weights", {})
+        self._table = _AliasTable([weights.get(scene, 1) for scene in sequence])
+
+    @classmethod
+    def compile_options(cls, entry, where):
+        return {"weights": _scene_weights(entry, "weights", where)}
+
+    def _choose(self):
+        return self.sequence[self._table.pick(self.rng)]
+
+
+@loop_style("markov")
+class MarkovStyle(RandomStyle):
+    """A Markov chain: "transitions" maps a scene to the weights of the scenes
+    that may follow it. Scenes without a row move to any other scene."""
+
+    def __init__(self, sequence, rng=None, options=None):
+        super().__init__(sequence, rng, options)
+        self._index = {scene: i for i, scene in enumerate(sequence)}
+        self._rows = {}   # scene → (alias table, the scenes it picks from)
+        for scene, row in self.options.get("transitions", {}).items():
+            targets = [s for s in row if s in self._index and row[s] > 0]
+            if scene in self._index and targets:
+                self._rows[scene] = (_AliasTable([row[s] for s in targets]), targets)
+
+    @classmethod
+    def compile_options(cls, entry, where):
+        transitions = entry.get("transitions", {})
+        if not isinstance(transitions, dict):
+            raise ConfigError(f"{where}: 'transitions' must be an object of scene name → {{scene name: weight}}")
+        return {"transitions": {scene: _scene_weights(transitions, scene, f"{where} transitions")
+                                for scene in transitions}}
+
+    def _choose(self):
+        row = self._rows.get(self.last)
+        if row is None:
+            return _other_than(self.sequence, self._index, self.last, self.rng)
+        table, targets = row
+        return targets[table.pick(self.rng)]
+
+
+@loop_style("euclid")
+class EuclidStyle(LoopStyle):
+    """A Euclidean rhythm: "pulses" switches spread as evenly as possible over
+    every "length" ticks (default 3 in 8), holding the scene between them."""
+
+    @classmethod
+    def compile_options(cls, entry, where):
+        length = _whole(entry, "length", 8, where)
+        pulses = _whole(entry, "pulses", 3, where)
+        if pulses > length:
+            raise ConfigError(f"{where}: 'pulses' ({pulses}) cannot be more than 'length' ({length})")
+        return {"pulses": pulses, "length": length}
+
+    def __init__(self, sequence, rng=None, options=None):
+        super().__init__(sequence, rng, options)
+        self._pulses = self.options.get("pulses", 3)
+        self._length = self.options.get("length", 8)
+        self._position = 0   # index of the scene the next pulse plays
+
+    def _pulse(self, tick: int) -> bool:
+        return (tick * self._pulses) % self._length < self._pulses
+
+    def next(self):
+        scene = super().next()
+        if scene is not None:
+            self._position += 1
+        return scene
+
+    def skip(self, count):
+        self._position += sum(map(self._pulse, range(self.ticks, self.ticks + count)))
+        super().skip(count)
+
+    def _choose(self):
+        if not self._pulse(self.ticks):
+            return None
+        return self.sequence[self._position % len(self.sequence)]
+
+
+@loop_style("fibonacci")
+class FibonacciStyle(LoopStyle):
+    """Skip ahead by the Fibonacci numbers, wrapping round: scenes 1, 2, 3, 5, 8, 13 …"""
+
+    def __init__(self, sequence, rng=None, options=None):
+        super().__init__(sequence, rng, options)
+        self._position = 0
+        self._steps = (1, 1)   # the next two skips, modulo the scene count
+
+    def _advance(self) -> None:
+        step, after = self._steps
+        self._position = (self._position + step) % len(self.sequence)
+        self._steps = (after, (step + after) % len(self.sequence))
+
+    def next(self):
+        scene = super().next()
+        self._advance()
+        return scene
+
+    def skip(self, count):
+        for _ in range(count):
+            self._advance()
+        super().skip(count)
+
+    def _choose(self):
+        return self.sequence[self._position]
+
+
+def build_sequence(scenes: list[str], style: str, rng: random.Random | None = None) -> list[str]:
+    """Build the playback sequence from a list of scenes and a loop style."""
+    return LOOP_STYLES[style].order(scenes, rng)
+
+
+# ---------------------------------------------------------------------------
+# Persistent OBS connection
+# ---------------------------------------------------------------------------
+
+def _identify_payload(hello: dict, password: str, subs: int) -> dict:
+    """The Identify ("d" of op 1) answering OBS's Hello, authenticated if it asks."""
+    identify = {"rpcVersion": 1, "eventSubscriptions": subs}
+    auth = hello.get("authentication")
+    if auth:
+        secret = base64.b64encode(hashlib.sha256((password + auth["salt"]).encode()).digest())
+        identify["authentication"] = base64.b64encode(
+            hashlib.sha256(secret + auth["challenge"].encode()).digest()).decode()
+    return identify
+
+
+def _settle(future, result=None, error: Exception | None = None) -> None:
+    # The reader, a failed send and a dropped connection can race to settle a future
+    from concurrent.futures import InvalidStateError
+    try:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass
+
+
+# What ObsConnection answers for a program scene switch it only kept for the
+# reconnect: nothing reached OBS, so there is no round trip to time
+DEFERRED = types.MappingProxyType({})
+
+
+class ObsConnection:
+    """Self-healing obs-websocket v5 client for the threaded engine.
+
+    Stands in for obsws_python's ReqClient (the calls this module makes) and
+    EventClient (events reach ``callback`` as with AsyncObsClient) over one
+    socket:
+
+    - every request carries a requestId and a reader thread matches it to
+      its response, so any number of requests, from any thread, can be in
+      flight at once
+    - OBS_HEARTBEAT seconds of silence draw a ping; a second silent interval
+      counts as a dead connection
+    - a lost connection is re-opened and re-identified in the background,
+      backing off exponentially. Meanwhile requests fail fast with
+      ConnectionError, except program scene switches: only the latest is
+      kept, and sent on reconnect (``coalesced`` counts the dropped ones)
+    - ``on_reconnect`` callables run after each reconnect, on their own thread
+    """
+
+    BACKOFF_MIN = 0.25
+    BACKOFF_MAX = 8.0
+
+    def __init__(self, host: str | None = None, port: int | None = None, password: str | None = None,
+                 subs: int | None = None, timeout: float = 5.0, heartbeat: float | None = None):
+        from obsws_python.callback import Callback
+        self.host = OBS_HOST if host is None else host
+        self.port = OBS_PORT if port is None else port
+        self.password = OBS_PASSWORD if password is None else password
+        self.subs = int(obs.Subs.SCENES if subs is None else subs)
+        self.timeout = timeout
+        self.heartbeat = OBS_HEARTBEAT if heartbeat is None else heartbeat
+        self.callback = Callback()
+        self.on_reconnect = []
+        self.reconnects = 0
+        self.coalesced = 0
+        self._ws = None
+        self._ids = itertools.count(1)
+        self._pending = {}   # requestId → concurrent.futures.Future
+        self._intent = None  # latest program scene asked for while disconnected
+        self._lock = threading.Lock()
+        self._connected = threading.Event()
+        self._closed = threading.Event()
+        self._thread = None
+
+    @property
+    def connected(self) -> bool:
+        return self._connected.is_set()
+
+    def connect(self) -> "ObsConnection":
+        """Connect and identify (raising if OBS can't be reached), then keep the connection up."""
+        self._open()
+        self._thread = threading.Thread(target=self._run, name="obs-connection", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        self._closed.set()
+        ws = self._ws
+        if ws is not None:
+            try:
+                ws.send_close()   # the reader stops at OBS's answering close frame
+            except Exception:
+                ws.shutdown()
+        if self._thread is not None:
+            self._thread.join()
+
+    # --- requests ---
+
+    def _send(self, request_type: str, data: dict | None = None):
+        # Future of the response's "d" (op 7); ConnectionError if OBS is unreachable
+        payload = {"requestType": request_type, "requestId": f"c{next(self._ids)}"}
+        if data:
+            payload["requestData"] = data
+        return self._submit({"op": 6, "d": payload})
+
+    def request(self, request_type: str, data: dict | None = None) -> dict:
+        """Send one request and return its responseData (empty if none)."""
+        d = self._wait(self._send(request_type, data), request_type)
+        status = d["requestStatus"]
+        if not status["result"]:
+            raise ObsRequestError(request_type, status["code"], status.get("comment"))
+        return d.get("responseData") or {}
+
+    def request_batch(self, requests, execution: str | None = None,
+                      halt_on_failure: bool = False) -> list:
+        """Send (requestType, requestData) pairs as one RequestBatch (see send_batch).
+
+        While disconnected, a leading program scene switch is kept as the
+        latest intent (see set_current_program_scene), answered with DEFERRED,
+        and the rest fail.
+        """
+        requests = tuple(requests)
+        if not self.connected and requests and requests[0][0] == "SetCurrentProgramScene":
+            self._keep_intent(requests[0][1]["sceneName"])
+            return [DEFERRED] + [ConnectionError("OBS is not connected")] * (len(requests) - 1)
+        payload = _batch_payload(f"c{next(self._ids)}", requests, execution, halt_on_failure)
+        return _batch_results(self._wait(self._submit(payload), "RequestBatch")["results"])
+
+    def get_version(self):
+        from obsws_python.util import as_dataclass
+        return as_dataclass("GetVersion", self.request("GetVersion"))
+
+    def get_scene_list(self):
+        from obsws_python.util import as_dataclass
+        return as_dataclass("GetSceneList", self.request("GetSceneList"))
+
+    def set_current_program_scene(self, name: str):
+        """Switch the program scene, or while disconnected, switch to it on
+        reconnect and return DEFERRED."""
+        if self.connected:
+            try:
+                self.request("SetCurrentProgramScene", {"sceneName": name})
+                return None
+            except ConnectionError:
+                pass
+        self._keep_intent(name)
+        return DEFERRED
+
+    def set_current_preview_scene(self, name: str) -> None:
+        """Stage *name* in studio mode's preview; skipped while disconnected."""
+        if self.connected:
+            self.request("SetCurrentPreviewScene", {"sceneName": name})
+
+    def _submit(self, message: dict):
+        from concurrent.futures import Future
+        request_id = message["d"]["requestId"]
+        future = Future()
+        with self._lock:
+            ws = self._ws
+            if not self._connected.is_set():
+                future.set_exception(ConnectionError("OBS is not connected"))
+                return future
+            self._pending[request_id] = future
+        sent = time.perf_counter_ns()
+        try:
+            ws.send(json.dumps(message))
+        except Exception as e:
+            with self._lock:
+                self._pending.pop(request_id, None)
+            _settle(future, error=ConnectionError(f"OBS connection lost: {e}"))
+            return future
+        if recorder.recording:
+            future.add_done_callback(
+                lambda f: f.exception() is None and recorder.request(message["d"], f.result(), sent))
+        return future
+
+    def _wait(self, future, label: str) -> dict:
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            # A late response still finds and discards the pending entry
+            raise TimeoutError(f"{label} timed out") from None
+
+    def _keep_intent(self, scene: str) -> None:
+        with self._lock:
+            first = self._intent is None
+            if not first:
+                self.coalesced += 1
+            self._intent = scene
+        if first:
+            _log(_C.WARN, "obs", "OBS is offline – the latest scene will be switched to on reconnect")
+        if self.connected:
+            # Reconnected while this was being stored
+            self._flush_intent()
+
+    def _flush_intent(self) -> None:
+        with self._lock:
+            scene, self._intent = self._intent, None
+        if scene is not None:
+            _log(_C.OBS, "obs", "Switching to %s, the latest scene asked for while offline", scene)
+            self._send("SetCurrentProgramScene", {"sceneName": scene})
+
+    # --- connection ---
+
+    def _open(self) -> None:
+        import websocket
+        ws = websocket.create_connection(f"ws://{self.host}:{self.port}", timeout=self.timeout,
+                                         enable_multithread=True)
+        try:
+            hello = json.loads(ws.recv())["d"]
+            ws.send(json.dumps({"op": 1, "d": _identify_payload(hello, self.password, self.subs)}))
+            reply = json.loads(ws.recv())
+        except (websocket.WebSocketException, ValueError, KeyError):
+            # OBS hung up mid-handshake (still starting, or a wrong password)
+            reply = {}
+        if reply.get("op") != 2 or self._closed.is_set():
+            ws.shutdown()
+            raise ConnectionError("OBS did not identify the client (check the password)")
+        ws.settimeout(self.heartbeat)
+        with self._lock:
+            self._ws = ws
+            self._connected.set()
+
+    def _run(self) -> None:
+        while True:
+            self._read()
+            self._drop()
+            if self._closed.is_set():
+                return
+            _log(_C.WARN, "obs", "Lost the connection to OBS – reconnecting …")
+            if not self._reopen():
+                return
+
+    def _reopen(self) -> bool:
+        """Reconnect with backoff; returns False if closed first."""
+        backoff = self.BACKOFF_MIN
+        while not self._closed.is_set():
+            try:
+                self._open()
+            except Exception as e:
+                _log(_C.DIM, "obs", "Reconnect failed (%s), retrying in %gs", e, backoff)
+                self._closed.wait(backoff)
+                backoff = min(backoff * 2, self.BACKOFF_MAX)
+                continue
+            self.reconnects += 1
+            _log(_C.OBS, "obs", "Reconnected to OBS")
+            self._flush_intent()
+            if self.on_reconnect:
+                threading.Thread(target=self._reconnected, name="obs-reconnected", daemon=True).start()
+            return True
+        return False
+
+    def _reconnected(self) -> None:
+        for hook in self.on_reconnect:
+            try:
+                hook()
+            except Exception as e:
+                _log(_C.ERR, "obs", f"Reconnect hook failed: {e}")
+
+    def _read(self) -> None:
+        """Dispatch frames until the socket fails, closes or stays silent through a ping."""
+        import websocket
+        ws = self._ws
+        pinged = False
+        while True:
+            try:
+                opcode, frame = ws.recv_data_frame(True)
+            except websocket.WebSocketTimeoutException:
+                if pinged:
+                    _log(_C.WARN, "obs", "OBS stopped answering (no pong within %gs)", self.heartbeat)
+                    return
+                pinged = True
+                try:
+                    ws.ping()
+                except Exception:
+                    return
+                continue
+            except Exception:
+                return
+            pinged = False
+            if opcode == websocket.ABNF.OPCODE_CLOSE:
+                return
+            if opcode != websocket.ABNF.OPCODE_TEXT:
+                continue
+            msg = json.loads(frame.data)
+            op, d = msg.get("op"), msg.get("d", {})
+            if op in (7, 9):
+                with self._lock:
+                    future = self._pending.pop(d.get("requestId"), None)
+                if future is not None:
+                    _settle(future, d)
+            elif op == 5:
+                try:
+                    self.callback.trigger(d["eventType"], d.get("eventData") or {})
+                except Exception as e:
+                    _log(_C.ERR, "obs", f"Error handling {d.get('eventType')} event: {e}")
+
+    def _drop(self) -> None:
+        with self._lock:
+            self._connected.clear()
+            ws, self._ws = self._ws, None
+            pending, self._pending = self._pending, {}
+        # Not ws.close(): that waits on a peer which may be gone, and does
+        # nothing at all once the peer has closed
+        ws.shutdown()
+        for future in pending.values():
+            _settle(future, error=ConnectionError("OBS connection lost"))
+
+
+# ---------------------------------------------------------------------------
+# Playback programs
+# ---------------------------------------------------------------------------
+# Loops and sequences are written once, as generators that yield commands,
+# and run by an engine-specific driver (Lanes for the threaded engine,
+# AsyncEngine._drive for the asyncio one):
+#
+#   ("scene", name)    switch the program scene; the reply is None, or the
+#                      exception raised by OBS
+#   ("batch", requests) send (requestType, requestData) pairs as one
+#                      RequestBatch; the reply is a list with a responseData
+#                      dict or ObsRequestError per request, or the exception
+#                      that failed the whole batch
+#   ("wait", seconds)  sleep, interruptibly
+#   ("order", (prefix, style))  reply with the playback order of a *style*
+#                      loop over prefix (cached by the scene catalog)
+#   ("pause", note)    hold until *note* resumes the program
+#   ("hold", source)   hold until source.when_running(callback) calls back
+#                      (e.g. a MidiClock whose transport is stopped)
+#   ("preview", name)  stage a scene in studio mode's preview; the reply is
+#                      None, or the exception raised by OBS
+#   ("timeline", clock) the loop now playing keeps time with clock; quantized
+#                      launches on the lane land on its boundaries
+#
+# Cancelling a program closes the generator, so its finally/except
+# GeneratorExit blocks run on every engine.
+
+def switch_program(scene: str, requests=()):
+    """Switch to *scene*, batching *requests* with it; returns the switch's error or None.
+
+    Used with ``yield from`` inside other programs.
+    """
+    if not requests:
+        return (yield "scene", scene)
+    results = yield "batch", (("SetCurrentProgramScene", {"sceneName": scene}),) + tuple(requests)
+    if isinstance(results, Exception):
+        return results
+    for result in results[1:]:
+        if isinstance(result, Exception):
+            _log(_C.WARN, "obs", "%s", result)
+    return results[0] if isinstance(results[0], Exception) else None
+
+
+def _wait_for_tick(clock, wait, lead: float = 0.0):
+    """Wait out *wait* and whatever clock.pending(lead) asks for after it."""
+    while wait != 0:
+        if wait is None:
+            # Clock source stopped: keep the scene until it runs again
+            yield "hold", clock.midi_clock
+        else:
+            yield "wait", wait
+        wait = clock.pending(lead)
+
+
+def loop_program(sequence: list[str], tick: float, style: str, max_repeats=None,
+                 clock: TickClock | None = None, requests=(), lookahead: float | None = None,
+                 seed: int | None = None, options: dict | None = None, beats: float | None = None):
+    """Cycle through *sequence* until cancelled or max_repeats reached.
+
+    One "repeat" = one full pass through the sequence list.
+    If max_repeats is None, loops forever (until cancelled).
+    Scenes are picked by the *style*'s LoopStyle (with *options*, its own
+    config keys), drawing from its own generator when given a *seed*.
+    Scene switches are scheduled against *clock* (by default a fresh
+    TickClock of *beats* beats per tick), so they stay on the beat grid
+    however long OBS takes to respond.
+    Extra OBS *requests* are batched with the first switch.
+    With a *lookahead* (seconds, default PREVIEW_LOOKAHEAD_MS), each next
+    scene is put in preview that long before its switch.
+    """
+    picker = LOOP_STYLES[style](sequence, loop_random(seed), options)
+    clock = clock or TickClock(tick, beats=beats)
+    lead = PREVIEW_LOOKAHEAD_MS / 1000 if lookahead is None else lookahead
+
+    _log(_C.SCENE, "loop", "Starting %s loop – %d steps, tick=%ss%s", style, len(sequence), tick,
+         f", repeats={max_repeats}" if max_repeats is not None else "")
+    yield "timeline", clock
+    try:
+        while True:
+            skipped = clock.fire()
+            if skipped:
+                _log(_C.WARN, "loop", "Fell %d tick(s) behind – skipping ahead", skipped)
+                picker.skip(skipped)
+
+            if picker.finished(max_repeats):
+                if picker.once:
+                    _log(_C.SCENE, "loop", "Finished (once) – holding on %s", picker.last)
+                else:
+                    _log(_C.SCENE, "loop", "Completed %d repeat(s).", max_repeats)
+                break
+
+            scene = picker.next()
+            if scene is not None:
+                _log(_C.SCENE, "loop", "→ %s", scene)
+                error = yield from switch_program(scene, requests)
+                requests = ()
+                if error is not None:
+                    raise error
+            if not lead:
+                yield from _wait_for_tick(clock, clock.remaining())
+                continue
+            yield from _wait_for_tick(clock, clock.remaining(lead), lead)
+            staged = None if picker.finished(max_repeats) else picker.peek()
+            if staged is not None:
+                error = yield "preview", staged
+                if error is not None:
+                    _log(_C.WARN, "loop", "Preview look-ahead off for this loop "
+                         "(is studio mode on?): %s", error)
+                    lead = 0.0
+            yield from _wait_for_tick(clock, clock.left())
+    finally:
+        _log(_C.DIM, "loop", "Stopped. (%s)", clock.stats)
+
+
+def prefix_loop_program(prefix: str, style: str, tick: float, requests=(), beats: float | None = None,
+                        seed: int | None = None, options: dict | None = None):
+    """Look up the scenes matching *prefix*, then loop over them forever.
+
+    With *beats* and MIDI_CLOCK_SYNC the loop follows the external MIDI clock.
+    """
+    sequence = yield "order", (prefix, style, seed)
+    if not sequence:
+        _log(_C.WARN, "warn", "No scenes found with prefix '%s'", prefix)
+        return
+    _log(_C.INFO, "info", "Scene order: %s (style=%s, tick=%ss)", list(sequence), style, tick)
+    yield from loop_program(sequence, tick, style, clock=beat_clock(beats), requests=requests,
+                            seed=seed, options=options, beats=beats)
+
+
+def static_program(scene_name: str, requests=()):
+    """Switch to a single static scene, with any extra OBS *requests* in the same batch."""
+    _log(_C.SCENE, "static", "Switching to scene: %s", scene_name)
+    error = yield from switch_program(scene_name, requests)
+    if error is not None:
+        _log(_C.ERR, "static", "Failed to switch to '%s': %s", scene_name, error)
+
+
+def source_program(scene: str, source: str, mode: str = "toggle", tick: float | None = None,
+                   beats: float | None = None, flashes: int | None = None):
+    """Show, hide, toggle or strobe *source* inside *scene* (see SOURCE_MODES).
+
+    The source's sceneItemId comes from scene_items (the "item" command),
+    so every change of visibility is a single SetSceneItemEnabled request.
+    A strobe changes it every *tick* seconds, or every *beats* beats of
+    the MIDI clock under MIDI_CLOCK_SYNC, starting with "on"; with
+    *flashes* it ends hidden after that many, otherwise it runs until
+    replaced.
+    """
+    item_id = yield "item", (scene, source)
+    if isinstance(item_id, Exception):
+        _log(_C.ERR, "source", "No source '%s' in scene '%s': %s", source, scene, item_id)
+        return
+    if mode == "toggle":
+        enabled = yield "enabled", (scene, item_id)
+        if isinstance(enabled, Exception):
+            _log(_C.ERR, "source", "Could not read whether '%s' is shown: %s", source, enabled)
+            return
+        mode = "hide" if enabled else "show"
+    if mode != "strobe":
+        _log(_C.SCENE, "source", "%s %s in %s", mode.capitalize(), source, scene)
+        results = yield "batch", (_item_request(scene, item_id, mode == "show"),)
+        if not isinstance(results, Exception):
+            results = results[0]
+        if isinstance(results, Exception):
+            _log(_C.ERR, "source", "Failed to %s '%s': %s", mode, source, results)
+        return
+
+    clock = beat_clock(beats) or TickClock(tick, beats=beats)
+    shown = False
+    changes = 0
+    _log(_C.SCENE, "source", "Strobing %s in %s – tick=%ss%s", source, scene, tick,
+         f", flashes={flashes}" if flashes is not None else "")
+    try:
+        while True:
+            skipped = clock.fire()
+            if skipped:
+                _log(_C.WARN, "source", "Fell %d tick(s) behind – skipping ahead", skipped)
+                if flashes is not None:
+                    skipped = min(skipped, 2 * flashes - 1 - changes)
+                # Land on the state the skipped ticks would have left
+                changes += skipped
+                shown ^= skipped % 2 == 1
+            shown = not shown
+            results = yield "batch", (_item_request(scene, item_id, shown),)
+            if not isinstance(results, Exception):
+                results = results[0]
+            if isinstance(results, Exception):
+                raise results
+            changes += 1
+            if flashes is not None and changes == 2 * flashes:
+                break
+            yield from _wait_for_tick(clock, clock.remaining())
+    finally:
+        _log(_C.DIM, "source", "Strobe stopped. (%s)", clock.stats)
+
+
+def _item_request(scene: str, item_id: int, enabled: bool) -> tuple:
+    return "SetSceneItemEnabled", {"sceneName": scene, "sceneItemId": item_id, "sceneItemEnabled": enabled}
+
+
+def sequence_program(steps, trigger_note: int = None):
+    """Run a sequence of loop/static/stop/pause steps, looping continuously.
+
+    *steps* are step dicts or their compiled plans (see compile_steps).
+    The sequence repeats from the beginning after all steps complete.
+    Terminal actions (end the sequence when reached):
+      - static: switch to a static scene and end.
+      - stop: end without changing the scene.
+    Pause action:
+      - pause: hold the current scene until the resume note is pressed.
+        Defaults to trigger_note; override with "resume_note" in the action.
+    If the last step is a loop, the sequence wraps back to step 1.
+    """
+    steps = compile_steps(steps)
+    count = len(steps)
+    pass_num = 0
+    paused = False
+    try:
+        while True:
+            pass_num += 1
+            _log(_C.SEQ, "seq", "Pass %d", pass_num)
+
+            for i, step in enumerate(steps, 1):
+                kind = step.kind
+
+                if kind == "stop":
+                    _log(_C.SEQ, "seq", "Step %d/%d – stop", i, count)
+                    _log(_C.SEQ, "seq", "Sequence complete (terminal stop).")
+                    return
+
+                elif kind == "static":
+                    _log(_C.SEQ, "seq", "Step %d/%d – static (scene=%s)", i, count, step.scene)
+                    error = yield from switch_program(step.scene, step.requests)
+                    if error is not None:
+                        _log(_C.ERR, "seq", "Failed to switch to '%s': %s", step.scene, error)
+                    _log(_C.SEQ, "seq", "Sequence complete (terminal static).")
+                    return
+
+                elif kind == "pause":
+                    note = trigger_note if step.resume_note is None else step.resume_note
+                    _log(_C.WARN, "seq", "Step %d/%d – paused (resume_note=%s)", i, count, note)
+                    paused = True
+                    yield "pause", note
+                    paused = False
+                    _log(_C.SEQ, "seq", "Resumed.")
+
+                elif kind == "loop":
+                    sequence = yield "order", (step.prefix, step.style, step.seed)
+                    if not sequence:
+                        _log(_C.WARN, "seq", "Step %d/%d – no scenes for '%s', skipping", i, count, step.prefix)
+                        continue
+
+                    _log(_C.SEQ, "seq", "Step %d/%d – %s", i, count, step.summary)
+                    yield from loop_program(sequence, step.tick, step.style, max_repeats=step.repeats,
+                                            clock=beat_clock(step.beats), requests=step.requests,
+                                            seed=step.seed, options=step.options, beats=step.beats)
+    except GeneratorExit:
+        _log(_C.DIM, "seq", "Cancelled during pause." if paused else "Cancelled.")
+        raise
+
+
+# A quantized launch sleeps until this many nanoseconds before its boundary
+# and spins the rest: a timed wait can wake a millisecond or more off
+LAUNCH_SPIN_NS = 1_000_000
+
+
+def launch_program(program, at: int, clock=time.perf_counter_ns):
+    """Run *program* from perf_counter_ns time *at* (a quantized launch, see Lanes.play())."""
+    wait = (at - LAUNCH_SPIN_NS - clock()) / 1_000_000_000
+    if wait > 0:
+        yield "wait", wait
+    while clock() < at:
+        time.sleep(0)
+    yield from program
+
+
+# ---------------------------------------------------------------------------
+# MIDI CC
+# ---------------------------------------------------------------------------
+
+class _CcTarget:
+    """Value and counters of one OBS parameter driven by CC (see CcEngine)."""
+    __slots__ = ("plan", "goal", "value", "sent", "since", "pending", "failed",
+                 "received", "updates", "dropped", "first")
+
+    def __init__(self, plan: CcPlan, now: float):
+        self.plan = plan
+        self.goal = None      # value the latest CC message asks for
+        self.value = None     # value reached so far (behind goal while smoothing)
+        self.sent = None      # last value sent to OBS
+        self.since = now      # when value was last advanced
+        self.pending = False  # goal not yet taken by a flush
+        self.failed = False   # last flush was refused; logged once until it succeeds
+        self.received = 0     # CC messages
+        self.updates = 0      # values sent
+        self.dropped = 0      # messages replaced by a later one before a flush took them
+        self.first = now
+
+
+class CcEngine:
+    """Drives continuous OBS parameters from MIDI CC (the config's "cc" section).
+
+    A fader sends far more messages than OBS can use. feed() only records the
+    latest value per target; program() runs on its own lane and sends every
+    changed target in one RequestBatch, at most CC_FLUSH_HZ times a second.
+    Mappings with "smoothing" ease towards their value over several flushes.
+    While nothing changes the program holds (see the "hold" command), so an
+    idle controller costs no wakeups.
+    """
+
+    LANE = "cc"
+    SETTLE = 0.001   # fraction of the range within which a smoothed value snaps to its goal
+
+    def __init__(self, rate: float | None = None, clock=None):
+        self.rate = rate   # flushes per second; None follows CC_FLUSH_HZ
+        self.active = False
+        self.flushes = 0
+        self._clock = clock or time.perf_counter
+        self._lock = threading.Lock()
+        self._targets = {}   # type: dict[str, _CcTarget]
+        self._changing = {}  # targets with a value still to send, in arrival order
+        self._waiters = []
+
+    @property
+    def interval(self) -> float:
+        """Seconds between flushes."""
+        return 1.0 / (self.rate or CC_FLUSH_HZ)
+
+    def feed(self, raw: int, plan: CcPlan) -> bool:
+        """Record controller value *raw* (0–127) for *plan*'s target.
+
+        Returns True if program() is not running and must be played on lane
+        LANE; safe to call from any thread.
+        """
+        now = self._clock()
+        with self._lock:
+            target = self._targets.get(plan.target)
+            if target is None:
+                target = self._targets[plan.target] = _CcTarget(plan, now)
+            target.plan = plan
+            target.received += 1
+            if target.pending:
+                target.dropped += 1
+            target.goal = plan.value(raw)
+            target.pending = True
+            if plan.target not in self._changing:
+                target.since = now
+                self._changing[plan.target] = target
+            waiters, self._waiters = self._waiters, []
+            start, self.active = not self.active, True
+        for callback in waiters:
+            callback()
+        return start
+
+    def when_running(self, callback) -> None:
+        """Call *callback* once there is a value to send (now, if there is one already)."""
+        with self._lock:
+            if not self._changing:
+                self._waiters.append(callback)
+                return
+        callback()
+
+    def program(self):
+        """Playback program sending the changed targets; play it on lane LANE."""
+        try:
+            while True:
+                requests, targets, moving = self._step()
+                if requests:
+                    self._check(targets, (yield "batch", tuple(requests)))
+                if requests or moving:
+                    yield "wait", self.interval
+                else:
+                    yield "hold", self
+        finally:
+            with self._lock:
+                self.active = False
+
+    def _step(self) -> tuple[list, list, bool]:
+        # Advance every changing target to now: (requests, their targets, still easing)
+        now = self._clock()
+        requests, targets = [], []
+        with self._lock:
+            for key, target in list(self._changing.items()):
+                target.pending = False
+                plan = target.plan
+                if not plan.smoothing or target.value is None:
+                    target.value = target.goal
+                else:
+                    step = 1.0 - math.exp(-(now - target.since) / plan.smoothing)
+                    target.value += (target.goal - target.value) * step
+                    if abs(target.goal - target.value) <= self.SETTLE * abs(plan.high - plan.low):
+                        target.value = target.goal
+                target.since = now
+                if target.value == target.goal:
+                    del self._changing[key]
+                value = round(target.value) if plan.integer else target.value
+                if value != target.sent:
+                    target.sent = value
+                    target.updates += 1
+                    requests.append(plan.request(value))
+                    targets.append(target)
+            moving = bool(self._changing)
+        if requests:
+            self.flushes += 1
+        return requests, targets, moving
+
+    def _check(self, targets: list, results) -> None:
+        if isinstance(results, Exception):
+            results = [results] * len(targets)
+        for target, result in zip(targets, results):
+            if isinstance(result, Exception):
+                if not target.failed:
+                    _log(_C.WARN, "cc", f"Failed to set {target.plan.target}: {result}")
+                target.failed = True
+            else:
+                target.failed = False
+
+    def stats(self) -> dict:
+        """Per-target counters, keyed by target: messages "received", values
+        "sent", messages "dropped" before a flush, and the send "rate_hz"
+        since the target's first message."""
+        now = self._clock()
+        with self._lock:
+            return {
+                key: {"received": t.received, "sent": t.updates, "dropped": t.dropped,
+                      "rate_hz": round(t.updates / (now - t.first), 1) if now > t.first else 0.0}
+                for key, t in self._targets.items()
+            }
+
+    def report(self) -> None:
+        """Log stats() for every target that has seen a message."""
+        for key, s in self.stats().items():
+            _log(_C.INFO, "cc", f"{key}: {s['received']} received, {s['sent']} sent "
+                                f"({s['rate_hz']}/s), {s['dropped']} dropped")
+
+
+cc_engine = CcEngine()
+
+
+# ---------------------------------------------------------------------------
+# Threaded engine
+# ---------------------------------------------------------------------------
+
+def execute_command(client: obs.ReqClient, kind: str, arg, trace: LatencyTrace | None = None):
+    """Carry out one OBS-facing program command ("scene", "batch", "preview",
+    "item", "enabled", "order") and return the reply to send back
+    into the program."""
+    if kind == "scene":
+        if obs_mirror.redundant(client, "SetCurrentProgramScene", {"sceneName": arg}):
+            return None
+        sent = time.perf_counter_ns()
+        try:
+            if client.set_current_program_scene(arg) is DEFERRED:
+                return None
+        except Exception as e:
+            return e
+        latency.switched(trace, arg, sent)
+        return None
+    if kind == "batch":
+        keep = obs_mirror.needed(client, arg)
+        requests = arg if len(keep) == len(arg) else [arg[i] for i in keep]
+        if not requests:
+            return [{} for _ in arg]
+        sent = time.perf_counter_ns()
+        try:
+            results = send_batch(client, requests)
+        except Exception as e:
+            return e
+        _record_batch_switch(trace, requests, results, sent)
+        return results if requests is arg else _spread_results(results, keep, len(arg))
+    if kind == "preview":
+        if obs_mirror.redundant(client, "SetCurrentPreviewScene", {"sceneName": arg}):
+            return None
+        try:
+            client.set_current_preview_scene(arg)
+        except Exception as e:
+            return e
+        return None
+    if kind == "item":
+        try:
+            return scene_items.resolve(client, *arg)
+        except Exception as e:
+            return e
+    if kind == "enabled":
+        enabled = obs_mirror.item_enabled(client, *arg)
+        if enabled is None:
+            try:
+                result = send_batch(client, [("GetSceneItemEnabled",
+                                              {"sceneName": arg[0], "sceneItemId": arg[1]})])[0]
+            except Exception as e:
+                return e
+            enabled = result if isinstance(result, Exception) else result["sceneItemEnabled"]
+        return enabled
+    if kind == "order":
+        started = time.perf_counter_ns()
+        order = scene_catalog.order_for(client, *arg)
+        latency.record("scene_list", started)
+        return order
+    raise ValueError(f"Unknown program command '{kind}'")
+
+
+def _record_batch_switch(trace: LatencyTrace | None, requests, results: list, sent: int) -> None:
+    result = results[0]
+    if requests[0][0] == "SetCurrentProgramScene" and result is not DEFERRED and not isinstance(result, Exception):
+        latency.switched(trace, requests[0][1]["sceneName"], sent)
+
+
+def start_loop(client: obs.ReqClient, prefix: str, style: str, tick: float, lane: str = "main"):
+    """Replace whatever *lane* is playing with a loop over scenes matching *prefix*.
+
+    Returns immediately; the loop runs on the lane scheduler.
+    """
+    lanes.play(prefix_loop_program(prefix, style, tick), lane, client=client)
+
+
+def stop_loop(lane: str | None = None):
+    """Stop *lane* (default: every lane) and wait for it to go idle."""
+    lanes.stop(lane)
+
+
+def switch_to_static_scene(client: obs.ReqClient, scene_name: str, lane: str = "main"):
+    """Stop whatever *lane* is playing and switch to a specific static scene.
+
+    Returns immediately; the switch happens on the lane scheduler.
+    """
+    lanes.play(static_program(scene_name), lane, client=client)
+
+
+def handle_midi(msg, client: obs.ReqClient, port: str | None = None):
+    """React to incoming MIDI messages using MIDI_MAP (or *port*'s own map)."""
+    if msg.type != "note_on" or msg.velocity == 0:
+        if msg.type in MidiClock.MESSAGES:
+            midi_clock.feed(msg)
+        elif msg.type == "control_change":
+            plan = MIDI_MAP.cc.get(msg.control)
+            if plan is not None and cc_engine.feed(msg.value, plan):
+                lanes.play(cc_engine.program(), CcEngine.LANE, client=client)
+        return
+    trace = latency.begin(msg.note)
+
+    # If a sequence is paused on this note, resume it
+    if lanes.resume(msg.note):
+        _log(_C.MIDI, "midi", "note %s – resuming paused sequence", msg.note)
+        return
+
+    midi_map = MIDI_MAP.for_port(port)
+    plan = midi_map.plan(msg.note)
+    if plan is None:
+        _log(_C.DIM, "midi", "note %s – unmapped, ignoring", msg.note)
+        return
+
+    program = plan.program(msg.note)
+    if program is not None:
+        at = launch_deadline(plan.quantize, lanes.timeline(plan.lane))
+        if at is not None:
+            _log(_C.DIM, "midi", "note %s – launching on the next boundary, in %.0f ms",
+                 msg.note, (at - time.perf_counter_ns()) / 1e6)
+            trace = None   # the wait for the boundary is not latency
+        lanes.play(program, plan.lane, note=midi_map.key(msg.note), trace=trace, client=client, at=at)
+        if trace is not None:
+            latency.record("handle", trace.t0)
+
+
+# ---------------------------------------------------------------------------
+# MIDI input
+# ---------------------------------------------------------------------------
+
+MIDI_INPUT_MODES = ("callback", "blocking", "poll")
+
+# Timeout for threads that just wait for shutdown. An untimed wait is
+# interrupted by Ctrl+C everywhere but on Windows, which needs a periodic wakeup.
+_SIGNAL_POLL = 0.5 if sys.platform == "win32" else None
+
+
+class MidiDispatcher:
+    """Runs *handler* for queued MIDI messages on a dedicated thread.
+
+    put() is safe to call from the MIDI driver's callback thread and never
+    blocks, so slow handlers cannot hold up message delivery.
+    """
+
+    _STOP = object()
+
+    def __init__(self, handler):
+        self._handler = handler
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="midi-dispatch", daemon=True)
+        self._thread.start()
+
+    def put(self, msg) -> None:
+        self._queue.put(msg)
+
+    def close(self) -> None:
+        """Dispatch everything already queued, then stop the thread."""
+        self._queue.put(self._STOP)
+        self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            msg = self._queue.get()
+            if msg is self._STOP:
+                return
+            _dispatch_safely(self._handler, msg)
+
+
+def _dispatch_safely(handler, msg) -> None:
+    try:
+        handler(msg)
+    except Exception as e:
+        _log(_C.ERR, "midi", f"Error handling {msg}: {e}")
+
+
+def pump_midi(inport, handler, mode: str | None = None, stop: threading.Event | None = None) -> None:
+    """Feed every message from an open *inport* to *handler* until *stop* is set.
+
+    Blocks the calling thread. In "callback" and "blocking" modes the thread
+    sleeps until there is something to do instead of polling every millisecond.
+    """
+    mode = mode or MIDI_INPUT_MODE
+    stop = stop or _shutdown_event
+    if mode == "callback":
+        inport.callback = lambda msg: _dispatch_safely(handler, msg)
+        try:
+            while not stop.wait(_SIGNAL_POLL):
+                pass
+        finally:
+            inport.callback = None
+    elif mode == "blocking":
+        for msg in inport:
+            _dispatch_safely(handler, msg)
+            if stop.is_set():
+                break
+    elif mode == "poll":
+        while not stop.is_set():
+            for msg in inport.iter_pending():
+                _dispatch_safely(handler, msg)
+            time.sleep(0.001)
+    else:
+        raise ValueError(f"Unknown MIDI input mode '{mode}' (expected one of {MIDI_INPUT_MODES})")
+
+
+def listen_midi(port_name: str, handler, mode: str | None = None,
+                use_queue: bool | None = None) -> None:
+    """Open *port_name* and pump its messages to *handler* (see pump_midi).
+
+    With *use_queue* (default MIDI_DISPATCH_QUEUE) messages are handed to a
+    MidiDispatcher thread instead of being handled on the input thread.
+    """
+    use_queue = MIDI_DISPATCH_QUEUE if use_queue is None else use_queue
+    dispatcher = MidiDispatcher(handler) if use_queue else None
+    try:
+        with mido.open_input(port_name) as inport:
+            pump_midi(inport, dispatcher.put if dispatcher else handler, mode)
+    finally:
+        if dispatcher is not None:
+            dispatcher.close()
+
+
+class MidiMultiplexer:
+    """Merges messages from several MIDI inputs into one stream for *handler*.
+
+    Each port's driver thread only timestamps a message, tags it with the
+    port name and queues it. One dispatch thread calls handler(msg, port) for
+    them in timestamp order: messages that arrived together are sorted before
+    being handed on, so two ports racing for the queue cannot reorder them.
+    The per-message cost is the same however many ports are open.
+    """
+
+    _STOP = object()
+
+    def __init__(self, handler, clock=time.perf_counter_ns):
+        self._handler = handler
+        self._clock = clock
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="midi-mux", daemon=True)
+        self._thread.start()
+
+    def put(self, msg, port: str | None) -> None:
+        self._queue.put((self._clock(), port, msg))
+
+    def reader(self, port: str):
+        """Return a one-argument handler that feeds *port*'s messages in."""
+        return lambda msg: self.put(msg, port)
+
+    def close(self) -> None:
+        """Dispatch everything already queued, then stop the thread."""
+        self._queue.put(self._STOP)
+        self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while True:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            stopping = self._STOP in batch
+            if stopping:
+                batch = [item for item in batch if item is not self._STOP]
+            if len(batch) > 1:
+                batch.sort(key=lambda item: item[0])
+            for _, port, msg in batch:
+                try:
+                    self._handler(msg, port)
+                except Exception as e:
+                    _log(_C.ERR, "midi", f"Error handling {msg} from {port}: {e}")
+            if stopping:
+                return
+
+
+def listen_midi_ports(port_names: list[str], handler, mode: str | None = None) -> None:
+    """Open every port in *port_names* and feed handler(msg, port) through a MidiMultiplexer.
+
+    Each port is pumped on its own reader thread (see pump_midi); this call
+    blocks until _shutdown_event is set or it is interrupted.
+    """
+    mux = MidiMultiplexer(handler)
+    stop = threading.Event()
+    inports, readers = [], []
+    try:
+        for name in port_names:
+            inport = mido.open_input(name)
+            inports.append(inport)
+            reader = threading.Thread(target=pump_midi, args=(inport, mux.reader(name), mode, stop),
+                                      name=f"midi-in-{len(readers)}", daemon=True)
+            reader.start()
+            readers.append(reader)
+        while not _shutdown_event.wait(_SIGNAL_POLL):
+            pass
+    finally:
+        stop.set()
+        for inport in inports:
+            inport.close()
+        for reader in readers:
+            reader.join(1.0)   # a "blocking" reader may sit in receive(); it is a daemon
+        mux.close()
+
+
+def resolve_midi_ports(patterns, available: list[str]) -> list[str]:
+    """Match MIDI_PORTS entries to available input names.
+
+    An entry matches a port of the same name, or else the first port whose
+    name contains it (case-insensitive). Unmatched entries are logged and
+    skipped; each port is opened at most once.
+    """
+    chosen = []
+    for pattern in patterns:
+        name = pattern if pattern in available else next(
+            (n for n in available if pattern.lower() in n.lower() and n not in chosen), None)
+        if name is None:
+            _log(_C.WARN, "midi", f"No MIDI input matches '{pattern}', skipping it")
+        elif name not in chosen:
+            chosen.append(name)
+    return chosen
+
+
+NOTE_NAMES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+
+
+def _log_midi_message(msg) -> None:
+    if hasattr(msg, "note"):
+        if _log_enabled(_C.MIDI, "debug"):
+            name = NOTE_NAMES[msg.note % 12] + str(msg.note // 12 - 1)
+            _log(_C.MIDI, "debug", "%s  (note_name=%s)", msg, name)
+    else:
+        _log(_C.DIM, "debug", "%s", msg)
+
+
+def midi_debug_loop(port_name: str):
+    """Open a MIDI port and log every incoming message."""
+    _log(_C.DIM, "debug", f"Listening on: {port_name} ({MIDI_INPUT_MODE} input)")
+    _log(_C.DIM, "debug", "Press keys on your MIDI device … (Ctrl+C to quit)")
+    listen_midi(port_name, _log_midi_message)
+
+
+# ---------------------------------------------------------------------------
+# Session recording
+# ---------------------------------------------------------------------------
+# A recorded session is a JSONL file: a header, then one line per MIDI
+# message, OBS request/response and config reload, stamped with microseconds
+# since recording started (time.perf_counter_ns(), so monotonic):
+#
+#   {"session": 1, "seed": 1234, "config": {...}, "flags": {...}}
+#   {"us": 1520, "port": "Launchpad", "midi": [144, 36, 100]}
+#   {"us": 1610, "request": {"requestType": ...}, "response": {...}, "rtt_us": 840}
+#   {"us": 90000, "config": {...}}
+#
+# ``python bench.py replay`` feeds one back through handle_midi against the
+# fake OBS server.
+
+SESSION_VERSION = 1
+
+# Flags that change playback; recorded in the header and restored on replay
+SESSION_FLAGS = ("LATE_TICK_POLICY", "MIDI_CLOCK_SYNC", "PREVIEW_LOOKAHEAD_MS", "OBS_BATCH_EXECUTION")
+
+
+class SessionRecorder:
+    """Writes a session file between open() and close(); a no-op otherwise.
+
+    Opening seeds playback_random with a seed kept in the header, so a replay
+    seeded the same way picks the same random/shuffle scene orders.
+    """
+
+    def __init__(self, clock=None):
+        self._now = clock or time.perf_counter_ns
+        self._file = None
+        self._origin = 0
+        self._lock = threading.Lock()
+
+    @property
+    def recording(self) -> bool:
+        return self._file is not None
+
+    def open(self, path: str, config: dict, seed: int | None = None) -> int:
+        """Start recording to *path*, with the *config* it plays; returns the seed."""
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        playback_random.seed(seed)
+        self._file = open(path, "w", encoding="utf-8")
+        self._origin = self._now()
+        self._write({"session": SESSION_VERSION, "seed": seed, "config": config,
+                     "flags": {name: globals()[name] for name in SESSION_FLAGS}})
+        _log(_C.INFO, "record", "Recording session to %s (seed %d)", path, seed)
+        return seed
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def midi(self, msg, port: str | None) -> None:
+        if self._file is not None:
+            self._write({"us": self._since(self._now()), "port": port, "midi": msg.bytes()})
+
+    def request(self, request: dict, response: dict, sent: int) -> None:
+        """Record an OBS *request* ("d" of an op 6/8 message), sent at
+        perf_counter_ns *sent*, and its *response*."""
+        if self._file is not None:
+            self._write({"us": self._since(sent), "request": request, "response": response,
+                         "rtt_us": (self._now() - sent) // 1000})
+
+    def config(self, raw: dict) -> None:
+        if self._file is not None:
+            self._write({"us": self._since(self._now()), "config": raw})
+
+    def wrap(self, handler):
+        """Return *handler* (called as handler(msg, port)), recording every message first."""
+        if self._file is None:
+            return handler
+
+        def recorded(msg, port=None):
+            self.midi(msg, port)
+            handler(msg, port)
+        return recorded
+
+    def _since(self, ns: int) -> int:
+        return (ns - self._origin) // 1000
+
+    def _write(self, record: dict) -> None:
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line)
+
+
+def read_session(path: str) -> tuple[dict, list[dict]]:
+    """Return the header and the records of a session file written by SessionRecorder."""
+    with open(path, encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f if line.strip()]
+    if not lines or lines[0].get("session") != SESSION_VERSION:
+        raise ValueError(f"{path} is not a version {SESSION_VERSION} session recording")
+    return lines[0], lines[1:]
+
+
+def scale_tempo(raw: dict, speed: float) -> dict:
+    """Copy of config *raw* with every loop *speed* times as fast (bpm and tick
+    scaled, sequence steps and per-port maps included)."""
+    def scaled(entry):
+        if not isinstance(entry, dict):
+            return entry
+        entry = dict(entry)
+        if isinstance(entry.get("bpm"), (int, float)):
+            entry["bpm"] = entry["bpm"] * speed
+        if isinstance(entry.get("tick"), (int, float)):
+            entry["tick"] = entry["tick"] / speed
+        if isinstance(entry.get("steps"), list):
+            entry["steps"] = [scaled(step) for step in entry["steps"]]
+        return entry
+
+    out = {note: scaled(entry) for note, entry in raw.items() if note != "ports"}
+    if isinstance(raw.get("ports"), dict):
+        out["ports"] = {port: scale_tempo(notes, speed) if isinstance(notes, dict) else notes
+                        for port, notes in raw["ports"].items()}
+    return out
+
+
+def _raw_config(path: str) -> dict:
+    if not os.path.exists(path):
+        return DEFAULT_MIDI_MAP
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+recorder = SessionRecorder()
+
+# ---------------------------------------------------------------------------
+# Asyncio engine
+# ---------------------------------------------------------------------------
+
+class AsyncObsClient:
+    """Minimal asyncio obs-websocket v5 client.
+
+    Every request carries a requestId and is matched to its response when
+    that arrives, so any number of requests can be in flight at once. Events
+    reach callbacks registered on ``callback`` by function name, as with
+    obsws_python's EventClient, so SceneCatalog.attach() works unchanged.
+    """
+
+    def __init__(self, host: str | None = None, port: int | None = None, password: str | None = None,
+                 subs: int | None = None, timeout: float = 5.0):
+        from obsws_python.callback import Callback
+        self.host = OBS_HOST if host is None else host
+        self.port = OBS_PORT if port is None else port
+        self.password = OBS_PASSWORD if password is None else password
+        self.subs = int(obs.Subs.SCENES if subs is None else subs)
+        self.timeout = timeout
+        self.callback = Callback()
+        self._ws = None
+        self._reader = None
+        self._ids = itertools.count(1)
+        self._pending = {}  # type: dict[str, asyncio.Future]
+
+    async def connect(self) -> "AsyncObsClient":
+        """Open the socket and identify (authenticating if OBS asks for it)."""
+        from websockets.asyncio.client import connect
+        from websockets.exceptions import ConnectionClosed
+        self._ws = await asyncio.wait_for(
+            connect(f"ws://{self.host}:{self.port}", max_size=None), self.timeout)
+        hello = json.loads(await self._ws.recv())["d"]
+        identify = _identify_payload(hello, self.password, self.subs)
+        await self._ws.send(json.dumps({"op": 1, "d": identify}))
+        try:
+            reply = json.loads(await asyncio.wait_for(self._ws.recv(), self.timeout))
+        except ConnectionClosed:
+            reply = {}
+        if reply.get("op") != 2:
+            raise ConnectionError("OBS did not identify the client (check the password)")
+        self._reader = asyncio.create_task(self._read())
+        return self
+
+    async def close(self) -> None:
+        if self._ws is not None:
+            await self._ws.close()
+        if self._reader is not None:
+            await self._reader
+
+    async def request(self, request_type: str, data: dict | None = None) -> dict:
+        """Send one request and return its responseData (empty if none)."""
+        request_id = str(next(self._ids))
+        payload = {"requestType": request_type, "requestId": request_id}
+        if data:
+            payload["requestData"] = data
+        d = await self._call(request_id, {"op": 6, "d": payload}, request_type)
+        status = d["requestStatus"]
+        if not status["result"]:
+            raise ObsRequestError(request_type, status["code"], status.get("comment"))
+        return d.get("responseData") or {}
+
+    async def request_batch(self, requests, execution: str | None = None,
+                            halt_on_failure: bool = False) -> list:
+        """Send (requestType, requestData) pairs as one RequestBatch (see send_batch)."""
+        request_id = str(next(self._ids))
+        payload = _batch_payload(request_id, requests, execution, halt_on_failure)
+        d = await self._call(request_id, payload, "RequestBatch")
+        return _batch_results(d["results"])
+
+    async def _call(self, request_id: str, payload: dict, label: str) -> dict:
+        """Send *payload* and return the "d" of the response carrying *request_id*."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        # A timer on the future rather than asyncio.wait_for(), which can
+        # swallow a lane's cancellation if the response lands at the same time
+        timer = future.get_loop().call_later(self.timeout, self._expire, future, label)
+        sent = time.perf_counter_ns()
+        try:
+            await self._ws.send(json.dumps(payload))
+            d = await future
+        finally:
+            timer.cancel()
+            self._pending.pop(request_id, None)
+        recorder.request(payload["d"], d, sent)
+        return d
+
+    @staticmethod
+    def _expire(future: asyncio.Future, request_type: str) -> None:
+        if not future.done():
+            future.set_exception(TimeoutError(f"{request_type} timed out"))
+
+    async def get_version(self) -> dict:
+        return await self.request("GetVersion")
+
+    async def get_scene_list(self) -> dict:
+        return await self.request("GetSceneList")
+
+    async def set_current_program_scene(self, name: str) -> None:
+        await self.request("SetCurrentProgramScene", {"sceneName": name})
+
+    async def set_current_preview_scene(self, name: str) -> None:
+        await self.request("SetCurrentPreviewScene", {"sceneName": name})
+
+    async def _read(self) -> None:
+        from websockets.exceptions import ConnectionClosed
+        try:
+            async for raw in self._ws:
+                msg = json.loads(raw)
+                op, d = msg.get("op"), msg.get("d", {})
+                if op in (7, 9):
+                    self._resolve(d)
+                elif op == 5:
+                    try:
+                        self.callback.trigger(d["eventType"], d.get("eventData") or {})
+                    except Exception as e:
+                        _log(_C.ERR, "obs", f"Error handling {d.get('eventType')} event: {e}")
+        except ConnectionClosed:
+            pass
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("OBS connection closed"))
+
+    def _resolve(self, d: dict) -> None:
+        future = self._pending.get(d.get("requestId"))
+        if future is None or future.done():
+            return  # caller gave up (timeout or cancelled lane)
+        future.set_result(d)
+
+
+class AsyncEngine:
+    """Asyncio variant of the controller core (see ENGINE).
+
+    Each playback lane is one asyncio task driving a playback program.
+    Triggering a lane cancels its task and starts a fresh one, so there is no
+    thread per trigger and cancellation is a Task.cancel(). MIDI arrives from
+    any thread through feed().
+    """
+
+    def __init__(self, client: AsyncObsClient, catalog: SceneCatalog | None = None,
+                 mirror: ObsMirror | None = None, items: SceneItemIndex | None = None):
+        self.client = client
+        self.catalog = catalog or SceneCatalog()
+        self.items = items or SceneItemIndex()
+        # Skips writes OBS already matches once start() attaches it; without
+        # one, an unattached mirror that never skips
+        self.mirror = mirror or ObsMirror()
+        self._mirrored = mirror is not None
+        self.lanes = {}    # type: dict[str, asyncio.Task]
+        self.notes = {}    # lane → trigger key of what it plays (see Lanes.notes())
+        self.timelines = {}   # lane → clock of the loop it plays (see Lanes.timeline())
+        self.switches = SwitchCoalescer()
+        self._launches = {}   # lane → TimerHandle of a quantized play() waiting for its boundary
+        self._held_timer = None   # TimerHandle that sends the coalescer's held switch when due
+        self._held_task = None    # task sending it
+        self._resume = {}  # type: dict[str, tuple[int | None, asyncio.Event]]
+        self._loop = None
+        self._midi = None
+
+    async def start(self) -> None:
+        """Load the scene catalog, scene item index (and mirror) and keep them
+        current from OBS events."""
+        self._loop = asyncio.get_running_loop()
+        self._midi = asyncio.Queue()
+        if self._mirrored:
+            self.mirror.attach(self.client)
+        since = self.mirror.events
+        resp = await self.client.get_scene_list()
+        self.catalog.set_scenes(s["sceneName"] for s in resp["scenes"])
+        self.catalog.attach(self.client)
+        if self._mirrored:
+            self.mirror.seed(resp.get("currentProgramSceneName"), resp.get("currentPreviewSceneName"), since)
+        self.items.attach(self.client)
+        await self._load_items(self.catalog.lookup(""))
+
+    async def _load_items(self, scenes: list[str]) -> None:
+        # Async counterpart of SceneItemIndex.load()
+        since = self.mirror.events
+        results = await self.client.request_batch(
+            [("GetSceneItemList", {"sceneName": s}) for s in scenes]) if scenes else []
+        listed = {scene: result.get("sceneItems", ()) for scene, result in zip(scenes, results)
+                  if not isinstance(result, Exception)}
+        self.items.set_items(listed)
+        if self._mirrored:
+            self.mirror.seed_items(((scene, item["sceneItemId"], item["sceneItemEnabled"])
+                                    for scene, items in listed.items() for item in items
+                                    if "sceneItemEnabled" in item), since)
+
+    def feed(self, msg, port: str | None = None) -> None:
+        """Queue a MIDI message (from *port*) for the engine; safe to call from any thread."""
+        self._loop.call_soon_threadsafe(self._midi.put_nowait, (msg, port))
+
+    async def run(self) -> None:
+        """Handle queued MIDI messages until cancelled."""
+        while True:
+            self.handle(*await self._midi.get())
+
+    def handle(self, msg, port: str | None = None) -> None:
+        """React to a MIDI message using MIDI_MAP (asyncio counterpart of handle_midi)."""
+        if msg.type != "note_on" or msg.velocity == 0:
+            if msg.type in MidiClock.MESSAGES:
+                midi_clock.feed(msg)
+            elif msg.type == "control_change":
+                plan = MIDI_MAP.cc.get(msg.control)
+                if plan is not None and cc_engine.feed(msg.value, plan):
+                    self.play(cc_engine.program(), CcEngine.LANE)
+            return
+
+        if self.resume(msg.note):
+            _log(_C.MIDI, "midi", "note %s – resuming paused sequence", msg.note)
+            return
+
+        midi_map = MIDI_MAP.for_port(port)
+        plan = midi_map.plan(msg.note)
+        if plan is None:
+            _log(_C.DIM, "midi", "note %s – unmapped, ignoring", msg.note)
+            return
+
+        trace = latency.begin(msg.note)
+        program = plan.program(msg.note)
+        if program is not None:
+            timeline = self.timelines.get(plan.lane) or next(iter(self.timelines.values()), None)
+            at = launch_deadline(plan.quantize, timeline)
+            if at is not None:
+                self.launch(program, plan.lane, at, note=midi_map.key(msg.note))
+                return
+            self.play(program, plan.lane, note=midi_map.key(msg.note), trace=trace)
+            if trace is not None:
+                latency.record("handle", trace.t0)
+
+    def resume(self, note) -> bool:
+        """Resume every lane paused on *note*; returns True if there was one."""
+        resumed = False
+        for paused_on, event in self._resume.values():
+            if paused_on is not None and paused_on == note:
+                event.set()
+                resumed = True
+        return resumed
+
+    def restart_changed(self, notes: set) -> None:
+        """Restart any running loop whose note's mapping changed (see restart_changed_loop())."""
+        for lane, key in list(self.notes.items()):
+            if key not in notes:
+                continue
+            plan = MIDI_MAP.plan_for(key)
+            if plan is None or plan.kind != "loop":
+                continue
+            note = key[1] if isinstance(key, tuple) else key
+            _log(_C.INFO, "config", "Restarting loop on note %s with its new mapping", note)
+            self.play(plan.program(note), plan.lane, note=key)
+
+    def launch(self, program, lane: str, at: int, note=None) -> None:
+        """Play *program* on *lane* from perf_counter_ns time *at*, leaving the
+        lane's current program running until just before it (see Lanes.play())."""
+        self._cancel_launch(lane)
+        delay = (at - Lanes.LAUNCH_GUARD_NS - time.perf_counter_ns()) / 1_000_000_000
+        self._launches[lane] = self._loop.call_later(
+            delay, lambda: self.play(launch_program(program, at), lane, note=note))
+
+    def _cancel_launch(self, lane: str | None) -> None:
+        for name in list(self._launches) if lane is None else [lane]:
+            handle = self._launches.pop(name, None)
+            if handle is not None:
+                handle.cancel()
+
+    def play(self, program, lane: str = "main", note=None, trace: LatencyTrace | None = None) -> asyncio.Task:
+        """Cancel whatever *lane* is playing and start *program* on it.
+
+        *note* is the ActionMap key of the trigger (see restart_changed()).
+        """
+        self._cancel_launch(lane)
+        old = self.lanes.get(lane)
+        if old is not None:
+            old.cancel()
+        self._resume.pop(lane, None)
+        task = self._loop.create_task(self._drive(lane, program, trace), name=f"lane-{lane}")
+        self.lanes[lane] = task
+        self.notes[lane] = note
+        task.add_done_callback(lambda t: self._finished(lane, t))
+        return task
+
+    async def stop(self, lane: str | None = None) -> None:
+        """Cancel one lane (or all of them) and wait for the tasks to finish."""
+        self._cancel_launch(lane)
+        tasks = [self.lanes[lane]] if lane in self.lanes else [] if lane else list(self.lanes.values())
+        for task in tasks:
+            task.cancel()
+        if lane is None and self._held_timer is not None:
+            self._held_timer.cancel()
+            self._held_timer = None
+            self.switches.drop()
+        if self._held_task is not None:
+            tasks.append(self._held_task)
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _finished(self, lane: str, task: asyncio.Task) -> None:
+        if self.lanes.get(lane) is task:
+            del self.lanes[lane]
+            self.notes.pop(lane, None)
+            self.timelines.pop(lane, None)
+        if not task.cancelled() and task.exception() is not None:
+            _log(_C.ERR, "player", f"Playback failed on lane '{lane}': {task.exception()}")
+
+    async def _switch(self, scene: str, trace: LatencyTrace | None) -> Exception | None:
+        if self.mirror.redundant(self.client, "SetCurrentProgramScene", {"sceneName": scene}):
+            return None
+        sent = time.perf_counter_ns()
+        try:
+            await self.client.set_current_program_scene(scene)
+        except Exception as e:
+            return e
+        latency.switched(trace, scene, sent)
+        return None
+
+    def _start_held_switch(self) -> None:
+        self._held_timer = None
+        self._held_task = self._loop.create_task(self._send_held_switch())
+
+    async def _send_held_switch(self) -> None:
+        switch = self.switches.take()
+        if switch is not None:
+            error = await self._switch(*switch)
+            if error is not None:
+                _log(_C.ERR, "obs", f"Failed to switch to '{switch[0]}': {error}")
+
+    async def _drive(self, lane: str, program, trace: LatencyTrace | None = None) -> None:
+        reply = None
+        latency.started(trace)
+        try:
+            while True:
+                try:
+                    kind, arg = program.send(reply)
+                except StopIteration:
+                    return
+                reply = None
+                if kind == "scene":
+                    due = self.switches.offer((arg, trace))
+                    if due is None:
+                        reply = await self._switch(arg, trace)
+                    elif due:
+                        delay = (due - time.perf_counter_ns()) / 1_000_000_000
+                        self._held_timer = self._loop.call_later(delay, self._start_held_switch)
+                elif kind == "batch":
+                    if _switches_program(kind, arg):
+                        self.switches.bypassed()
+                    keep = self.mirror.needed(self.client, arg)
+                    requests = arg if len(keep) == len(arg) else [arg[i] for i in keep]
+                    sent = time.perf_counter_ns()
+                    try:
+                        reply = await self.client.request_batch(requests) if requests else []
+                    except Exception as e:
+                        reply = e
+                    else:
+                        if requests:
+                            _record_batch_switch(trace, requests, reply, sent)
+                        if requests is not arg:
+                            reply = _spread_results(reply, keep, len(arg))
+                elif kind == "preview":
+                    if self.mirror.redundant(self.client, "SetCurrentPreviewScene", {"sceneName": arg}):
+                        continue
+                    try:
+                        await self.client.set_current_preview_scene(arg)
+                    except Exception as e:
+                        reply = e
+                elif kind == "wait":
+                    await asyncio.sleep(arg)
+                elif kind == "item":
+                    reply = self.items.lookup(*arg)
+                    if reply is None:
+                        scene, source = arg
+                        try:
+                            reply = (await self.client.request(
+                                "GetSceneItemId", {"sceneName": scene, "sourceName": source}))["sceneItemId"]
+                        except Exception as e:
+                            reply = e
+                        else:
+                            self.items.remember(scene, source, reply)
+                elif kind == "enabled":
+                    reply = self.mirror.item_enabled(self.client, *arg)
+                    if reply is None:
+                        scene, item_id = arg
+                        try:
+                            reply = (await self.client.request(
+                                "GetSceneItemEnabled", {"sceneName": scene, "sceneItemId": item_id}
+                            ))["sceneItemEnabled"]
+                        except Exception as e:
+                            reply = e
+                elif kind == "order":
+                    started = time.perf_counter_ns()
+                    reply = self.catalog.order(*arg)
+                    latency.record("scene_list", started)
+                elif kind == "pause":
+                    resumed = asyncio.Event()
+                    self._resume[lane] = (arg, resumed)
+                    try:
+                        await resumed.wait()
+                    finally:
+                        if self._resume.get(lane, (None, None))[1] is resumed:
+                            del self._resume[lane]
+                elif kind == "timeline":
+                    self.timelines[lane] = arg
+                elif kind == "hold":
+                    released = asyncio.Event()
+                    arg.when_running(lambda: self._loop.call_soon_threadsafe(released.set))
+                    await released.wait()
+        finally:
+            program.close()
+
+
+async def main_async() -> None:
+    """Entry point for ENGINE = "asyncio"."""
+    _log(_C.OBS, "obs", f"Connecting to {OBS_HOST}:{OBS_PORT} …")
+    if RECORD_SESSION:
+        recorder.open(RECORD_SESSION, _raw_config(_active_config))
+    client = await AsyncObsClient(subs=OBS_EVENT_SUBS).connect()
+    resp = await client.get_version()
+    _log(_C.OBS, "obs", f"Connected – OBS {resp['obsVersion']}, WebSocket {resp['obsWebSocketVersion']} (asyncio engine)")
+    engine = AsyncEngine(client, scene_catalog, obs_mirror if OBS_MIRROR else None, scene_items)
+    await engine.start()
+    _log(_C.OBS, "obs", f"Scene catalog ready ({len(engine.catalog)} scenes)")
+    if LATENCY_CONFIRM:
+        latency.attach(client)
+    _report_latency_on_signal()
+
+    try:
+        if TEST_MODE:
+            first = next((note for note, e in MIDI_MAP.items() if e["action"] == "loop"), None)
+            if first is not None:
+                plan = MIDI_MAP.plan(first)
+                _log(_C.INFO, "test", f"TEST_MODE – starting loop (prefix={plan.prefix})")
+                engine.play(plan.program(None), plan.lane)
+            await asyncio.Event().wait()
+
+        port_names = pick_midi_ports()
+        if not port_names:
+            return
+
+        _log(_C.INFO, "config", f"Watching config: {os.path.basename(_active_config)}")
+        loop = asyncio.get_running_loop()
+        watcher = ConfigWatcher(_active_config,
+                                on_change=lambda notes: loop.call_soon_threadsafe(engine.restart_changed, notes))
+        threading.Thread(target=watcher.run, name="config-watch", daemon=True).start()
+
+        threading.Thread(target=listen_all, args=(port_names, recorder.wrap(engine.feed)),
+                         name="midi-input", daemon=True).start()
+        try:
+            await engine.run()
+        finally:
+            _shutdown_event.set()
+    finally:
+        await engine.stop()
+        await client.close()
+        recorder.close()
+        latency.report()
+        cc_engine.report()
+        obs_mirror.report()
+
+
+def _report_latency_on_signal() -> None:
+    """Log recent latency histograms on SIGUSR1 (e.g. ``kill -USR1 <pid>``), where available."""
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda *_: latency.report(recent=True))
+
+
+def pick_midi_ports() -> list[str]:
+    """Return the inputs to open: those matching MIDI_PORTS, else MIDI_PORT_NAME
+    or the first available input (empty if there are none)."""
+    available = mido.get_input_names()
+    _log(_C.MIDI, "midi", f"Available inputs: {available}")
+    if MIDI_PORTS:
+        port_names = resolve_midi_ports(MIDI_PORTS, available)
+    else:
+        port_name = MIDI_PORT_NAME or (available[0] if available else None)
+        port_names = [port_name] if port_name is not None else []
+    if not port_names:
+        _log(_C.ERR, "error", "No MIDI input ports found. Exiting.")
+    return port_names
+
+
+def listen_all(port_names: list[str], handler) -> None:
+    """Pump *port_names* to handler(msg, port): one port directly, several through a MidiMultiplexer."""
+    _log(_C.MIDI, "midi", f"Opening {', '.join(port_names)} ({MIDI_INPUT_MODE} input)")
+    _log(_C.MIDI, "midi", f"Mapped notes: {list(MIDI_MAP.keys())}")
+    for pattern, port_map in MIDI_MAP.ports.items():
+        _log(_C.MIDI, "midi", f"Mapped notes for '{pattern}': {list(port_map.keys())}")
+    _log(_C.MIDI, "midi", "Listening for MIDI events … (press Ctrl+C to quit)")
+    if len(port_names) == 1:
+        port_name = port_names[0]
+        listen_midi(port_name, lambda msg: handler(msg, port_name))
+    else:
+        listen_midi_ports(port_names, handler)
+
+
+def main():
+    load_env()
+    select_config()
+
+    # --- MIDI debug mode ---
+    if MIDI_DEBUG:
+        available = mido.get_input_names()
+        _log(_C.DIM, "debug", f"Available MIDI inputs: {available}")
         port_name = MIDI_PORT_NAME or (available[0] if available else None)
         if port_name is None:
             _log(_C.ERR, "error", "No MIDI input ports found. Exiting.")
@@ -540,53 +4745,81 @@ def main():
             _log(_C.DIM, "debug", "Done.")
         return
 
+    # --- Asyncio engine ---
+    if ENGINE == "asyncio":
+        try:
+            asyncio.run(main_async())
+        except KeyboardInterrupt:
+            _log(_C.INFO, "info", "Shutting down.")
+        finally:
+            _shutdown_event.set()
+        return
+
     # --- Connect to OBS ---
     _log(_C.OBS, "obs", f"Connecting to {OBS_HOST}:{OBS_PORT} …")
-    client = obs.ReqClient(host=OBS_HOST, port=OBS_PORT, password=OBS_PASSWORD, timeout=5)
+    if RECORD_SESSION:
+        recorder.open(RECORD_SESSION, _raw_config(_active_config))
+    client = ObsConnection(subs=OBS_EVENT_SUBS).connect()
     resp = client.get_version()
     _log(_C.OBS, "obs", f"Connected – OBS {resp.obs_version}, WebSocket {resp.obs_web_socket_version}")
 
+    # --- Scene catalog, kept current by OBS scene events ---
+    scene_catalog.attach(client)
+    if LATENCY_CONFIRM:
+        latency.attach(client)
+    # Scene events sent while the connection was down are lost
+    client.on_reconnect.append(lambda: scene_catalog.load(client))
+    scene_catalog.load(client)
+    _log(_C.OBS, "obs", f"Scene catalog ready ({len(scene_catalog)} scenes)")
+    if OBS_MIRROR:
+        obs_mirror.attach(client)
+        client.on_reconnect.append(lambda: obs_mirror.load(client))
+        obs_mirror.load(client)
+    scene_items.attach(client)
+    mirror = obs_mirror if OBS_MIRROR else None
+    client.on_reconnect.append(lambda: scene_items.load(client, scene_catalog.lookup(""), mirror))
+    scene_items.load(client, scene_catalog.lookup(""), mirror)
+    _log(_C.OBS, "obs", f"Scene item index ready ({len(scene_items)} sources)")
+    _report_latency_on_signal()
+
     if TEST_MODE:
         # Skip MIDI – run the first "loop" action from MIDI_MAP
-        first = next((e for e in MIDI_MAP.values() if e["action"] == "loop"), None)
-        if first:
-            tick = calc_tick(first["bpm"], first["steps"])
-            _log(_C.INFO, "test", f"TEST_MODE – starting loop (prefix={first['prefix']})")
-            start_loop(client, first["prefix"], first.get("style", "cycle"), tick)
+        first = next((note for note, e in MIDI_MAP.items() if e["action"] == "loop"), None)
+        if first is not None:
+            plan = MIDI_MAP.plan(first)
+            _log(_C.INFO, "test", f"TEST_MODE – starting loop (prefix={plan.prefix})")
+            lanes.play(plan.program(None), plan.lane, client=client)
         try:
-            while True:
-                time.sleep(0.5)
+            while not _shutdown_event.wait(_SIGNAL_POLL):
+                pass
         except KeyboardInterrupt:
             _log(_C.INFO, "info", "Shutting down.")
             stop_loop()
+            latency.report()
         return
 
-    # --- Open MIDI port ---
-    available = mido.get_input_names()
-    _log(_C.MIDI, "midi", f"Available inputs: {available}")
-
-    port_name = MIDI_PORT_NAME or (available[0] if available else None)
-    if port_name is None:
-        _log(_C.ERR, "error", "No MIDI input ports found. Exiting.")
+    # --- Open MIDI ports ---
+    port_names = pick_midi_ports()
+    if not port_names:
         return
 
     # --- Watch config file for live changes ---
     _log(_C.INFO, "config", f"Watching config: {os.path.basename(_active_config)}")
-    threading.Thread(target=_watch_config, args=(_active_config,), daemon=True).start()
+    watcher = ConfigWatcher(_active_config, on_change=lambda notes: restart_changed_loop(client, notes))
+    threading.Thread(target=watcher.run, name="config-watch", daemon=True).start()
 
-    _log(_C.MIDI, "midi", f"Opening port: {port_name}")
-    _log(_C.MIDI, "midi", f"Mapped notes: {list(MIDI_MAP.keys())}")
-    with mido.open_input(port_name) as inport:
-        _log(_C.MIDI, "midi", "Listening for MIDI events … (press Ctrl+C to quit)")
-        try:
-            while True:
-                for msg in inport.iter_pending():
-                    handle_midi(msg, client)
-                time.sleep(0.001)
-        except KeyboardInterrupt:
-            _log(_C.INFO, "info", "Shutting down.")
-            _shutdown_event.set()
-            stop_loop()
+    try:
+        listen_all(port_names, recorder.wrap(lambda msg, port: handle_midi(msg, client, port)))
+    except KeyboardInterrupt:
+        _log(_C.INFO, "info", "Shutting down.")
+    finally:
+        _shutdown_event.set()
+        stop_loop()
+        client.close()
+        recorder.close()
+        latency.report()
+        cc_engine.report()
+        obs_mirror.report()
 
 
 if __name__ == "__main__":
@@ -1,10 +1,17 @@
 """Unit tests for loop styles, static-scene logic, and config loading."""
 
+import itertools
 import json
+import math
 import os
 import pytest
 import random
+import re
+import subprocess
+import sys
 import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from unittest.mock import MagicMock, patch, call
 
@@ -18,28 +25,51 @@ import main
 SCENES = ["S_1", "S_2", "S_3", "S_4"]
 
 
-def run_scene_loop(sequence: list[str], style: str, ticks: int,
-                   max_repeats=None) -> list[str]:
-    """Run scene_loop for a given number of ticks and return the scene names
-    that were set on the mock OBS client.
+class FastClock:
+    """Lanes clock that jumps an hour on every read, so each timer is due at
+    once and programs' waits take no time."""
 
-    We patch stop_event.wait to count iterations and signal stop
-    after *ticks* iterations so the loop exits cleanly.
-    """
-    client = MagicMock()
-    call_count = 0
+    def __init__(self):
+        self._ticks = itertools.count(0, 3600 * 1_000_000_000)
 
-    def fake_wait(_duration):
-        nonlocal call_count
-        call_count += 1
-        if call_count >= ticks:
-            main.stop_event.set()
+    def __call__(self) -> int:
+        return next(self._ticks)
 
-    main.stop_event.clear()
-    with patch.object(main.stop_event, "wait", side_effect=fake_wait):
-        main.scene_loop(client, sequence, tick=0.1, style=style,
-                        max_repeats=max_repeats)
 
+def _paced(program, waits=None, on_wait=None):
+    """Pass *program*'s commands through, ending it at its *waits*-th wait or
+    as soon as *on_wait*(seconds) returns true."""
+    reply, count = None, 0
+    try:
+        while True:
+            try:
+                kind, arg = program.send(reply)
+            except StopIteration:
+                return
+            if kind == "wait":
+                count += 1
+                if (on_wait is not None and on_wait(arg)) or count == waits:
+                    return
+            reply = yield kind, arg
+    finally:
+        program.close()
+
+
+def play_on_lanes(client, program, waits=None, on_wait=None) -> "main.Lanes":
+    """Play *program* for *client* on fresh Lanes whose waits take no time
+    (see FastClock and _paced) and wait until it is done."""
+    lanes = main.Lanes(clock=FastClock())
+    lanes.play(_paced(program, waits, on_wait), client=client)
+    assert lanes.wait_idle(timeout=5)
+    return lanes
+
+
+def run_scene_loop(sequence: list[str], style: str, ticks: int,
+                   max_repeats=None) -> list[str]:
+    """Play a loop for a given number of ticks and return the scene names
+    that were set on the mock OBS client."""
+    client = MagicMock()
+    play_on_lanes(client, main.loop_program(sequence, 0.1, style, max_repeats), waits=ticks)
     return [c.args[0] for c in client.set_current_program_scene.call_args_list]
 
 
@@ -75,7 +105,7 @@ class TestBuildSequence:
         assert result == ["S_1"]
 
     def test_shuffle_contains_same_scenes(self):
-        random.seed(42)
+        main.playback_random.seed(42)
         result = main.build_sequence(SCENES, "shuffle")
         assert sorted(result) == sorted(SCENES)
 
@@ -93,8 +123,84 @@ class TestBuildSequence:
         assert result == ["S_1", "S_2", "S_3", "S_4"]
 
 
+class TestLoopStyles:
+
+    EIGHT = [f"S_{i}" for i in range(1, 9)]
+
+    @staticmethod
+    def picks(style: str, scenes=SCENES, count: int = 8, seed: int = 7, **options) -> list:
+        picker = main.LOOP_STYLES[style](scenes, random.Random(seed), options)
+        return [picker.next() for _ in range(count)]
+
+    def test_registry_covers_every_style(self):
+        assert {"cycle", "bounce", "reverse", "once", "random", "random_no_repeat", "strobe", "shuffle",
+                "weighted", "markov", "euclid", "fibonacci"} <= set(main.LOOP_STYLES)
+        assert main.LOOP_STYLES["shuffle"].fresh and not main.LOOP_STYLES["cycle"].fresh
+
+    def test_random_no_repeat_alternates_two_scenes(self):
+        played = self.picks("random_no_repeat", ["A", "B"], count=6)
+        assert all(a != b for a, b in zip(played, played[1:]))
+
+    def test_weighted_follows_weights(self):
+        played = self.picks("weighted", count=400, weights={"S_1": 0, "S_4": 9})
+        assert "S_1" not in played
+        assert played.count("S_4") > 250
+
+    def test_markov_follows_transitions(self):
+        transitions = {"S_1": {"S_3": 1}, "S_3": {"S_2": 1}, "S_2": {"S_1": 1}, "S_4": {"S_1": 1}}
+        played = self.picks("markov", count=7, transitions=transitions)
+        chain = ["S_1", "S_3", "S_2"]
+        start = played.index("S_1")
+        assert played[start:start + 3] == chain
+        assert all(b == {"S_1": "S_3", "S_3": "S_2", "S_2": "S_1", "S_4": "S_1"}[a]
+                   for a, b in zip(played, played[1:]))
+
+    def test_euclid_switches_on_pulses_and_holds_between(self):
+        assert self.picks("euclid", count=8, pulses=3, length=8) == [
+            "S_1", None, None, "S_2", None, None, "S_3", None]
+
+    def test_fibonacci_skips_ahead(self):
+        assert self.picks("fibonacci", self.EIGHT, count=5) == ["S_1", "S_2", "S_3", "S_5", "S_8"]
+
+    def test_seeded_loops_repeat_their_picks(self):
+        first = main.loop_program(SCENES, 0.1, "random", seed=5)
+        second = main.loop_program(SCENES, 0.1, "random", seed=5)
+
+        def switches(program):
+            out = [arg for kind, arg in itertools.islice(program, 20) if kind == "scene"]
+            program.close()
+            return out
+        main.playback_random.seed(1)
+        played = switches(first)
+        main.playback_random.seed(2)
+        assert switches(second) == played
+
+    def test_seeded_shuffle_order_is_cached(self):
+        catalog = main.SceneCatalog()
+        catalog.set_scenes(self.EIGHT)
+        assert len({catalog.order("S_", "shuffle", 3) for _ in range(5)}) == 1
+
+    def test_euclid_rests_send_no_switch(self):
+        client = MagicMock()
+        plan = main.compile_action({"action": "loop", "prefix": "S_", "style": "euclid", "tick": 0.1,
+                                    "pulses": 2, "length": 4})
+        program = main.loop_program(SCENES, plan.tick, plan.style, max_repeats=1, options=plan.options)
+        play_on_lanes(client, program)
+        assert [c.args[0] for c in client.set_current_program_scene.call_args_list] == ["S_1", "S_2"]
+
+    @pytest.mark.parametrize("entry, message", [
+        ({"style": "weighted", "weights": {"S_1": -1}}, "weights"),
+        ({"style": "euclid", "pulses": 9, "length": 8}, "pulses"),
+        ({"style": "markov", "transitions": ["S_1"]}, "transitions"),
+        ({"style": "cycle", "seed": "abc"}, "seed"),
+    ])
+    def test_invalid_style_options_raise_config_error(self, entry, message):
+        with pytest.raises(main.ConfigError, match=message):
+            main.compile_action({"action": "loop", "prefix": "S_", "tick": 0.5, **entry})
+
+
 # ---------------------------------------------------------------------------
-# scene_loop tests
+# Loop playback tests
 # ---------------------------------------------------------------------------
 
 class TestSceneLoopCycle:
@@ -138,7 +244,7 @@ class TestSceneLoopStrobe:
 class TestSceneLoopShuffle:
 
     def test_shuffle_cycles_shuffled_order(self):
-        random.seed(42)
+        main.playback_random.seed(42)
         seq = main.build_sequence(SCENES, "shuffle")
         played = run_scene_loop(seq, "shuffle", ticks=8)
         # Should repeat the same shuffled order
@@ -158,7 +264,7 @@ class TestSceneLoopOnce:
 class TestSceneLoopRandom:
 
     def test_random_plays_from_sequence(self):
-        random.seed(42)
+        main.playback_random.seed(42)
         seq = main.build_sequence(SCENES, "random")
         played = run_scene_loop(seq, "random", ticks=6)
         assert len(played) == 6
@@ -168,7 +274,7 @@ class TestSceneLoopRandom:
 class TestSceneLoopRandomNoRepeat:
 
     def test_no_consecutive_duplicates(self):
-        random.seed(42)
+        main.playback_random.seed(42)
         seq = main.build_sequence(SCENES, "random_no_repeat")
         played = run_scene_loop(seq, "random_no_repeat", ticks=20)
         for i in range(1, len(played)):
@@ -177,7 +283,7 @@ class TestSceneLoopRandomNoRepeat:
             )
 
     def test_all_scenes_from_sequence(self):
-        random.seed(42)
+        main.playback_random.seed(42)
         seq = main.build_sequence(SCENES, "random_no_repeat")
         played = run_scene_loop(seq, "random_no_repeat", ticks=10)
         assert all(s in SCENES for s in played)
@@ -191,16 +297,23 @@ class TestSwitchToStaticScene:
 
     def test_switch_to_static_scene_sets_scene(self):
         client = MagicMock()
-        main.stop_event.clear()
         main.switch_to_static_scene(client, "STATIC_1")
+        assert main.lanes.wait_idle(timeout=2)
+        client.set_current_program_scene.assert_called_once_with("STATIC_1")
+
+    def test_switch_to_static_scene_stops_running_loop(self):
+        client = MagicMock()
+        main.start_loop(make_mock_client(["P_1", "P_2"]), "P_", "cycle", tick=60)
+        main.switch_to_static_scene(client, "STATIC_1")
+        assert main.lanes.wait_idle(timeout=2)
         client.set_current_program_scene.assert_called_once_with("STATIC_1")
-        assert main.stop_event.is_set()
 
     def test_switch_to_static_scene_handles_missing_scene(self):
         client = MagicMock()
         client.set_current_program_scene.side_effect = Exception("Scene not found")
         # Should not raise
         main.switch_to_static_scene(client, "DOES_NOT_EXIST")
+        assert main.lanes.wait_idle(timeout=2)
         client.set_current_program_scene.assert_called_once_with("DOES_NOT_EXIST")
 
 
@@ -288,6 +401,276 @@ class TestLoadConfig:
         assert 999 not in main.DEFAULT_MIDI_MAP
 
 
+class TestActionPlans:
+
+    def test_load_config_compiles_plans(self):
+        midi_map = main.ActionMap({
+            48: {"action": "loop", "prefix": "L_", "style": "bounce", "bpm": 120, "steps": 4},
+            49: {"action": "static", "scene": "S"},
+            50: {"action": "sequence", "steps": [{"action": "pause", "resume_note": 51}, {"action": "stop"}]},
+        })
+        loop = midi_map.plan(48)
+        assert (loop.kind, loop.prefix, loop.style, loop.tick) == ("loop", "L_", "bounce", 2.0)
+        assert midi_map.plan(49).scene == "S"
+        assert [step.kind for step in midi_map.plan(50).steps] == ["pause", "stop"]
+        assert midi_map.plan(50).steps[0].resume_note == 51
+        assert midi_map.plan(99) is None
+
+    def test_plan_is_reused_until_its_entry_changes(self):
+        midi_map = main.ActionMap({60: {"action": "static", "scene": "A"}})
+        first = midi_map.plan(60)
+        assert midi_map.plan(60) is first
+        with patch.dict(midi_map, {60: {"action": "static", "scene": "B"}}):
+            assert midi_map.plan(60).scene == "B"
+
+    def test_explicit_tick_is_accepted(self):
+        plan = main.compile_action({"action": "loop", "prefix": "X_", "tick": 0.5})
+        assert (plan.style, plan.tick) == ("cycle", 0.5)
+
+    @pytest.mark.parametrize("entry, message", [
+        ({"action": "static"}, "scene"),
+        ({"action": "loop", "prefix": "X_", "style": "sideways", "bpm": 120, "steps": 4}, "sideways"),
+        ({"action": "loop", "prefix": "X_", "bpm": 0, "steps": 4}, "bpm"),
+        ({"action": "loop", "prefix": "X_", "bpm": 120, "steps": 4, "repeats": 0}, "repeats"),
+        ({"action": "sequence", "steps": []}, "steps"),
+        ({"action": "sequence", "steps": [{"action": "sequence", "steps": [{"action": "stop"}]}]}, "nested"),
+        ({"action": "static", "scene": "A", "requests": [{"requestData": {}}]}, "requests"),
+        ({"action": "teleport"}, "teleport"),
+        ("static", "action"),
+    ])
+    def test_invalid_entries_raise_config_error(self, entry, message):
+        with pytest.raises(main.ConfigError, match=message):
+            main.ActionMap({60: entry})
+
+    def test_load_config_rejects_non_numeric_notes(self, tmp_path):
+        path = tmp_path / "config.json"
+        path.write_text(json.dumps({"C2": {"action": "static", "scene": "A"}}))
+        with pytest.raises(main.ConfigError, match="note keys"):
+            main.load_config(str(path))
+
+    def test_sequence_reuses_scene_order_across_passes(self):
+        client = make_mock_client(["P_1", "P_2", "P_3"])
+        catalog = main.SceneCatalog()
+        catalog.load(client)
+        catalog.live = True
+        steps = [
+            {"action": "loop", "prefix": "P_", "style": "bounce", "bpm": 60000, "steps": 1, "repeats": 1},
+            {"action": "loop", "prefix": "P_", "style": "bounce", "bpm": 60000, "steps": 1, "repeats": 1},
+        ]
+        program = main.sequence_program(steps)
+        build = MagicMock(wraps=main.build_sequence)
+        orders = []
+        with patch.object(main, "build_sequence", build):
+            command = next(program)
+            while len(orders) < 6:
+                if command[0] == "order":
+                    orders.append(catalog.order(*command[1]))
+                command = program.send(None)
+        program.close()
+        assert build.call_count == 1
+        assert orders[0] == ("P_1", "P_2", "P_3", "P_2")
+
+    def test_scene_order_follows_catalog_changes(self):
+        catalog = main.SceneCatalog()
+        catalog.set_scenes(["P_1", "P_2"])
+        assert catalog.order("P_", "reverse") == ("P_2", "P_1")
+        catalog.on_scene_created(scene_event(scene_name="P_3", is_group=False))
+        assert catalog.order("P_", "reverse") == ("P_3", "P_2", "P_1")
+
+    def test_shuffle_order_is_not_cached(self):
+        catalog = main.SceneCatalog()
+        catalog.set_scenes(f"P_{i}" for i in range(20))
+        assert len({catalog.order("P_", "shuffle") for _ in range(5)}) > 1
+
+    def test_lane_defaults_to_main_and_is_validated(self):
+        assert main.compile_action({"action": "static", "scene": "S"}).lane == "main"
+        plan = main.compile_action({"action": "loop", "prefix": "FX_", "tick": 0.1, "lane": "overlay"})
+        assert plan.lane == "overlay"
+        with pytest.raises(main.ConfigError, match="lane"):
+            main.compile_action({"action": "static", "scene": "S", "lane": ""})
+
+
+class TestConfigWatcher:
+
+    LOOP = {"action": "loop", "prefix": "L_", "style": "cycle", "bpm": 120, "steps": 4}
+    STATIC = {"action": "static", "scene": "S"}
+
+    @pytest.fixture
+    def config(self, tmp_path):
+        path = tmp_path / "config.json"
+        path.write_text(json.dumps({"60": self.LOOP, "61": self.STATIC}))
+        with patch.object(main, "MIDI_MAP", main.load_config(str(path))):
+            yield path
+
+    def wait_for(self, predicate, timeout: float = 2.0) -> None:
+        deadline = main.time.monotonic() + timeout
+        while not predicate():
+            assert main.time.monotonic() < deadline, "condition not reached in time"
+            main.time.sleep(0.01)
+
+    def test_reload_keeps_plans_of_unchanged_notes(self, config):
+        changed = []
+        watcher = main.ConfigWatcher(str(config), on_change=changed.append)
+        before = main.MIDI_MAP
+        config.write_text(json.dumps({"60": self.LOOP, "61": {"action": "static", "scene": "T"}, "62": self.STATIC}))
+        assert watcher.reload()
+        assert main.MIDI_MAP.plan(60) is before.plan(60)
+        assert main.MIDI_MAP.plan(61).scene == "T"
+        assert changed == [{61, 62}]
+
+    def test_identical_content_is_not_reloaded(self, config):
+        watcher = main.ConfigWatcher(str(config))
+        before = main.MIDI_MAP
+        config.write_text(config.read_text())
+        assert not watcher.reload()
+        assert main.MIDI_MAP is before
+
+    def test_invalid_config_keeps_current_map_and_retries(self, config):
+        watcher = main.ConfigWatcher(str(config))
+        before = main.MIDI_MAP
+        config.write_text('{"60": {"action": "loop", ')
+        assert not watcher.reload()
+        assert main.MIDI_MAP is before
+        config.write_text(json.dumps({"60": self.STATIC}))
+        assert watcher.reload()
+        assert main.MIDI_MAP.plan(60).kind == "static"
+
+    def run_watcher(self, config, **kwargs):
+        watcher = main.ConfigWatcher(str(config), debounce=0.05, **kwargs)
+        thread = main.threading.Thread(target=watcher.run, daemon=True)
+        thread.start()
+        main.time.sleep(0.05)
+        return watcher, thread
+
+    def test_close_after_run_has_finished(self, config):
+        watcher, thread = self.run_watcher(config, use_inotify=False)
+        watcher.close()
+        thread.join(2)
+        watcher.close()   # the wake-up pipe is gone; nothing left to wake
+
+    @pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is Linux-only")
+    def test_inotify_debounces_a_multi_step_save(self, config):
+        watcher, thread = self.run_watcher(config, use_inotify=True)
+        try:
+            with open(config, "w") as f:
+                f.write('{"60": ')
+                f.flush()
+                main.time.sleep(0.01)
+                f.write(json.dumps(self.STATIC) + "}")
+            self.wait_for(lambda: watcher.reloads)
+            main.time.sleep(0.1)
+            assert watcher.reloads == 1
+            assert main.MIDI_MAP.plan(60).kind == "static"
+        finally:
+            watcher.close()
+            thread.join(timeout=2)
+        assert not thread.is_alive()
+
+    @pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is Linux-only")
+    def test_inotify_sees_atomic_rename(self, config, tmp_path):
+        watcher, thread = self.run_watcher(config, use_inotify=True)
+        try:
+            tmp = tmp_path / "config.json.tmp"
+            tmp.write_text(json.dumps({"61": self.LOOP}))
+            os.replace(tmp, config)
+            self.wait_for(lambda: watcher.reloads)
+            assert list(main.MIDI_MAP) == [61]
+        finally:
+            watcher.close()
+            thread.join(timeout=2)
+
+    def test_polling_fallback(self, config):
+        watcher, thread = self.run_watcher(config, use_inotify=False, poll_interval=0.02)
+        try:
+            config.write_text(json.dumps({"60": self.STATIC}))
+            self.wait_for(lambda: watcher.reloads)
+            assert main.MIDI_MAP.plan(60).kind == "static"
+        finally:
+            watcher.close()
+            thread.join(timeout=2)
+
+    def test_changed_running_loop_restarts(self, config):
+        play = MagicMock()
+        with patch.object(main.lanes, "notes", return_value={"main": 60}), \
+                patch.object(main.lanes, "play", play):
+            main.restart_changed_loop(MagicMock(), {61})
+            assert not play.called
+            main.restart_changed_loop(MagicMock(), {60})
+        play.assert_called_once()
+        assert play.call_args.args[1] == "main" and play.call_args.kwargs["note"] == 60
+
+
+class TestStartup:
+
+    APP_DIR = os.path.dirname(os.path.abspath(__file__))
+    HEAVY = ("asyncio", "mido", "obsws_python", "dotenv", "websockets", "questionary")
+    # Whole import of main.py, dependencies included, with -X importtime.
+    # Generous, to allow for compiling main.py on a slow runner: it catches
+    # work creeping back into import (reading config, touching devices), and
+    # test_import_loads_no_heavy_packages catches the imports themselves.
+    IMPORT_BUDGET_US = 500_000
+
+    def run_python(self, *args: str) -> subprocess.CompletedProcess:
+        return subprocess.run([sys.executable, *args], cwd=self.APP_DIR,
+                              capture_output=True, text=True, timeout=30)
+
+    def test_import_has_no_side_effects(self):
+        result = self.run_python("-c", (
+            "import sys, main; "
+            f"print([m for m in {self.HEAVY!r} if m in sys.modules], len(main.MIDI_MAP))"
+        ))
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.strip() == "[] 0"
+
+    def test_import_loads_no_heavy_packages(self):
+        # Against the interpreter's own start-up modules, so no submodule of a
+        # heavy package (or one of theirs, e.g. websocket) sneaks in either
+        result = self.run_python("-c", (
+            "import json, sys; before = set(sys.modules); import main; "
+            "print(json.dumps(sorted(set(sys.modules) - before)))"
+        ))
+        assert result.returncode == 0, result.stderr
+        loaded = json.loads(result.stdout)
+        heavy = self.HEAVY + ("websocket", "rtmidi", "concurrent")
+        assert [m for m in loaded if m.split(".")[0] in heavy] == []
+
+    def test_import_time_budget(self):
+        result = self.run_python("-X", "importtime", "-c", "import main")
+        assert result.returncode == 0, result.stderr
+        line = next(l for l in result.stderr.splitlines() if l.rstrip().endswith("| main"))
+        cumulative_us = int(line.split("|")[1])
+        assert cumulative_us < self.IMPORT_BUDGET_US, line
+
+    def test_lazy_module_imports_on_first_use(self):
+        loads = []
+
+        def loader():
+            loads.append(1)
+            return json
+
+        lazy = main._LazyModule(loader)
+        assert not loads
+        assert lazy.dumps(1) == "1"
+        assert lazy.loads("2") == 2
+        assert loads == [1]
+
+    def test_select_config_loads_the_chosen_file(self, tmp_path):
+        path = tmp_path / "show.json"
+        path.write_text(json.dumps({"60": {"action": "static", "scene": "A"}}))
+        with patch.object(main, "find_config_files", return_value=[str(path)]), \
+                patch.object(main, "MIDI_MAP", main.ActionMap()), \
+                patch.object(main, "_active_config", main.CONFIG_PATH):
+            main.select_config()
+            assert main._active_config == str(path)
+            assert main.MIDI_MAP.plan(60).scene == "A"
+
+    def test_load_env_reads_dotenv_values(self, monkeypatch):
+        monkeypatch.setenv("OBS_PORT", "4999")
+        with patch.object(main, "OBS_PORT", 4455):
+            main.load_env()
+            assert main.OBS_PORT == 4999
+
+
 # ---------------------------------------------------------------------------
 # max_repeats tests
 # ---------------------------------------------------------------------------
@@ -318,7 +701,7 @@ class TestSceneLoopMaxRepeats:
         assert played == ["S_1", "S_2", "S_3", "S_4", "S_1", "S_2"]
 
     def test_random_stops_after_max_repeats(self):
-        random.seed(42)
+        main.playback_random.seed(42)
         seq = main.build_sequence(SCENES, "random")
         # 4 scenes, 2 repeats = 8 random picks
         played = run_scene_loop(seq, "random", ticks=100, max_repeats=2)
@@ -333,7 +716,7 @@ class TestSceneLoopMaxRepeats:
 
 
 # ---------------------------------------------------------------------------
-# run_sequence tests
+# Sequence playback tests
 # ---------------------------------------------------------------------------
 
 def make_mock_client(scene_names: list[str]):
@@ -345,7 +728,25 @@ def make_mock_client(scene_names: list[str]):
     return client
 
 
-class TestRunSequence:
+class TestSequencePlayback:
+
+    @pytest.fixture(autouse=True)
+    def _no_skipped_ticks(self):
+        # Waits are mocked out here, so a GC pause alone could make a loop
+        # "late" and skip a scene under the default policy
+        with patch.object(main, "LATE_TICK_POLICY", "catch_up"):
+            yield
+
+    @staticmethod
+    def played(client) -> list[str]:
+        return [c.args[0] for c in client.set_current_program_scene.call_args_list]
+
+    @staticmethod
+    def start(client, steps, trigger_note=None) -> "main.Lanes":
+        """Start a sequence on fresh Lanes whose waits take no time."""
+        lanes = main.Lanes(clock=FastClock())
+        lanes.play(main.sequence_program(steps, trigger_note), client=client)
+        return lanes
 
     def test_sequence_runs_steps_in_order(self):
         client = make_mock_client(["P_1", "P_2", "P_3"])
@@ -355,15 +756,12 @@ class TestRunSequence:
             {"action": "stop"},
         ]
 
-        main.stop_event.clear()
-        with patch.object(main.stop_event, "wait"):
-            main.run_sequence(client, steps)
+        play_on_lanes(client, main.sequence_program(steps))
 
-        calls = [c.args[0] for c in client.set_current_program_scene.call_args_list]
         # Step 1: cycle 1 repeat = P_1, P_2, P_3
         # Step 2: reverse 1 repeat = P_3, P_2, P_1
         # Step 3: stop
-        assert calls == ["P_1", "P_2", "P_3", "P_3", "P_2", "P_1"]
+        assert self.played(client) == ["P_1", "P_2", "P_3", "P_3", "P_2", "P_1"]
 
     def test_sequence_with_static_step(self):
         """Static as the last step — no infinite loop, runs to completion."""
@@ -373,27 +771,11 @@ class TestRunSequence:
             {"action": "static", "scene": "STATIC_1"},
         ]
 
-        main.stop_event.clear()
-        with patch.object(main.stop_event, "wait"):
-            main.run_sequence(client, steps)
+        play_on_lanes(client, main.sequence_program(steps))
 
-        calls = [c.args[0] for c in client.set_current_program_scene.call_args_list]
         # Step 1: cycle P_1, P_2 (1 repeat)
         # Step 2: static → STATIC_1
-        assert calls == ["P_1", "P_2", "STATIC_1"]
-
-    def test_sequence_cancelled_by_stop_event(self):
-        client = make_mock_client(["P_1", "P_2"])
-        steps = [
-            {"action": "loop", "prefix": "P_", "style": "cycle", "bpm": 6000, "steps": 1, "repeats": 1},
-            {"action": "loop", "prefix": "P_", "style": "cycle", "bpm": 6000, "steps": 1, "repeats": 1},
-        ]
-
-        # Set stop_event before running — should abort immediately
-        main.stop_event.set()
-        main.run_sequence(client, steps)
-
-        client.set_current_program_scene.assert_not_called()
+        assert self.played(client) == ["P_1", "P_2", "STATIC_1"]
 
     def test_sequence_cancel_mid_loop(self):
         client = make_mock_client(["P_1", "P_2", "P_3"])
@@ -401,23 +783,19 @@ class TestRunSequence:
             {"action": "loop", "prefix": "P_", "style": "cycle", "bpm": 6000, "steps": 1, "repeats": 2},
             {"action": "static", "scene": "SHOULD_NOT_REACH"},
         ]
-        call_count = 0
 
-        def fake_wait(_duration):
-            nonlocal call_count
-            call_count += 1
-            # Cancel after 2 scenes (mid first repeat)
-            if call_count >= 2:
-                main.stop_event.set()
+        def cancel_after_two(_scene):
+            # Cancel after 2 scenes (mid first repeat); called on the scheduler
+            # thread, so don't wait for the lane to go idle
+            if client.set_current_program_scene.call_count == 2:
+                lanes.stop(timeout=0)
 
-        main.stop_event.clear()
-        with patch.object(main.stop_event, "wait", side_effect=fake_wait):
-            main.run_sequence(client, steps)
+        client.set_current_program_scene.side_effect = cancel_after_two
+        lanes = self.start(client, steps)
+        assert lanes.wait_idle(timeout=2)
 
-        calls = [c.args[0] for c in client.set_current_program_scene.call_args_list]
         # Should have played 2 scenes then stopped, never reaching the static step
-        assert len(calls) == 2
-        assert "SHOULD_NOT_REACH" not in calls
+        assert self.played(client) == ["P_1", "P_2"]
 
     def test_sequence_loops_continuously(self):
         """Without a terminal action, sequence wraps back to step 1."""
@@ -425,22 +803,12 @@ class TestRunSequence:
         steps = [
             {"action": "loop", "prefix": "P_", "style": "cycle", "bpm": 6000, "steps": 1, "repeats": 1},
         ]
-        call_count = 0
-
-        def fake_wait(_duration):
-            nonlocal call_count
-            call_count += 1
-            # Let it loop through 2 full passes (2 scenes each) then stop
-            if call_count >= 4:
-                main.stop_event.set()
 
-        main.stop_event.clear()
-        with patch.object(main.stop_event, "wait", side_effect=fake_wait):
-            main.run_sequence(client, steps)
+        # Let it loop through 2 full passes (2 scenes each) then stop
+        play_on_lanes(client, main.sequence_program(steps), waits=4)
 
-        calls = [c.args[0] for c in client.set_current_program_scene.call_args_list]
         # Pass 1: P_1, P_2 — Pass 2: P_1, P_2
-        assert calls == ["P_1", "P_2", "P_1", "P_2"]
+        assert self.played(client) == ["P_1", "P_2", "P_1", "P_2"]
 
     def test_stop_action_terminates_sequence(self):
         """Stop action ends the sequence without switching scenes."""
@@ -450,13 +818,10 @@ class TestRunSequence:
             {"action": "stop"},
         ]
 
-        main.stop_event.clear()
-        with patch.object(main.stop_event, "wait"):
-            main.run_sequence(client, steps)
+        play_on_lanes(client, main.sequence_program(steps))
 
-        calls = [c.args[0] for c in client.set_current_program_scene.call_args_list]
         # Loop plays P_1, P_2 then stop — no extra scene switch
-        assert calls == ["P_1", "P_2"]
+        assert self.played(client) == ["P_1", "P_2"]
 
     def test_sequence_multiple_repeats_then_next_step(self):
         """Non-last loop steps respect their repeats count before advancing."""
@@ -466,16 +831,13 @@ class TestRunSequence:
             {"action": "static", "scene": "DONE"},
         ]
 
-        main.stop_event.clear()
-        with patch.object(main.stop_event, "wait"):
-            main.run_sequence(client, steps)
+        play_on_lanes(client, main.sequence_program(steps))
 
-        calls = [c.args[0] for c in client.set_current_program_scene.call_args_list]
         # 2 repeats of [P_1, P_2] = 4 scenes, then static
-        assert calls == ["P_1", "P_2", "P_1", "P_2", "DONE"]
+        assert self.played(client) == ["P_1", "P_2", "P_1", "P_2", "DONE"]
 
     def test_pause_resumes_and_continues(self):
-        """Pause waits for resume_event, then continues to the next step."""
+        """Pause holds the lane until its note resumes it, then moves to the next step."""
         client = make_mock_client(["P_1", "P_2"])
         steps = [
             {"action": "loop", "prefix": "P_", "style": "cycle", "bpm": 6000, "steps": 1, "repeats": 1},
@@ -483,24 +845,16 @@ class TestRunSequence:
             {"action": "static", "scene": "DONE"},
         ]
 
-        def fake_resume_wait(timeout):
-            """Simulate the resume arriving immediately."""
-            main.resume_event.set()
-
-        main.stop_event.clear()
-        main.resume_event.clear()
-        main.pause_resume_note = None
+        lanes = self.start(client, steps, trigger_note=36)
+        assert until_true(lambda: lanes.paused() == {"main": 36})
+        assert lanes.resume(36)
+        assert lanes.wait_idle(timeout=2)
 
-        with patch.object(main.stop_event, "wait"), \
-             patch.object(main.resume_event, "wait", side_effect=fake_resume_wait):
-            main.run_sequence(client, steps, trigger_note=36)
-
-        calls = [c.args[0] for c in client.set_current_program_scene.call_args_list]
         # Loop: P_1, P_2 → pause (resumed) → static: DONE
-        assert calls == ["P_1", "P_2", "DONE"]
+        assert self.played(client) == ["P_1", "P_2", "DONE"]
 
-    def test_pause_cancelled_by_stop_event(self):
-        """Stop event during pause cancels the sequence."""
+    def test_pause_cancelled_by_stop(self):
+        """Stopping the lane during a pause cancels the sequence."""
         client = make_mock_client(["P_1", "P_2"])
         steps = [
             {"action": "loop", "prefix": "P_", "style": "cycle", "bpm": 6000, "steps": 1, "repeats": 1},
@@ -508,47 +862,43 @@ class TestRunSequence:
             {"action": "static", "scene": "SHOULD_NOT_REACH"},
         ]
 
-        def fake_resume_wait(timeout):
-            """Simulate cancellation arriving during pause."""
-            main.stop_event.set()
-
-        main.stop_event.clear()
-        main.resume_event.clear()
-        main.pause_resume_note = None
-
-        with patch.object(main.stop_event, "wait"), \
-             patch.object(main.resume_event, "wait", side_effect=fake_resume_wait):
-            main.run_sequence(client, steps, trigger_note=36)
+        lanes = self.start(client, steps, trigger_note=36)
+        assert until_true(lambda: lanes.paused() == {"main": 36})
+        assert lanes.stop(timeout=2)
 
-        calls = [c.args[0] for c in client.set_current_program_scene.call_args_list]
         # Loop: P_1, P_2 → pause (cancelled) — static never reached
-        assert calls == ["P_1", "P_2"]
-        assert "SHOULD_NOT_REACH" not in calls
+        assert self.played(client) == ["P_1", "P_2"]
+        assert lanes.paused() == {}
+
+    def test_pause_resumes_without_polling(self):
+        client = make_mock_client(["P_1"])
+        steps = [{"action": "pause"}, {"action": "static", "scene": "DONE"}]
+        lanes = self.start(client, steps, trigger_note=36)
+        assert until_true(lambda: lanes.paused() == {"main": 36})
+        wakeups = lanes.wakeups
+        main.time.sleep(0.3)
+        assert lanes.wakeups == wakeups   # no re-checks while paused
+        resumed = main.time.perf_counter()
+        lanes.resume(36)
+        assert lanes.wait_idle(timeout=2)
+        assert main.time.perf_counter() - resumed < 0.05
+        client.set_current_program_scene.assert_called_once_with("DONE")
 
     def test_pause_uses_trigger_note_by_default(self):
-        """Pause sets pause_resume_note to the trigger note."""
+        """Pause waits for the note that started the sequence."""
         client = make_mock_client(["P_1"])
         steps = [
             {"action": "pause"},
             {"action": "stop"},
         ]
 
-        resume_notes_seen = []
-
-        def fake_resume_wait(timeout):
-            resume_notes_seen.append(main.pause_resume_note)
-            main.resume_event.set()
-
-        main.stop_event.clear()
-        main.resume_event.clear()
-        main.pause_resume_note = None
-
-        with patch.object(main.resume_event, "wait", side_effect=fake_resume_wait):
-            main.run_sequence(client, steps, trigger_note=42)
-
-        assert resume_notes_seen[0] == 42
-        # pause_resume_note should be cleared after pause exits
-        assert main.pause_resume_note is None
+        lanes = self.start(client, steps, trigger_note=42)
+        assert until_true(lambda: lanes.paused() == {"main": 42})
+        assert not lanes.resume(36)
+        assert lanes.resume(42)
+        assert lanes.wait_idle(timeout=2)
+        # No longer paused once it has resumed
+        assert lanes.paused() == {}
 
     def test_pause_uses_custom_resume_note(self):
         """Pause respects a custom resume_note override."""
@@ -558,20 +908,9 @@ class TestRunSequence:
             {"action": "stop"},
         ]
 
-        resume_notes_seen = []
-
-        def fake_resume_wait(timeout):
-            resume_notes_seen.append(main.pause_resume_note)
-            main.resume_event.set()
-
-        main.stop_event.clear()
-        main.resume_event.clear()
-        main.pause_resume_note = None
-
-        with patch.object(main.resume_event, "wait", side_effect=fake_resume_wait):
-            main.run_sequence(client, steps, trigger_note=36)
-
-        assert resume_notes_seen[0] == 99
+        lanes = self.start(client, steps, trigger_note=36)
+        assert until_true(lambda: lanes.paused() == {"main": 99})
+        assert lanes.stop(timeout=2)
 
 
 # ---------------------------------------------------------------------------
@@ -672,3 +1011,1973 @@ class TestPickConfigFile:
         monkeypatch.setattr("questionary.select", lambda *a, **kw: mock_result)
         with pytest.raises(SystemExit):
             main.pick_config_file(files)
+
+
+# ---------------------------------------------------------------------------
+# SceneCatalog tests
+# ---------------------------------------------------------------------------
+
+def scene_event(**fields):
+    """Build an object shaped like an obsws_python event dataclass."""
+    return MagicMock(spec=list(fields), **fields)
+
+
+class TestSceneCatalog:
+
+    def make_live_catalog(self, client):
+        catalog = main.SceneCatalog()
+        catalog.attach(MagicMock())
+        catalog.load(client)
+        return catalog
+
+    def test_lookup_is_natural_sorted_and_filtered(self):
+        client = make_mock_client(["P_10", "P_2", "Q_1", "P_1"])
+        catalog = self.make_live_catalog(client)
+        assert catalog.scenes_for(client, "P_") == ["P_1", "P_2", "P_10"]
+
+    def test_live_catalog_does_not_refetch(self):
+        client = make_mock_client(["P_1", "P_2"])
+        catalog = self.make_live_catalog(client)
+        for _ in range(5):
+            catalog.scenes_for(client, "P_")
+            catalog.scenes_for(client, "Q_")
+        assert client.get_scene_list.call_count == 1
+
+    def test_catalog_without_events_refetches_every_lookup(self):
+        client = make_mock_client(["P_1", "P_2"])
+        catalog = main.SceneCatalog()
+        catalog.scenes_for(client, "P_")
+        catalog.scenes_for(client, "P_")
+        assert client.get_scene_list.call_count == 2
+
+    def test_new_client_reloads(self):
+        first = make_mock_client(["P_1"])
+        catalog = self.make_live_catalog(first)
+        second = make_mock_client(["P_1", "P_2"])
+        assert catalog.scenes_for(second, "P_") == ["P_1", "P_2"]
+
+    def test_attach_registers_scene_callbacks(self):
+        events = MagicMock()
+        catalog = main.SceneCatalog()
+        catalog.attach(events)
+        registered = events.callback.register.call_args.args[0]
+        assert {fn.__name__ for fn in registered} == {
+            "on_scene_created", "on_scene_removed",
+            "on_scene_name_changed", "on_scene_list_changed",
+        }
+        assert catalog.live
+
+    def test_scene_created_event(self):
+        client = make_mock_client(["P_1", "P_3"])
+        catalog = self.make_live_catalog(client)
+        assert catalog.scenes_for(client, "P_") == ["P_1", "P_3"]
+        catalog.on_scene_created(scene_event(scene_name="P_2", is_group=False))
+        assert catalog.scenes_for(client, "P_") == ["P_1", "P_2", "P_3"]
+        assert client.get_scene_list.call_count == 1
+
+    def test_group_created_event_is_ignored(self):
+        client = make_mock_client(["P_1"])
+        catalog = self.make_live_catalog(client)
+        catalog.on_scene_created(scene_event(scene_name="P_GROUP", is_group=True))
+        assert catalog.scenes_for(client, "P_") == ["P_1"]
+
+    def test_scene_removed_event(self):
+        client = make_mock_client(["P_1", "P_2"])
+        catalog = self.make_live_catalog(client)
+        catalog.on_scene_removed(scene_event(scene_name="P_1", is_group=False))
+        assert catalog.scenes_for(client, "P_") == ["P_2"]
+
+    def test_scene_renamed_event(self):
+        client = make_mock_client(["P_1", "P_2"])
+        catalog = self.make_live_catalog(client)
+        catalog.on_scene_name_changed(scene_event(old_scene_name="P_2", scene_name="Q_1"))
+        assert catalog.scenes_for(client, "P_") == ["P_1"]
+        assert catalog.scenes_for(client, "Q_") == ["Q_1"]
+
+    def test_scene_list_changed_event_replaces_everything(self):
+        client = make_mock_client(["P_1", "P_2"])
+        catalog = self.make_live_catalog(client)
+        catalog.on_scene_list_changed(scene_event(scenes=[{"sceneName": "R_1"}]))
+        assert catalog.scenes_for(client, "P_") == []
+        assert catalog.scenes_for(client, "R_") == ["R_1"]
+
+    def test_events_bump_version(self):
+        client = make_mock_client(["P_1"])
+        catalog = self.make_live_catalog(client)
+        before = catalog.version
+        catalog.on_scene_created(scene_event(scene_name="P_2", is_group=False))
+        assert catalog.version == before + 1
+
+    def test_lookup_racing_a_scene_event_is_not_served_afterwards(self):
+        client = make_mock_client(["P_1"])
+        catalog = self.make_live_catalog(client)
+        sort_key = main.natural_sort_key
+
+        def racing(name):
+            catalog.on_scene_created(scene_event(scene_name="P_2", is_group=False))
+            return sort_key(name)
+
+        with patch.object(main, "natural_sort_key", racing):
+            assert catalog.lookup("P_") == ["P_1"]
+        assert catalog.lookup("P_") == ["P_1", "P_2"]
+
+
+# ---------------------------------------------------------------------------
+# TickClock tests
+# ---------------------------------------------------------------------------
+
+class FakeClock:
+    """Manually advanced stand-in for time.perf_counter_ns."""
+
+    def __init__(self, start: int = 1_000_000_000):
+        self.now = start
+
+    def __call__(self) -> int:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += round(seconds * 1_000_000_000)
+
+
+class TestTickClock:
+
+    def test_deadlines_are_absolute(self):
+        fake = FakeClock()
+        clock = main.TickClock(0.5, clock=fake)
+        clock.fire()
+        fake.advance(0.1)  # time spent switching the scene
+        assert clock.remaining() == pytest.approx(0.4)
+        fake.advance(0.4)
+        clock.fire()
+        fake.advance(0.2)
+        assert clock.remaining() == pytest.approx(0.3)
+        assert clock.deadline() == clock.origin + 2 * 500_000_000
+
+    def test_no_drift_over_many_ticks(self):
+        fake = FakeClock()
+        clock = main.TickClock(0.5, clock=fake)
+        for _ in range(1200):
+            clock.fire()
+            fake.advance(0.03)  # slow OBS request every tick
+            fake.advance(clock.remaining())
+        # 1200 ticks at 0.5s land exactly 600s after the start
+        assert fake.now - clock.origin == 600 * 1_000_000_000
+
+    def test_skip_policy_drops_missed_ticks(self):
+        fake = FakeClock()
+        clock = main.TickClock(0.5, policy="skip", clock=fake)
+        clock.fire()
+        clock.remaining()
+        fake.advance(1.6)  # deadline was at 0.5s, now three ticks behind
+        assert clock.fire() == 2
+        assert clock.remaining() == pytest.approx(0.4)
+        assert clock.stats.skipped == 2
+
+    def test_catch_up_policy_plays_missed_ticks_immediately(self):
+        fake = FakeClock()
+        clock = main.TickClock(0.5, policy="catch_up", clock=fake)
+        clock.fire()
+        clock.remaining()
+        fake.advance(1.6)
+        assert clock.fire() == 0
+        assert clock.remaining() == 0
+        assert clock.fire() == 0
+        assert clock.remaining() == 0
+        clock.fire()
+        assert clock.remaining() == pytest.approx(0.4)
+
+    def test_unknown_policy_raises(self):
+        with pytest.raises(ValueError):
+            main.TickClock(0.5, policy="wobble")
+
+    def test_jitter_stats(self):
+        fake = FakeClock()
+        clock = main.TickClock(0.5, clock=fake)
+        clock.fire()
+        fake.advance(clock.remaining() + 0.003)
+        clock.fire()
+        stats = clock.stats.summary()
+        assert stats["ticks"] == 2
+        assert stats["max_ms"] == pytest.approx(3.0)
+        assert stats["late"] == 1
+        assert stats["skipped"] == 0
+
+    def test_early_ticks_count_as_on_time(self):
+        fake = FakeClock()
+        clock = main.TickClock(0.5, clock=fake)
+        clock.fire()
+        fake.advance(clock.remaining() - 0.004)
+        clock.fire()
+        stats = clock.stats.summary()
+        assert (stats["mean_ms"], stats["max_ms"], stats["late"], stats["early"]) == (0.0, 0.0, 0, 1)
+
+    def test_empty_stats_summary(self):
+        assert main.JitterStats().summary()["ticks"] == 0
+
+
+def midi_msg(kind: str, **kwargs):
+    return main.mido.Message(kind, **kwargs)
+
+
+class TestMidiClock:
+
+    @staticmethod
+    def pulses(mc, fake, count, bpm, jitter_ms=0.0, seed=1):
+        """Feed *count* clock pulses at *bpm*, each arriving up to ±jitter_ms off the grid."""
+        rng = random.Random(seed)
+        period = 60.0 / (bpm * 24)
+        for _ in range(count):
+            fake.advance(period)
+            mc.feed(midi_msg("clock"), fake.now + round(rng.uniform(-jitter_ms, jitter_ms) * 1e6))
+
+    def test_tempo_estimate_filters_jitter(self):
+        fake = FakeClock()
+        mc = main.MidiClock(clock=fake)
+        mc.feed(midi_msg("start"))
+        self.pulses(mc, fake, 24 * 16, bpm=120, jitter_ms=1.0)
+        assert mc.bpm == pytest.approx(120, abs=0.5)
+        # The predicted grid sits much closer to the true beat than single pulses do
+        next_beat = fake.now + round(0.5 * 1e9)
+        assert abs(mc.time_of(mc.pulse + 24) - next_beat) < 1_000_000
+
+    def test_follows_tempo_changes(self):
+        fake = FakeClock()
+        mc = main.MidiClock(clock=fake)
+        mc.feed(midi_msg("start"))
+        self.pulses(mc, fake, 24 * 8, bpm=120)
+        self.pulses(mc, fake, 24 * 16, bpm=128)
+        assert mc.bpm == pytest.approx(128, abs=0.5)
+
+    def test_transport_and_song_position(self):
+        fake = FakeClock()
+        mc = main.MidiClock(clock=fake)
+        self.pulses(mc, fake, 10, bpm=120)
+        assert mc.pulse == -1 and not mc.locked   # clock ignored until start
+        mc.feed(midi_msg("start"))
+        self.pulses(mc, fake, 3, bpm=120)
+        assert mc.pulse == 2 and mc.locked
+        mc.feed(midi_msg("stop"))
+        self.pulses(mc, fake, 5, bpm=120)
+        assert mc.pulse == 2 and not mc.locked
+        mc.feed(midi_msg("songpos", pos=16))   # bar 2 in 16th notes
+        mc.feed(midi_msg("continue"))
+        self.pulses(mc, fake, 1, bpm=120)
+        assert mc.pulse == 96 and mc.locked
+
+    def test_beat_clock_waits_for_predicted_beats_and_holds_when_stopped(self):
+        fake = FakeClock()
+        mc = main.MidiClock(clock=fake)
+        mc.feed(midi_msg("start"))
+        self.pulses(mc, fake, 1, bpm=120)
+        self.pulses(mc, fake, 12, bpm=120)    # half way through beat 0
+        clock = main.BeatClock(mc, beats=1, clock=fake)
+        assert clock.fire() == 0              # first switch on trigger
+        assert clock.remaining() == pytest.approx(0.25, abs=1e-3)
+        fake.advance(0.25)
+        assert clock.pending() == 0.0
+        mc.feed(midi_msg("stop"))
+        assert clock.remaining() is None   # hold until the transport runs again
+
+    def test_synced_loop_switches_on_the_clock_grid(self):
+        fake = FakeClock()
+        mc = main.MidiClock(clock=fake)
+        mc.feed(midi_msg("start"))
+        self.pulses(mc, fake, 2, bpm=120)
+        program = main.loop_program(["A", "B"], tick=99, style="cycle",
+                                    clock=main.BeatClock(mc, beats=2, clock=fake))
+        assert next(program)[0] == "timeline"
+        assert program.send(None) == ("scene", "A")
+        kind, arg = program.send(None)
+        # Slices of at most MAX_WAIT until the bar-aligned deadline one second in
+        waits = []
+        while kind == "wait":
+            waits.append(arg)
+            self.pulses(mc, fake, round(arg / (0.5 / 24)), bpm=120)
+            kind, arg = program.send(None)
+        assert (kind, arg) == ("scene", "B")
+        assert max(waits) <= main.BeatClock.MAX_WAIT
+        assert mc.pulse == 48
+        program.close()
+
+    def test_bpm_steps_loops_sync_only_when_enabled(self):
+        plan = main.compile_action({"action": "loop", "prefix": "P_", "bpm": 120, "steps": 4})
+        assert plan.beats == 4
+        with patch.object(main, "MIDI_CLOCK_SYNC", True):
+            assert isinstance(main.beat_clock(plan.beats), main.BeatClock)
+            assert main.beat_clock(None) is None
+        assert main.beat_clock(plan.beats) is None
+
+    def test_handle_midi_feeds_clock_messages(self):
+        with patch.object(main.midi_clock, "feed") as feed:
+            main.handle_midi(midi_msg("clock"), MagicMock())
+            main.handle_midi(midi_msg("control_change"), MagicMock())
+        assert feed.call_count == 1
+
+
+class TestSceneLoopLateTicks:
+
+    def run_with_stall(self, style: str, policy: str, stall_at: int, stall: float,
+                       ticks: int) -> list[str]:
+        """Play a loop on a fake clock; the OBS call at *stall_at* takes *stall* seconds."""
+        fake = FakeClock()
+        clock = main.TickClock(0.5, policy=policy, clock=fake)
+        client = MagicMock()
+        played = []
+
+        def fake_set(scene):
+            played.append(scene)
+            if len(played) == stall_at:
+                fake.advance(stall)
+
+        def fake_wait(duration):
+            fake.advance(duration)
+            return len(played) >= ticks
+
+        client.set_current_program_scene.side_effect = fake_set
+        play_on_lanes(client, main.loop_program(SCENES, 0.5, style, clock=clock), on_wait=fake_wait)
+        return played
+
+    def test_skip_keeps_scenes_on_the_grid(self):
+        played = self.run_with_stall("cycle", "skip", stall_at=1, stall=1.2, ticks=4)
+        # S_2 was due while OBS stalled; by t=1.2s the grid is on S_3
+        assert played == ["S_1", "S_3", "S_4", "S_1"]
+
+    def test_catch_up_plays_every_scene(self):
+        played = self.run_with_stall("cycle", "catch_up", stall_at=1, stall=1.2, ticks=4)
+        assert played == ["S_1", "S_2", "S_3", "S_4"]
+
+    def test_once_still_lands_on_last_scene_after_skip(self):
+        played = self.run_with_stall("once", "skip", stall_at=1, stall=10.0, ticks=10)
+        assert played == ["S_1", "S_4"]
+
+
+class TestPreviewLookahead:
+
+    def drive(self, style: str, preview_error=None, switches: int = 4, seed=None):
+        """Run loop_program on a fake clock; returns (time in s, command, arg) per OBS command."""
+        fake = FakeClock()
+        clock = main.TickClock(0.5, clock=fake)
+        program = main.loop_program(SCENES, 0.5, style, clock=clock, lookahead=0.1)
+        log, reply = [], None
+        if seed is not None:
+            main.playback_random.seed(seed)
+        while sum(1 for _, kind, _ in log if kind == "scene") < switches:
+            kind, arg = program.send(reply)
+            reply = None
+            if kind == "wait":
+                fake.advance(arg)
+                continue
+            if kind == "timeline":
+                continue
+            log.append((round((fake.now - clock.origin) / 1e9, 3), kind, arg))
+            if kind == "preview":
+                reply = preview_error
+        program.close()
+        return log
+
+    def test_next_scene_previewed_ahead_of_the_beat(self):
+        log = self.drive("cycle")
+        assert log[:5] == [
+            (0.0, "scene", "S_1"),
+            (0.4, "preview", "S_2"),
+            (0.5, "scene", "S_2"),
+            (0.9, "preview", "S_3"),
+            (1.0, "scene", "S_3"),
+        ]
+
+    def test_random_plays_the_scene_it_previewed(self):
+        log = self.drive("random_no_repeat", switches=8, seed=3)
+        previewed = [arg for _, kind, arg in log if kind == "preview"]
+        played = [arg for _, kind, arg in log if kind == "scene"]
+        assert previewed[:7] == played[1:8]
+
+    def test_preview_failure_falls_back_to_plain_switches(self):
+        log = self.drive("cycle", preview_error=RuntimeError("Studio mode is not active."))
+        assert [kind for _, kind, _ in log] == ["scene", "preview", "scene", "scene", "scene"]
+        assert [at for at, kind, _ in log if kind == "scene"] == [0.0, 0.5, 1.0, 1.5]
+
+
+# ---------------------------------------------------------------------------
+# MIDI input tests
+# ---------------------------------------------------------------------------
+
+class TestLatencyHistogram:
+
+    def test_small_values_are_exact(self):
+        hist = main.LatencyHistogram()
+        for us in range(1, 51):
+            hist.record(us)
+        assert hist.percentile(50) == 25
+        assert hist.percentile(100) == 50
+
+    def test_large_values_within_bucket_precision(self):
+        hist = main.LatencyHistogram()
+        for us in range(1, 100_001):
+            hist.record(us)
+        assert hist.percentile(50) == pytest.approx(50_000, rel=0.04)
+        assert hist.percentile(99) == pytest.approx(99_000, rel=0.04)
+        assert hist.max_us == 100_000
+
+    def test_bucket_upper_bounds_cover_their_values(self):
+        for us in (0, 63, 64, 65, 127, 128, 1_000, 123_456, 10 ** 9):
+            index = main.LatencyHistogram._index(us)
+            assert us <= main.LatencyHistogram._upper(index)
+            assert index == 0 or main.LatencyHistogram._upper(index - 1) < us
+
+    def test_merge_and_summary(self):
+        a, b = main.LatencyHistogram(), main.LatencyHistogram()
+        a.record(1_000)
+        b.record(3_000)
+        s = a.merge(b).summary()
+        assert s["count"] == 2
+        assert s["max_ms"] == 3.0
+
+    def test_empty_summary(self):
+        assert main.LatencyHistogram().summary() == {"count": 0, "p50_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+
+
+class TestLatencyTracker:
+
+    def make(self, window: float = 60.0):
+        clock = FakeClock()
+        return main.LatencyTracker(window=window, clock=clock), clock
+
+    def test_trigger_stages(self):
+        tracker, clock = self.make()
+        trace = tracker.begin(60)
+        clock.advance(0.001)
+        tracker.started(trace)
+        sent = clock()
+        clock.advance(0.004)
+        tracker.switched(trace, "A", sent)
+        tracker.switched(trace, "B", clock())   # later loop ticks are not note latency
+        stats = tracker.summary()
+        assert stats["dispatch"]["max_ms"] == 1.0
+        assert stats["obs_request"]["count"] == 2
+        assert stats["note_to_switch"] == {"count": 1, "p50_ms": 5.0, "p99_ms": 5.0, "max_ms": 5.0}
+
+    def test_confirmation_matches_scene_event(self):
+        tracker, clock = self.make()
+        trace = tracker.begin(60)
+        tracker.switched(trace, "A", clock())
+        clock.advance(0.010)
+        tracker.on_current_program_scene_changed(scene_event(scene_name="A"))
+        tracker.on_current_program_scene_changed(scene_event(scene_name="A"))
+        assert tracker.summary()["note_to_program"]["count"] == 1
+        assert tracker.summary()["note_to_program"]["max_ms"] == 10.0
+
+    def test_unrelated_scene_event_drops_confirmation(self):
+        tracker, clock = self.make()
+        tracker.switched(tracker.begin(60), "A", clock())
+        tracker.on_current_program_scene_changed(scene_event(scene_name="OTHER"))
+        tracker.on_current_program_scene_changed(scene_event(scene_name="A"))
+        assert "note_to_program" not in tracker.summary()
+
+    def test_event_arriving_before_the_response_still_confirms(self):
+        tracker, clock = self.make()
+        trace = tracker.begin(60)
+        sent = clock()
+        clock.advance(0.003)
+        tracker.on_current_program_scene_changed(scene_event(scene_name="A"))
+        clock.advance(0.001)
+        tracker.switched(trace, "A", sent)
+        assert tracker.summary()["note_to_program"]["max_ms"] == 3.0
+
+    def test_recent_summary_rolls_over(self):
+        tracker, clock = self.make(window=1.0)
+        tracker.record("handle", clock() - 1_000_000)
+        clock.advance(1.5)
+        tracker.record("handle", clock() - 2_000_000)
+        assert tracker.summary(recent=True)["handle"]["count"] == 2
+        clock.advance(1.5)
+        tracker.record("handle", clock() - 3_000_000)
+        assert tracker.summary(recent=True)["handle"]["count"] == 2
+        assert tracker.summary(recent=True)["handle"]["max_ms"] == 3.0
+        assert tracker.summary()["handle"]["count"] == 3
+
+    def test_disabled_tracker_records_nothing(self):
+        tracker, clock = self.make()
+        tracker.enabled = False
+        assert tracker.begin(60) is None
+        tracker.record("handle", clock())
+        tracker.switched(None, "A", clock())
+        assert tracker.summary() == {}
+
+    def test_handle_midi_feeds_global_tracker(self):
+        client = make_mock_client(["P_1"])
+        tracker = main.LatencyTracker()
+        with patch.object(main, "latency", tracker), \
+                patch.dict(main.MIDI_MAP, {60: {"action": "static", "scene": "P_1"}}, clear=True):
+            main.handle_midi(note_on(60), client)
+            assert main.lanes.wait_idle(timeout=2)
+        assert {"handle", "dispatch", "obs_request", "note_to_switch"} <= set(tracker.summary())
+
+
+class FakeInputPort:
+    """Minimal mido-style input port fed from a list of messages."""
+
+    def __init__(self, messages):
+        self.messages = list(messages)
+        self.callback = None
+
+    def __iter__(self):
+        return iter(self.messages)
+
+    def iter_pending(self):
+        pending, self.messages = self.messages, []
+        return iter(pending)
+
+
+def note_on(note: int, velocity: int = 100):
+    return main.mido.Message("note_on", note=note, velocity=velocity)
+
+
+class TestPumpMidi:
+
+    def test_poll_mode_delivers_pending_messages(self):
+        port = FakeInputPort([note_on(36), note_on(37)])
+        seen = []
+        stop = main.threading.Event()
+
+        def handler(msg):
+            seen.append(msg.note)
+            if len(seen) == 2:
+                stop.set()
+
+        main.pump_midi(port, handler, mode="poll", stop=stop)
+        assert seen == [36, 37]
+
+    def test_blocking_mode_iterates_port(self):
+        port = FakeInputPort([note_on(36), note_on(37), note_on(38)])
+        seen = []
+        main.pump_midi(port, lambda m: seen.append(m.note), mode="blocking",
+                       stop=main.threading.Event())
+        assert seen == [36, 37, 38]
+
+    def test_callback_mode_installs_and_removes_callback(self):
+        port = FakeInputPort([])
+        seen = []
+        stop = main.threading.Event()
+
+        def fire_then_stop(_timeout):
+            port.callback(note_on(40))
+            stop.set()
+            return True
+
+        with patch.object(stop, "wait", side_effect=fire_then_stop):
+            main.pump_midi(port, lambda m: seen.append(m.note), mode="callback", stop=stop)
+        assert seen == [40]
+        assert port.callback is None
+
+    def test_handler_errors_do_not_stop_input(self):
+        port = FakeInputPort([note_on(36), note_on(37)])
+        seen = []
+
+        def handler(msg):
+            seen.append(msg.note)
+            raise RuntimeError("OBS went away")
+
+        main.pump_midi(port, handler, mode="blocking", stop=main.threading.Event())
+        assert seen == [36, 37]
+
+    def test_unknown_mode_raises(self):
+        with pytest.raises(ValueError):
+            main.pump_midi(FakeInputPort([]), print, mode="telepathy")
+
+
+class TestMidiDispatcher:
+
+    def test_dispatches_in_order_on_its_own_thread(self):
+        seen = []
+        threads = set()
+
+        def handler(msg):
+            seen.append(msg.note)
+            threads.add(main.threading.current_thread().name)
+
+        dispatcher = main.MidiDispatcher(handler)
+        for n in range(36, 46):
+            dispatcher.put(note_on(n))
+        dispatcher.close()
+        assert seen == list(range(36, 46))
+        assert threads == {"midi-dispatch"}
+
+    def test_survives_handler_errors(self):
+        seen = []
+
+        def handler(msg):
+            seen.append(msg.note)
+            if msg.note == 36:
+                raise RuntimeError("boom")
+
+        dispatcher = main.MidiDispatcher(handler)
+        dispatcher.put(note_on(36))
+        dispatcher.put(note_on(37))
+        dispatcher.close()
+        assert seen == [36, 37]
+
+
+class TestMultiPort:
+
+    CONFIG = {
+        "60": {"action": "static", "scene": "MAIN"},
+        "ports": {
+            "Launchpad": {"60": {"action": "static", "scene": "PAD"}},
+            "Keystation 49": {"60": {"action": "static", "scene": "KEYS"}},
+        },
+    }
+
+    def test_for_port_routes_by_exact_name_fragment_or_default(self):
+        midi_map = main.build_action_map(self.CONFIG)
+        assert midi_map.for_port("Keystation 49").plan(60).scene == "KEYS"
+        assert midi_map.for_port("Launchpad Mini MK3 LPMiniMK3 MIDI 1").plan(60).scene == "PAD"
+        assert midi_map.for_port("MIDI Clock").plan(60).scene == "MAIN"
+        assert midi_map.for_port(None) is midi_map
+
+    def test_port_maps_are_validated(self):
+        with pytest.raises(main.ConfigError, match="port 'Launchpad' note 36"):
+            main.build_action_map({"ports": {"Launchpad": {"36": {"action": "static"}}}})
+        with pytest.raises(main.ConfigError, match="ports"):
+            main.build_action_map({"ports": ["Launchpad"]})
+
+    def test_diff_reports_port_keys(self):
+        old = main.build_action_map(self.CONFIG)
+        raw = json.loads(json.dumps(self.CONFIG))
+        raw["ports"]["Launchpad"]["60"]["scene"] = "PAD_2"
+        raw["ports"]["Launchpad"]["61"] = {"action": "stop"}
+        new = main.build_action_map(raw, old)
+        added, removed, changed = new.diff(old)
+        assert (added, removed, changed) == ({("Launchpad", 61)}, set(), {("Launchpad", 60)})
+        assert new.ports["Keystation 49"][60] is old.ports["Keystation 49"][60]
+
+    def test_handle_midi_uses_the_source_port_map(self):
+        client = make_mock_client([])
+        with patch.object(main, "MIDI_MAP", main.build_action_map(self.CONFIG)), \
+                patch.object(main.lanes, "play") as play:
+            main.handle_midi(note_on(60), client, "Launchpad Mini")
+            main.handle_midi(note_on(60), client, "MIDI Clock")
+        assert [c.kwargs["note"] for c in play.call_args_list] == [("Launchpad", 60), 60]
+
+    def test_resolve_ports_matches_fragments_once_each(self):
+        available = ["Launchpad Mini 0", "Keystation 49 1", "Launchpad Mini 2"]
+        assert main.resolve_midi_ports(["launchpad", "Keystation", "Launchpad", "Clock"], available) == \
+            ["Launchpad Mini 0", "Keystation 49 1", "Launchpad Mini 2"]
+
+    def test_multiplexer_tags_messages_with_their_port(self):
+        seen = []
+        mux = main.MidiMultiplexer(lambda msg, port: seen.append((port, msg.note)))
+        pad, keys = FakeInputPort([note_on(36)]), FakeInputPort([note_on(60), note_on(62)])
+        for name, port in (("pad", pad), ("keys", keys)):
+            main.pump_midi(port, mux.reader(name), mode="blocking", stop=main.threading.Event())
+        mux.close()
+        assert seen == [("pad", 36), ("keys", 60), ("keys", 62)]
+
+    def test_multiplexer_merges_queued_messages_in_timestamp_order(self):
+        stamps = iter([0, 30, 10, 20])
+        busy, release = main.threading.Event(), main.threading.Event()
+        seen = []
+
+        def handler(msg, port):
+            seen.append(msg.note)
+            busy.set()
+            release.wait(2)
+
+        mux = main.MidiMultiplexer(handler, clock=lambda: next(stamps))
+        mux.put(note_on(36), "pad")
+        assert busy.wait(2)
+        # Queued while the handler is busy, stamped out of queue order
+        mux.put(note_on(39), "keys")
+        mux.put(note_on(37), "pad")
+        mux.put(note_on(38), "clock")
+        release.set()
+        mux.close()
+        assert seen == [36, 37, 38, 39]
+
+    def test_multiplexer_survives_handler_errors(self):
+        seen = []
+
+        def handler(msg, port):
+            seen.append(msg.note)
+            raise RuntimeError("boom")
+
+        mux = main.MidiMultiplexer(handler)
+        mux.put(note_on(36), "pad")
+        mux.put(note_on(37), "keys")
+        mux.close()
+        assert seen == [36, 37]
+
+
+# ---------------------------------------------------------------------------
+# Lane tests
+# ---------------------------------------------------------------------------
+
+class TestSwitchCoalescer:
+
+    def test_first_switch_goes_out_at_once_then_one_per_window(self):
+        fake = FakeClock()
+        switches = main.SwitchCoalescer(window_ms=16, clock=fake)
+        assert switches.offer("A") is None
+        fake.advance(0.004)
+        due = switches.offer("B")
+        assert due == fake.now + 12_000_000
+        fake.advance(0.004)
+        assert switches.offer("C") == 0           # replaces B
+        fake.advance(0.008)
+        assert switches.take() == "C"
+        assert (switches.sent, switches.coalesced) == (2, 1)
+        fake.advance(0.020)
+        assert switches.offer("D") is None        # a quiet window: straight out again
+
+    def test_batched_switch_supersedes_the_held_one(self):
+        fake = FakeClock()
+        switches = main.SwitchCoalescer(window_ms=16, clock=fake)
+        switches.offer("A")
+        switches.offer("B")
+        switches.bypassed()
+        assert switches.take() is None
+        assert switches.coalesced == 1
+
+    def test_zero_window_sends_everything(self):
+        switches = main.SwitchCoalescer(window_ms=0)
+        assert all(switches.offer(n) is None for n in range(5))
+
+
+class TestCcEngine:
+
+    VOLUME = {"requestType": "SetInputVolume",
+              "requestData": {"inputName": "Music", "inputVolumeMul": "$value"}}
+
+    @staticmethod
+    def clock():
+        now = [100.0]
+        return now, lambda: now[0]
+
+    def test_values_follow_range_and_curve(self):
+        linear = main.compile_cc({**self.VOLUME, "range": [-1, 1]})
+        assert (linear.value(0), linear.value(127)) == (-1, 1)
+        exp = main.compile_cc({**self.VOLUME, "curve": "exp"})
+        assert exp.value(64) == pytest.approx((64 / 127) ** 2)
+        integer = main.compile_cc({**self.VOLUME, "range": [0, 100], "integer": True})
+        assert integer.request(integer.value(64)) == ("SetInputVolume", {"inputName": "Music", "inputVolumeMul": 50})
+
+    @pytest.mark.parametrize("entry, message", [
+        ({"requestType": "SetInputVolume", "requestData": {"inputName": "Music"}}, "$value"),
+        ({**VOLUME, "curve": "wobbly"}, "wobbly"),
+        ({**VOLUME, "range": [0]}, "range"),
+        ({**VOLUME, "smoothing": -1}, "smoothing"),
+        ({"requestData": {}}, "requestType"),
+    ])
+    def test_invalid_mappings_raise_config_error(self, entry, message):
+        with pytest.raises(main.ConfigError, match=re.escape(message)):
+            main.build_action_map({"cc": {"7": entry}})
+
+    def test_config_section_and_shared_targets(self):
+        midi_map = main.build_action_map({"cc": {"7": self.VOLUME, "8": dict(self.VOLUME, curve="log")}})
+        assert midi_map.cc[7].target == midi_map.cc[8].target
+        reloaded = main.build_action_map({"cc": {"7": self.VOLUME}}, midi_map)
+        assert reloaded.cc[7] is midi_map.cc[7]
+
+    def test_only_the_latest_value_is_sent(self):
+        engine = main.CcEngine()
+        plan = main.compile_cc(self.VOLUME)
+        assert engine.feed(0, plan) is True         # program must be started
+        for raw in range(1, 128):
+            assert engine.feed(raw, plan) is False
+        requests, _, moving = engine._step()
+        assert requests == [("SetInputVolume", {"inputName": "Music", "inputVolumeMul": 1.0})]
+        assert not moving
+        assert engine.stats()[plan.target] | {"rate_hz": 0} == {
+            "received": 128, "sent": 1, "dropped": 127, "rate_hz": 0}
+
+    def test_smoothing_eases_over_several_flushes(self):
+        now, clock = self.clock()
+        engine = main.CcEngine(clock=clock)
+        plan = main.compile_cc({**self.VOLUME, "smoothing": 0.1})
+        engine.feed(0, plan)
+        engine._step()
+        engine.feed(127, plan)
+        now[0] += 0.1
+        requests, _, moving = engine._step()
+        assert requests[0][1]["inputVolumeMul"] == pytest.approx(1 - math.exp(-1))
+        assert moving
+        for _ in range(100):
+            now[0] += 0.1
+            requests, _, moving = engine._step()
+            if not moving:
+                break
+        assert requests[0][1]["inputVolumeMul"] == 1.0 and not moving
+
+    def test_program_holds_until_a_value_arrives(self):
+        engine = main.CcEngine()
+        plan = main.compile_cc(self.VOLUME)
+        engine.feed(10, plan)
+        program = engine.program()
+        kind, requests = next(program)
+        assert kind == "batch" and len(requests) == 1
+        assert program.send([{}]) == ("wait", engine.interval)
+        kind, source = program.send(None)
+        assert (kind, source) == ("hold", engine)
+        released = []
+        engine.when_running(lambda: released.append(True))
+        assert not released
+        assert engine.feed(20, plan) is False
+        assert released == [True]
+        program.close()
+        assert not engine.active
+
+    def test_fader_sweep_reaches_obs_in_few_batches(self):
+        engine = main.CcEngine(rate=60)
+        with FakeObsServer(scenes=["A"], latency=0.002) as server:
+            conn = main.ObsConnection(host="127.0.0.1", port=server.port, password="").connect()
+            try:
+                with patch.object(main, "MIDI_MAP", main.build_action_map({"cc": {"7": self.VOLUME}})), \
+                        patch.object(main, "cc_engine", engine):
+                    for raw in range(128):
+                        main.handle_midi(main.mido.Message("control_change", control=7, value=raw), conn)
+                    deadline = main.time.monotonic() + 2
+                    while server.volumes.get("Music") != 1.0 and main.time.monotonic() < deadline:
+                        main.time.sleep(0.01)
+            finally:
+                main.stop_loop(main.CcEngine.LANE)
+                conn.close()
+        assert server.volumes["Music"] == 1.0
+        assert len(server.batches) < 10
+        assert engine.stats()[main.compile_cc(self.VOLUME).target]["dropped"] > 100
+
+
+class TestLanes:
+
+    def setup_method(self):
+        self.lanes = main.Lanes()
+
+    def teardown_method(self):
+        self.lanes.stop(timeout=2)
+
+    @staticmethod
+    def blocking_client(release):
+        """Mock client whose first scene switch blocks until *release* is set."""
+        client = MagicMock()
+        in_obs = main.threading.Event()
+
+        def switch(_scene):
+            if not in_obs.is_set():
+                in_obs.set()
+                release.wait(5)
+
+        client.set_current_program_scene.side_effect = switch
+        return client, in_obs
+
+    def test_play_returns_while_lane_is_stuck_in_obs(self):
+        release = main.threading.Event()
+        client, in_obs = self.blocking_client(release)
+        self.lanes.play(main.static_program("SLOW"), client=client)
+        assert in_obs.wait(2)
+        started = main.time.perf_counter()
+        self.lanes.play(main.static_program("NEW"), client=client)
+        assert main.time.perf_counter() - started < 0.05
+        release.set()
+        assert self.lanes.wait_idle(timeout=2)
+        assert [c.args[0] for c in client.set_current_program_scene.call_args_list] == ["SLOW", "NEW"]
+
+    def test_newest_trigger_on_a_lane_wins(self):
+        release = main.threading.Event()
+        client, in_obs = self.blocking_client(release)
+        self.lanes.play(main.static_program("SLOW"), client=client)
+        assert in_obs.wait(2)
+        for n in range(5):
+            self.lanes.play(main.static_program(f"S_{n}"), client=client)
+        release.set()
+        assert self.lanes.wait_idle(timeout=2)
+        assert [c.args[0] for c in client.set_current_program_scene.call_args_list] == ["SLOW", "S_4"]
+        assert self.lanes.superseded == 4
+
+    def test_lanes_play_and_stop_independently(self):
+        client = MagicMock()
+        self.lanes.play(main.loop_program(["BG_1", "BG_2"], tick=60, style="cycle"), "background",
+                        note=36, client=client)
+        self.lanes.play(main.loop_program(["FX_1", "FX_2"], tick=60, style="cycle"), "overlay",
+                        note=37, client=client)
+        assert until_true(lambda: client.set_current_program_scene.call_count == 2)
+        self.lanes.play(main.static_program("BG_3"), "background", note=38, client=client)
+        assert self.lanes.wait_idle(timeout=2, lane="background")
+        assert self.lanes.notes() == {"overlay": 37}
+        assert self.lanes.stop("overlay", timeout=2)
+        assert self.lanes.notes() == {}
+        scenes = [c.args[0] for c in client.set_current_program_scene.call_args_list]
+        assert sorted(scenes) == ["BG_1", "BG_3", "FX_1"]
+
+    def test_pause_resumes_on_its_note_without_polling(self):
+        client = MagicMock()
+        steps = [{"action": "pause"}, {"action": "static", "scene": "AFTER"}]
+        self.lanes.play(main.sequence_program(steps, trigger_note=36), "seq", client=client)
+        assert until_true(lambda: self.lanes.paused() == {"seq": 36})
+        assert not self.lanes.resume(37)
+        assert self.lanes.resume(36)
+        assert self.lanes.wait_idle(timeout=2)
+        client.set_current_program_scene.assert_called_once_with("AFTER")
+
+    def test_play_cancels_a_paused_lane(self):
+        client = MagicMock()
+        steps = [{"action": "pause"}, {"action": "static", "scene": "NEVER"}]
+        self.lanes.play(main.sequence_program(steps, trigger_note=36), client=client)
+        assert until_true(lambda: self.lanes.paused())
+        self.lanes.play(main.static_program("NEW"), client=client)
+        assert self.lanes.wait_idle(timeout=2)
+        assert self.lanes.paused() == {}
+        client.set_current_program_scene.assert_called_once_with("NEW")
+
+    def test_program_errors_do_not_kill_the_scheduler(self):
+        def broken():
+            raise RuntimeError("OBS went away")
+            yield
+
+        client = MagicMock()
+        self.lanes.play(broken(), client=client)
+        self.lanes.play(main.static_program("OK"), "other", client=client)
+        assert self.lanes.wait_idle(timeout=2)
+        client.set_current_program_scene.assert_called_once_with("OK")
+
+    def test_dozens_of_lanes_keep_their_timing_on_one_thread(self):
+        client = MagicMock()
+        clocks = [main.TickClock(0.02, policy="catch_up") for _ in range(32)]
+        threads_before = main.threading.active_count()
+        for n, clock in enumerate(clocks):
+            self.lanes.play(main.loop_program(["A", "B"], tick=0.02, style="cycle", clock=clock),
+                            f"lane{n}", client=client)
+        main.time.sleep(0.3)
+        assert main.threading.active_count() - threads_before <= 1
+        assert self.lanes.stop(timeout=2)
+        for clock in clocks:
+            stats = clock.stats.summary()
+            assert stats["ticks"] >= 10
+            assert stats["mean_ms"] < 5
+
+    def test_slow_obs_replies_hold_up_only_their_own_lane(self):
+        with FakeObsServer(scenes=["A", "B"], latency=0.03) as server, \
+                patch.object(main, "SWITCH_COALESCE_MS", 0):
+            conn = main.ObsConnection(host="127.0.0.1", port=server.port, password="").connect()
+            clocks = []
+            try:
+                for n in range(24):
+                    clocks.append(main.TickClock(0.05, policy="catch_up"))
+                    self.lanes.play(main.loop_program(["A", "B"], tick=0.05, style="cycle", clock=clocks[-1]),
+                                    f"lane{n}", client=conn)
+                main.time.sleep(0.5)
+                assert self.lanes.stop(timeout=2)
+            finally:
+                conn.close()
+        # In series, a round of 24 switches would take 24 × 30 ms and a lane
+        # would wait on up to 23 others' replies; here each waits on none
+        assert server.request_count("SetCurrentProgramScene") >= 24 * 8
+        for clock in clocks:
+            stats = clock.stats.summary()
+            assert stats["ticks"] >= 8
+            assert stats["mean_ms"] < 15
+
+    def test_idle_and_paused_lanes_cost_no_wakeups(self):
+        client = MagicMock()
+        steps = [{"action": "pause"}, {"action": "stop"}]
+        self.lanes.play(main.sequence_program(steps, trigger_note=36), client=client)
+        assert until_true(lambda: self.lanes.paused())
+        wakeups = self.lanes.wakeups
+        main.time.sleep(0.2)
+        assert self.lanes.wakeups == wakeups
+        resumed = main.time.perf_counter()
+        self.lanes.resume(36)
+        assert self.lanes.wait_idle(timeout=2)
+        assert main.time.perf_counter() - resumed < 0.05
+        wakeups = self.lanes.wakeups
+        main.time.sleep(0.2)
+        assert self.lanes.wakeups == wakeups
+
+    def test_synced_loop_holds_without_wakeups_until_the_clock_starts(self):
+        client = MagicMock()
+        mc = main.MidiClock()
+        clock = main.BeatClock(mc, beats=1)
+        self.lanes.play(main.loop_program(["A", "B"], tick=99, style="cycle", clock=clock), client=client)
+        assert until_true(lambda: client.set_current_program_scene.call_count == 1)
+        wakeups = self.lanes.wakeups
+        main.time.sleep(0.1)
+        assert self.lanes.wakeups == wakeups
+        mc.feed(main.mido.Message("start"))
+        for _ in range(30):   # 24 pulses per beat, a pulse per millisecond
+            mc.feed(main.mido.Message("clock"))
+            main.time.sleep(0.001)
+        assert until_true(lambda: client.set_current_program_scene.call_count == 2)
+        assert client.set_current_program_scene.call_args.args == ("B",)
+
+    def test_switch_storm_across_lanes_is_coalesced(self):
+        client = MagicMock()
+        with patch.object(main, "SWITCH_COALESCE_MS", 50):
+            for n in range(20):
+                self.lanes.play(main.static_program(f"S_{n}"), lane=f"pad{n}", client=client)
+            assert self.lanes.wait_idle(timeout=2)
+        sent = [c.args[0] for c in client.set_current_program_scene.call_args_list]
+        assert sent[-1] == "S_19"
+        assert len(sent) < 5
+        assert self.lanes.switches.coalesced == 20 - len(sent)
+
+
+def until_true(predicate, timeout: float = 2.0) -> bool:
+    deadline = main.time.monotonic() + timeout
+    while not predicate():
+        if main.time.monotonic() > deadline:
+            return False
+        main.time.sleep(0.005)
+    return True
+
+
+class TestQuantizedLaunch:
+
+    def teardown_method(self):
+        main.stop_loop()
+
+    @staticmethod
+    def timed_client():
+        """Mock client recording (perf_counter_ns, scene) for every switch."""
+        client = make_mock_client(["P_1", "P_2", "P_3"])
+        client.switches = []
+        client.set_current_program_scene.side_effect = \
+            lambda scene: client.switches.append((main.time.perf_counter_ns(), scene))
+        return client
+
+    @pytest.mark.parametrize("value, beats", [("none", 0), ("beat", 1), ("bar", 4), (2, 2), (0.5, 0.5)])
+    def test_quantize_settings(self, value, beats):
+        plan = main.compile_action({"action": "static", "scene": "S", "quantize": value})
+        assert plan.quantize == beats
+
+    def test_invalid_quantize_raises_config_error(self):
+        with pytest.raises(main.ConfigError, match="quantize"):
+            main.compile_action({"action": "static", "scene": "S", "quantize": "phrase"})
+
+    def test_tick_clock_boundaries(self):
+        fake = FakeClock()
+        clock = main.TickClock(0.5, clock=fake, beats=2)   # 120 bpm, a switch every 2 beats
+        fake.advance(0.3)
+        assert clock.boundary(1) == clock.origin + 500_000_000
+        assert clock.boundary(4) == clock.origin + 1_000_000_000
+        fake.advance(0.2)
+        assert clock.boundary(1) == clock.origin + 500_000_000   # on a boundary: that one
+
+    def test_midi_clock_boundary_is_the_next_beat(self):
+        fake = FakeClock()
+        mc = main.MidiClock(clock=fake)
+        mc.feed(midi_msg("start"))
+        TestMidiClock.pulses(mc, fake, 30, bpm=120)
+        assert mc.boundary(1) == pytest.approx(mc.time_of(48), abs=1000)
+        assert mc.boundary(4) == mc.time_of(96)
+
+    def test_trigger_lands_on_the_next_beat_of_the_running_loop(self):
+        client = self.timed_client()
+        midi_map = main.ActionMap({
+            60: {"action": "loop", "prefix": "P_", "style": "cycle", "tick": 0.1},
+            61: {"action": "static", "scene": "END", "quantize": "beat"},
+        })
+        with patch.object(main, "MIDI_MAP", midi_map):
+            main.handle_midi(note_on(60), client)
+            main.time.sleep(0.23)
+            clock = main.lanes.timeline()
+            at = clock.boundary(1)
+            main.handle_midi(note_on(61), client)
+            assert main.lanes.notes() == {"main": 60}   # the loop plays on until the boundary
+            assert main.lanes.wait_idle(timeout=2)
+        times = dict((scene, t) for t, scene in client.switches)
+        assert client.switches[-1][1] == "END"
+        assert times["END"] >= at   # never early; see test_launch_spins_onto_its_boundary for accuracy
+        # The loop handed over: no switch of its own on that boundary
+        assert all(t < at - 50_000_000 for t, scene in client.switches[:-1])
+
+    def test_launch_spins_onto_its_boundary(self):
+        fake = FakeClock()
+
+        def clock():
+            fake.advance(0.0001)   # every reading takes 0.1 ms
+            return fake.now
+
+        at = fake.now + 50_000_000
+        program = main.launch_program(main.static_program("END"), at, clock)
+        kind, wait = next(program)
+        assert kind == "wait"
+        assert at - fake.now - wait * 1e9 == pytest.approx(main.LAUNCH_SPIN_NS)
+        fake.advance(wait + 0.0009)   # the timed wait wakes 0.9 ms late
+        assert program.send(None) == ("scene", "END")
+        assert 0 <= fake.now - at <= 200_000   # on the boundary, to within two clock readings
+
+    def test_newer_trigger_replaces_a_queued_launch(self):
+        client = self.timed_client()
+        lanes = main.Lanes()
+        try:
+            lanes.play(main.static_program("LATER"), client=client,
+                       at=main.time.perf_counter_ns() + 50_000_000)
+            lanes.play(main.static_program("NOW"), client=client)
+            assert lanes.wait_idle(timeout=2)
+            main.time.sleep(0.08)
+        finally:
+            lanes.stop(timeout=2)
+        assert [scene for _, scene in client.switches] == ["NOW"]
+        assert lanes.superseded == 1
+
+    def test_without_a_timeline_the_trigger_fires_at_once(self):
+        with patch.object(main, "LAUNCH_QUANTIZE", "bar"):
+            assert main.launch_deadline(None, None) is None
+            assert main.launch_deadline(0, main.TickClock(0.5)) is None
+            assert main.launch_deadline(None, main.TickClock(0.5)) is not None
+
+
+class TestHandleMidiDispatch:
+
+    def test_sequence_note_starts_sequence(self):
+        client = make_mock_client(["P_1"])
+        steps = [{"action": "static", "scene": "END"}]
+        with patch.dict(main.MIDI_MAP, {60: {"action": "sequence", "steps": steps}}, clear=True):
+            main.handle_midi(note_on(60), client)
+            assert main.lanes.wait_idle(timeout=2)
+        client.set_current_program_scene.assert_called_once_with("END")
+
+    def test_loop_note_returns_without_waiting_for_obs(self):
+        release = main.threading.Event()
+        client = make_mock_client(["P_1", "P_2"])
+        client.set_current_program_scene.side_effect = lambda _scene: release.wait(5)
+        entry = {"action": "loop", "prefix": "P_", "style": "cycle", "bpm": 120, "steps": 4}
+        try:
+            with patch.dict(main.MIDI_MAP, {60: entry, 61: entry}, clear=True):
+                main.handle_midi(note_on(60), client)
+                started = main.time.perf_counter()
+                main.handle_midi(note_on(61), client)
+                assert main.time.perf_counter() - started < 0.05
+        finally:
+            release.set()
+            main.stop_loop()
+
+
+class TestLogger:
+
+    @pytest.fixture(autouse=True)
+    def reset_logger(self):
+        main._logger.flush()
+        yield
+        main._logger.flush()
+        main._logger.configure(main.LOG_LEVEL, main.LOG_TAG_LEVELS, main.LOG_FORMAT)
+
+    def output(self, capsys) -> list[str]:
+        main._logger.flush()
+        return capsys.readouterr().out.splitlines()
+
+    def test_lines_are_written_in_order(self, capsys):
+        for i in range(50):
+            main._log(main._C.INFO, "t", "line %d", i)
+        lines = self.output(capsys)
+        assert [line.rsplit(" ", 1)[-1] for line in lines] == [str(i) for i in range(50)]
+
+    def test_level_filter_drops_lower_levels(self, capsys):
+        main._logger.configure("warning")
+        main._log(main._C.DIM, "t", "debug")
+        main._log(main._C.SCENE, "t", "info")
+        main._log(main._C.WARN, "t", "warning")
+        main._log(main._C.ERR, "t", "error")
+        assert [line.split()[-1] for line in self.output(capsys)] == ["warning", "error"]
+
+    def test_tag_level_overrides_global_level(self, capsys):
+        main._logger.configure("debug", {"loop": "warning"})
+        main._log(main._C.SCENE, "loop", "→ A")
+        main._log(main._C.SCENE, "obs", "connected")
+        assert [line.split()[-1] for line in self.output(capsys)] == ["connected"]
+
+    def test_filtered_call_does_not_format_arguments(self, capsys):
+        class Costly:
+            def __str__(self):
+                raise AssertionError("formatted a filtered log line")
+
+        main._logger.configure("debug", {"loop": "error"})
+        main._log(main._C.SCENE, "loop", "→ %s", Costly())
+        assert not main._log_enabled(main._C.SCENE, "loop")
+        assert main._log_enabled(main._C.ERR, "loop")
+        assert self.output(capsys) == []
+
+    def test_json_format(self, capsys):
+        main._logger.configure(fmt="json")
+        main._log(main._C.WARN, "midi", "note %s – %s", 60, "static")
+        (line,) = self.output(capsys)
+        record = json.loads(line)
+        assert record["level"] == "warning"
+        assert record["tag"] == "midi"
+        assert record["msg"] == "note 60 – static"
+        assert isinstance(record["ts"], float)
+
+    def test_bad_format_arguments_are_still_logged(self, capsys):
+        main._log(main._C.INFO, "t", "%d items", "many")
+        (line,) = self.output(capsys)
+        assert "many" in line
+
+
+# ---------------------------------------------------------------------------
+# Asyncio engine tests (against the fake OBS server)
+# ---------------------------------------------------------------------------
+
+from fake_obs import FakeObsServer
+
+
+async def connect_fake(server: FakeObsServer, password: str = "") -> "main.AsyncObsClient":
+    await server.start()
+    return await main.AsyncObsClient(host="127.0.0.1", port=server.port,
+                                     password=password, timeout=2).connect()
+
+
+async def until(predicate, timeout: float = 2.0) -> None:
+    """Poll *predicate* on the event loop until it holds."""
+    deadline = main.time.monotonic() + timeout
+    while not predicate():
+        assert main.time.monotonic() < deadline, "condition not reached in time"
+        await main.asyncio.sleep(0.005)
+
+
+class TestAsyncObsClient:
+
+    def test_connects_with_password_and_sends_requests(self):
+        async def scenario():
+            server = FakeObsServer(scenes=["A", "B"], password="secret")
+            client = await connect_fake(server, password="secret")
+            try:
+                version = await client.get_version()
+                await client.set_current_program_scene("B")
+                return version, server.program_scene
+            finally:
+                await client.close()
+                await server.close()
+
+        version, program = main.asyncio.run(scenario())
+        assert version["obsWebSocketVersion"] == "5.5.0"
+        assert program == "B"
+
+    def test_wrong_password_raises(self):
+        async def scenario():
+            server = FakeObsServer(scenes=["A"], password="secret")
+            try:
+                with pytest.raises(ConnectionError):
+                    await connect_fake(server, password="nope")
+            finally:
+                await server.close()
+
+        main.asyncio.run(scenario())
+
+    def test_failed_request_raises_obs_request_error(self):
+        async def scenario():
+            server = FakeObsServer(scenes=["A"])
+            client = await connect_fake(server)
+            try:
+                with pytest.raises(main.ObsRequestError) as err:
+                    await client.set_current_program_scene("MISSING")
+                return err.value.code
+            finally:
+                await client.close()
+                await server.close()
+
+        assert main.asyncio.run(scenario()) == 600
+
+    def test_requests_are_pipelined(self):
+        async def scenario():
+            server = FakeObsServer(scenes=["A"], latency=0.1)
+            client = await connect_fake(server)
+            try:
+                started = main.time.perf_counter()
+                await main.asyncio.gather(*(client.get_version() for _ in range(20)))
+                return main.time.perf_counter() - started
+            finally:
+                await client.close()
+                await server.close()
+
+        # 20 requests at 100 ms each, all in flight together
+        assert main.asyncio.run(scenario()) < 1.0
+
+
+    def test_request_batch_returns_result_per_request(self):
+        async def scenario():
+            server = FakeObsServer(scenes=["A", "B"])
+            client = await connect_fake(server)
+            try:
+                results = await client.request_batch([
+                    ("SetCurrentProgramScene", {"sceneName": "B"}),
+                    ("SetCurrentProgramScene", {"sceneName": "MISSING"}),
+                    ("GetCurrentProgramScene", None),
+                ], execution="serial_realtime")
+                return results, server.batches
+            finally:
+                await client.close()
+                await server.close()
+
+        results, batches = main.asyncio.run(scenario())
+        assert results[0] == {}
+        assert isinstance(results[1], main.ObsRequestError) and results[1].code == 600
+        assert results[2]["sceneName"] == "B"
+        assert batches == [(0, 3)]
+
+
+class TestObsConnection:
+
+    def connect(self, server: FakeObsServer, **kwargs) -> "main.ObsConnection":
+        return main.ObsConnection(host="127.0.0.1", port=server.port, password="", **kwargs).connect()
+
+    def test_requests_from_threads_overlap(self):
+        with FakeObsServer(scenes=["A", "B"], latency=0.1) as server:
+            conn = self.connect(server)
+            try:
+                started = main.time.monotonic()
+                with ThreadPoolExecutor(5) as pool:
+                    results = list(pool.map(lambda _: conn.request("GetVersion"), range(5)))
+                elapsed = main.time.monotonic() - started
+            finally:
+                conn.close()
+        assert all(r["rpcVersion"] == 1 for r in results)
+        assert elapsed < 0.3   # five round trips overlapped instead of 0.5 s in series
+
+    def test_request_error_and_batch(self):
+        with FakeObsServer(scenes=["A", "B"]) as server:
+            conn = self.connect(server)
+            try:
+                with pytest.raises(main.ObsRequestError):
+                    conn.request("SetCurrentProgramScene", {"sceneName": "missing"})
+                results = main.send_batch(conn, [("SetCurrentProgramScene", {"sceneName": "B"}),
+                                                 ("GetVersion", None)])
+            finally:
+                conn.close()
+        assert server.program_scene == "B"
+        assert results[1]["rpcVersion"] == 1
+
+    def test_events_reach_callbacks(self):
+        catalog = main.SceneCatalog()
+        with FakeObsServer(scenes=["A"]) as server:
+            conn = self.connect(server)
+            try:
+                catalog.attach(conn)
+                catalog.load(conn)
+                server.execute("CreateScene", {"sceneName": "B"})
+                assert until_true(lambda: catalog.lookup("") == ["A", "B"])
+            finally:
+                conn.close()
+
+    def test_reconnects_and_sends_only_the_latest_scene(self):
+        with FakeObsServer(scenes=["A", "B", "C"]) as server:
+            conn = self.connect(server)
+            reloaded = []
+            conn.on_reconnect.append(lambda: reloaded.append(conn.get_scene_list()))
+            try:
+                server.refusing = True
+                server.drop_connections()
+                assert until_true(lambda: not conn.connected)
+                with pytest.raises(ConnectionError):
+                    conn.request("GetVersion")
+                conn.set_current_program_scene("B")
+                conn.set_current_program_scene("C")
+                assert conn.coalesced == 1
+                server.refusing = False
+                assert until_true(lambda: conn.connected and server.program_scene == "C", timeout=5)
+                assert until_true(lambda: reloaded)
+            finally:
+                conn.close()
+        assert conn.reconnects == 1
+        assert [data for _, data in server.request_log("SetCurrentProgramScene")] == [{"sceneName": "C"}]
+
+    def test_deferred_switch_is_not_timed(self, monkeypatch):
+        tracker = main.LatencyTracker()
+        tracker.enabled = True
+        monkeypatch.setattr(main, "latency", tracker)
+        with FakeObsServer(scenes=["A", "B", "C"]) as server:
+            conn = self.connect(server)
+            try:
+                server.refusing = True
+                server.drop_connections()
+                assert until_true(lambda: not conn.connected)
+                trace = tracker.begin(36)
+                assert main.execute_command(conn, "scene", "B", trace) is None
+                results = main.execute_command(conn, "batch", [("SetCurrentProgramScene", {"sceneName": "C"}),
+                                                               ("GetVersion", None)], trace)
+                assert results[0] is main.DEFERRED
+                assert isinstance(results[1], ConnectionError)
+            finally:
+                conn.close()
+        assert not trace.switched
+        assert tracker.summary() == {}
+
+    def test_silent_server_is_detected_by_heartbeat(self):
+        with FakeObsServer(scenes=["A"]) as server:
+            conn = self.connect(server, heartbeat=0.1, timeout=2)
+            try:
+                # Stall the server's event loop: no responses, no pongs
+                server._loop.call_soon_threadsafe(main.time.sleep, 0.5)
+                assert until_true(lambda: not conn.connected, timeout=1)
+                assert until_true(lambda: conn.connected, timeout=5)
+                assert conn.request("GetVersion")["rpcVersion"] == 1
+            finally:
+                conn.close()
+        assert conn.reconnects == 1
+
+
+class TestObsMirror:
+
+    SCENE = "SetCurrentProgramScene"
+
+    def attached(self):
+        client = MagicMock(connected=True, reconnects=0)
+        mirror = main.ObsMirror()
+        mirror.attach(client)
+        return mirror, client
+
+    def test_skips_only_what_obs_reported(self):
+        mirror, client = self.attached()
+        assert not mirror.redundant(client, self.SCENE, {"sceneName": "A"})   # unknown yet
+        mirror.on_current_program_scene_changed(scene_event(scene_name="A"))
+        assert mirror.redundant(client, self.SCENE, {"sceneName": "A"})
+        assert not mirror.redundant(client, self.SCENE, {"sceneName": "B"})
+        assert not mirror.redundant(MagicMock(), self.SCENE, {"sceneName": "A"})  # another client
+        assert mirror.saved == 1
+        assert mirror.saved_by_type == {self.SCENE: 1}
+
+    def test_unconfirmed_write_is_never_skipped(self):
+        mirror, client = self.attached()
+        mirror.on_current_program_scene_changed(scene_event(scene_name="A"))
+        assert not mirror.redundant(client, self.SCENE, {"sceneName": "B"})
+        # Back to A before OBS has reported B: A may not be live by the time it lands
+        assert not mirror.redundant(client, self.SCENE, {"sceneName": "A"})
+        mirror.on_current_program_scene_changed(scene_event(scene_name="B"))
+        assert not mirror.redundant(client, self.SCENE, {"sceneName": "A"})
+        mirror.on_current_program_scene_changed(scene_event(scene_name="A"))
+        assert mirror.redundant(client, self.SCENE, {"sceneName": "A"})
+
+    def test_batch_filters_items_and_filters(self):
+        mirror, client = self.attached()
+        mirror.on_scene_item_enable_state_changed(
+            scene_event(scene_name="S", scene_item_id=3, scene_item_enabled=True))
+        mirror.on_source_filter_enable_state_changed(
+            scene_event(source_name="Cam", filter_name="Blur", filter_enabled=False))
+        requests = [("SetSceneItemEnabled", {"sceneName": "S", "sceneItemId": 3, "sceneItemEnabled": True}),
+                    ("SetSourceFilterEnabled", {"sourceName": "Cam", "filterName": "Blur", "filterEnabled": False}),
+                    ("SetSourceFilterEnabled", {"sourceName": "Cam", "filterName": "Glow", "filterEnabled": False}),
+                    ("SetInputVolume", {"inputName": "Mic", "inputVolumeMul": 1.0})]
+        assert mirror.needed(client, requests) == [2, 3]
+        mirror.on_input_name_changed(scene_event(old_input_name="Cam", input_name="Webcam"))
+        assert mirror.needed(client, requests[1:2]) == [0]
+
+    def test_forgets_everything_across_a_reconnect(self):
+        mirror, client = self.attached()
+        mirror.on_current_program_scene_changed(scene_event(scene_name="A"))
+        client.connected = False
+        assert not mirror.redundant(client, self.SCENE, {"sceneName": "A"})
+        client.connected, client.reconnects = True, 1
+        assert not mirror.redundant(client, self.SCENE, {"sceneName": "A"})
+        assert mirror.saved == 0
+
+    def test_seed_loses_to_a_newer_event(self):
+        mirror, client = self.attached()
+        since = mirror.events
+        mirror.on_current_program_scene_changed(scene_event(scene_name="B"))
+        mirror.seed("A", None, since)
+        assert mirror.redundant(client, self.SCENE, {"sceneName": "B"})
+
+    def test_threaded_engine_skips_noop_writes(self):
+        mirror = main.ObsMirror()
+        requests = (("SetCurrentProgramScene", {"sceneName": "B"}),
+                    ("SetSourceFilterEnabled", {"sourceName": "Cam", "filterName": "Blur", "filterEnabled": True}))
+        with FakeObsServer(scenes=["A", "B"]) as server, patch.object(main, "obs_mirror", mirror):
+            conn = main.ObsConnection(host="127.0.0.1", port=server.port, password="",
+                                      subs=main.OBS_EVENT_SUBS).connect()
+            try:
+                mirror.attach(conn)
+                mirror.load(conn)
+                assert main.execute_command(conn, "scene", "A") is None
+                assert main.execute_command(conn, "batch", requests)[0] == {}
+                assert until_true(lambda: not mirror._in_flight)
+                skipped = main.execute_command(conn, "batch", requests)
+                assert skipped == [{}, {}] and skipped[0] is not skipped[1]
+            finally:
+                conn.close()
+        assert server.request_count("SetCurrentProgramScene") == 1
+        assert server.batches == [(1, 2)]
+        assert mirror.saved_by_type == {"SetCurrentProgramScene": 2, "SetSourceFilterEnabled": 1}
+
+    def test_skipped_results_are_separate_dicts(self):
+        out = main._spread_results([{"x": 1}], [1], 3)
+        assert out == [{}, {"x": 1}, {}]
+        assert out[0] is not out[2]
+
+
+class TestSourceActions:
+
+    @pytest.mark.parametrize("entry, message", [
+        ({"action": "source", "scene": "S"}, "\"source\""),
+        ({"action": "source", "scene": "S", "source": "L", "mode": "blink"}, "mode"),
+        ({"action": "source", "scene": "S", "source": "L", "mode": "strobe", "tick": 0.1, "flashes": 0}, "flashes"),
+        ({"action": "source", "scene": "S", "source": "L", "mode": "strobe"}, "steps"),
+    ])
+    def test_invalid_source_actions_raise_config_error(self, entry, message):
+        with pytest.raises(main.ConfigError, match=message):
+            main.compile_action(entry)
+
+    def test_strobe_plan_runs_at_sub_beat_rates(self):
+        plan = main.compile_action({"action": "source", "scene": "S", "source": "L", "mode": "strobe",
+                                    "bpm": 120, "steps": 0.25, "lane": "fx"})
+        assert (plan.kind, plan.tick, plan.beats, plan.flashes, plan.lane) == ("source", 0.125, 0.25, None, "fx")
+        with pytest.raises(main.ConfigError, match="sequence"):
+            main.compile_action({"action": "sequence", "steps": [{"action": "source", "scene": "S", "source": "L"}]})
+
+    def test_index_follows_scene_item_events(self):
+        index = main.SceneItemIndex()
+        index.attach(MagicMock())
+        index.set_items({"S": [{"sourceName": "L", "sceneItemId": 1}, {"sourceName": "L", "sceneItemId": 4},
+                               {"sourceName": "Cam", "sceneItemId": 2}]})
+        assert index.lookup("S", "L") == 1   # the first of two
+        index.on_scene_item_created(scene_event(scene_name="S", source_name="Mic", scene_item_id=5))
+        index.on_scene_item_removed(scene_event(scene_name="S", source_name="Cam", scene_item_id=2))
+        index.on_input_name_changed(scene_event(old_input_name="L", input_name="Laser"))
+        index.on_scene_name_changed(scene_event(old_scene_name="S", scene_name="Stage"))
+        assert (index.lookup("Stage", "Mic"), index.lookup("Stage", "Laser"), index.lookup("Stage", "Cam")) == (5, 1, None)
+        index.on_scene_removed(scene_event(scene_name="Stage"))
+        assert len(index) == 0
+
+    def run_source(self, server, *args, **kwargs):
+        """Run source_program against *server* on a connected ObsConnection with a
+        loaded scene item index and state mirror, as main() sets them up."""
+        index, mirror = main.SceneItemIndex(), main.ObsMirror()
+        with patch.object(main, "scene_items", index), patch.object(main, "obs_mirror", mirror):
+            conn = main.ObsConnection(host="127.0.0.1", port=server.port, password="",
+                                      subs=main.OBS_EVENT_SUBS).connect()
+            try:
+                mirror.attach(conn)
+                index.attach(conn)
+                index.load(conn, server.scenes, mirror)
+                lanes = main.Lanes()
+                lanes.play(main.source_program(*args, **kwargs), client=conn)
+                assert lanes.wait_idle(timeout=5)
+                return index, mirror
+            finally:
+                conn.close()
+
+    def test_every_flash_is_one_request(self):
+        with FakeObsServer(scenes=["STAGE"]) as server:
+            server.add_item("STAGE", "Cam")
+            laser = server.add_item("STAGE", "Laser", enabled=False)
+            started = main.time.perf_counter()
+            self.run_source(server, "STAGE", "Laser", "strobe", tick=0.02, flashes=3)
+            elapsed = main.time.perf_counter() - started
+        flashes = server.request_log("SetSceneItemEnabled")
+        assert [d["sceneItemEnabled"] for _, d in flashes] == [True, False] * 3
+        assert {d["sceneItemId"] for _, d in flashes} == {laser}
+        assert server.request_count("GetSceneItemId") == 0
+        assert server.batches[1:] == [(1, 1)] * 6   # after the one GetSceneItemList batch
+        assert [t - flashes[0][0] for t, _ in flashes[1:]] == pytest.approx(
+            [0.02 * n for n in range(1, 6)], abs=0.01)
+        assert elapsed < 0.5
+
+    @pytest.mark.parametrize("flashes, shown", [(None, [True, False, False, True]), (2, [True, False, False])])
+    def test_strobe_skips_ahead_in_step(self, flashes, shown):
+        fake = FakeClock()
+        states = []
+        with patch.object(main.time, "perf_counter_ns", fake):
+            program = main.source_program("S", "L", "strobe", tick=0.5, flashes=flashes)
+            kind, arg = program.send(None)
+            reply = 7
+            while len(states) < 4:
+                try:
+                    kind, arg = program.send(reply)
+                except StopIteration:
+                    break
+                reply = None
+                if kind == "batch":
+                    states.append(arg[0][1]["sceneItemEnabled"])
+                    reply = [{}]
+                elif kind == "wait":
+                    # The wait after the second change overruns by a whole tick
+                    fake.advance(arg + (0.5 if len(states) == 2 else 0))
+            program.close()
+        assert states == shown
+
+    def test_toggle_reads_visibility_from_the_mirror(self):
+        with FakeObsServer(scenes=["STAGE"]) as server:
+            server.add_item("STAGE", "Laser", enabled=True)
+            self.run_source(server, "STAGE", "Laser", "toggle")
+            hidden = server.items["STAGE"][0]["sceneItemEnabled"]
+            self.run_source(server, "STAGE", "Laser", "hide")
+        assert hidden is False
+        assert server.request_count("GetSceneItemEnabled") == 0
+        assert server.request_count("SetSceneItemEnabled") == 1   # the second hide changed nothing
+
+    def test_index_miss_asks_obs_once(self):
+        tracker = main.LatencyTracker()
+        with FakeObsServer(scenes=["STAGE"]) as server, patch.object(main, "latency", tracker):
+            conn = main.ObsConnection(host="127.0.0.1", port=server.port, password="",
+                                      subs=main.OBS_EVENT_SUBS).connect()
+            index = main.SceneItemIndex()
+            try:
+                index.attach(conn)
+                index.load(conn, server.scenes)
+                conn.request("CreateSceneItem", {"sceneName": "STAGE", "sourceName": "Laser"})
+                assert until_true(lambda: index.lookup("STAGE", "Laser") == 1)
+                server.add_item("STAGE", "Quiet")   # no event: found by asking OBS
+                assert index.resolve(conn, "STAGE", "Quiet") == 2
+                assert index.resolve(conn, "STAGE", "Quiet") == 2
+                with pytest.raises(main.ObsRequestError):
+                    index.resolve(conn, "STAGE", "Missing")
+            finally:
+                conn.close()
+        assert server.request_count("GetSceneItemId") == 2
+        assert tracker.summary()["scene_item"]["count"] == 2
+        assert "scene_list" not in tracker.summary()
+
+    def test_async_engine_strobes_from_the_index(self):
+        async def wrapper():
+            server = FakeObsServer(scenes=["STAGE"])
+            server.add_item("STAGE", "Laser", enabled=False)
+            client = await connect_fake(server)
+            engine = main.AsyncEngine(client)
+            await engine.start()
+            try:
+                await engine.play(main.source_program("STAGE", "Laser", "strobe", tick=0.01, flashes=2))
+                return server
+            finally:
+                await engine.stop()
+                await client.close()
+                await server.close()
+
+        server = main.asyncio.run(wrapper())
+        assert [d["sceneItemEnabled"] for _, d in server.request_log("SetSceneItemEnabled")] == [True, False] * 2
+        assert server.request_count("GetSceneItemId") == 0
+
+
+class TestAsyncEngine:
+
+    def run_engine(self, scenario, scenes=("P_1", "P_2", "P_3")):
+        async def wrapper():
+            server = FakeObsServer(scenes=list(scenes))
+            client = await connect_fake(server)
+            engine = main.AsyncEngine(client)
+            await engine.start()
+            try:
+                return await scenario(engine, server)
+            finally:
+                await engine.stop()
+                await client.close()
+                await server.close()
+
+        return main.asyncio.run(wrapper())
+
+    @staticmethod
+    def switches(server):
+        return [d["sceneName"] for t, d in server.requests if t == "SetCurrentProgramScene"]
+
+    def test_loop_program_switches_scenes(self):
+        async def scenario(engine, server):
+            engine.switches.window_ms = 0   # every 10 ms switch, uncoalesced
+            engine.play(main.prefix_loop_program("P_", "cycle", tick=0.01))
+            await until(lambda: len(self.switches(server)) >= 5)
+            return self.switches(server)[:5]
+
+        assert self.run_engine(scenario) == ["P_1", "P_2", "P_3", "P_1", "P_2"]
+
+    def test_play_replaces_lane_and_cancels_old_task(self):
+        async def scenario(engine, server):
+            first = engine.play(main.prefix_loop_program("P_", "cycle", tick=60))
+            await until(lambda: len(self.switches(server)) == 1)
+            engine.play(main.static_program("P_3"))
+            await until(lambda: server.program_scene == "P_3")
+            await main.asyncio.sleep(0)
+            return first.cancelled()
+
+        assert self.run_engine(scenario)
+
+    def test_quantized_trigger_waits_for_the_loop_boundary(self):
+        async def scenario(engine, server):
+            engine.play(main.prefix_loop_program("P_", "cycle", tick=0.1))
+            await main.asyncio.sleep(0.13)
+            at = engine.timelines["main"].boundary(1)
+            with patch.dict(main.MIDI_MAP, {61: {"action": "static", "scene": "P_1", "quantize": "beat"}},
+                            clear=True):
+                engine.handle(note_on(61))
+            assert self.switches(server) == ["P_1", "P_2"]
+            await until(lambda: server.program_scene == "P_1")
+            landed = server.request_log("SetCurrentProgramScene")[-1][0]
+            return abs(landed * 1e9 - at), self.switches(server)
+
+        offset, switches = self.run_engine(scenario)
+        assert switches == ["P_1", "P_2", "P_1"]   # the loop's own P_3 never went out
+        assert offset < 5_000_000
+
+    def test_many_lanes_without_threads(self):
+        async def scenario(engine, server):
+            threads_before = main.threading.active_count()
+            engine.switches.window_ms = 0
+            for n in range(50):
+                engine.play(main.loop_program(["P_1", "P_2"], tick=0.01, style="cycle"), lane=f"lane{n}")
+            await until(lambda: len(self.switches(server)) >= 200)
+            return len(engine.lanes), main.threading.active_count() - threads_before
+
+        lanes, new_threads = self.run_engine(scenario)
+        assert lanes == 50
+        assert new_threads == 0
+
+    def test_handle_midi_note_through_feed(self):
+        async def scenario(engine, server):
+            entry = {"action": "static", "scene": "P_2"}
+            with patch.dict(main.MIDI_MAP, {60: entry}, clear=True):
+                runner = main.asyncio.ensure_future(engine.run())
+                main.threading.Thread(target=engine.feed, args=(note_on(60),)).start()
+                await until(lambda: server.program_scene == "P_2")
+                runner.cancel()
+            return server.program_scene
+
+        assert self.run_engine(scenario) == "P_2"
+
+    def test_pause_resumes_on_trigger_note(self):
+        async def scenario(engine, server):
+            steps = [{"action": "pause"}, {"action": "static", "scene": "P_3"}]
+            engine.play(main.sequence_program(steps, trigger_note=36))
+            await until(lambda: "main" in engine._resume)
+            assert server.program_scene == "P_1"
+            engine.handle(note_on(36))
+            await until(lambda: server.program_scene == "P_3")
+            return server.program_scene
+
+        assert self.run_engine(scenario) == "P_3"
+
+    def test_note_resumes_every_lane_paused_on_it(self):
+        async def scenario(engine, server):
+            for lane in ("a", "b"):
+                steps = [{"action": "pause"}, {"action": "static", "scene": "P_3"}]
+                engine.play(main.sequence_program(steps, trigger_note=36), lane)
+            await until(lambda: len(engine._resume) == 2)
+            engine.handle(note_on(36))
+            await until(lambda: not engine.lanes)
+            return engine._resume
+
+        assert self.run_engine(scenario) == {}
+
+    def test_changed_running_loop_restarts(self):
+        loop = {"action": "loop", "prefix": "P_", "style": "cycle", "tick": 60}
+        async def scenario(engine, server):
+            with patch.dict(main.MIDI_MAP, {60: loop}, clear=True):
+                engine.handle(note_on(60))
+                first = engine.lanes["main"]
+                engine.restart_changed({61})
+                assert engine.lanes["main"] is first
+                engine.restart_changed({60})
+                await main.asyncio.sleep(0)
+                return first.cancelled(), dict(engine.notes)
+
+        cancelled, notes = self.run_engine(scenario)
+        assert cancelled and notes == {"main": 60}
+
+    def test_switch_storm_is_coalesced(self):
+        async def scenario(engine, server):
+            for n in range(30):
+                engine.play(main.static_program(f"P_{n % 3 + 1}"))
+                await main.asyncio.sleep(0.001)
+            await until(lambda: engine.switches.held is None and server.program_scene == "P_3")
+            return len(self.switches(server)), engine.switches.coalesced
+
+        sent, coalesced = self.run_engine(scenario)
+        assert sent < 10
+        assert coalesced > 0
+
+    def test_stop_cancels_held_switch(self):
+        async def scenario(engine, server):
+            engine.switches.window_ms = 200
+            engine.play(main.static_program("P_2"))
+            await until(lambda: server.program_scene == "P_2")
+            engine.play(main.static_program("P_3"))
+            await until(lambda: engine.switches.held is not None)
+            assert engine._held_timer is not None
+            await engine.stop()
+            await main.asyncio.sleep(0.3)
+            return engine._held_timer, engine.switches.held, self.switches(server)
+
+        timer, held, sent = self.run_engine(scenario)
+        assert (timer, held) == (None, None)
+        assert sent == ["P_2"]
+
+    def test_mirror_skips_switch_to_the_live_scene(self):
+        async def wrapper():
+            server = FakeObsServer(scenes=["P_1", "P_2"])
+            await server.start()
+            client = await main.AsyncObsClient(host="127.0.0.1", port=server.port, password="",
+                                               subs=main.OBS_EVENT_SUBS).connect()
+            engine = main.AsyncEngine(client, mirror=main.ObsMirror())
+            await engine.start()
+            try:
+                for scene in ("P_1", "P_2"):
+                    await engine.play(main.static_program(scene))
+                await until(lambda: engine.mirror.redundant(client, "SetCurrentProgramScene",
+                                                            {"sceneName": "P_2"}))
+                return self.switches(server), engine.mirror.saved
+            finally:
+                await engine.stop()
+                await client.close()
+                await server.close()
+
+        assert main.asyncio.run(wrapper()) == (["P_2"], 2)
+
+    def test_catalog_follows_scene_events(self):
+        async def scenario(engine, server):
+            assert engine.catalog.lookup("P_") == ["P_1", "P_2", "P_3"]
+            await engine.client.request("CreateScene", {"sceneName": "P_4"})
+            await until(lambda: len(engine.catalog.lookup("P_")) == 4)
+            return server.request_count("GetSceneList")
+
+        assert self.run_engine(scenario) == 1
+
+
+class TestRequestBatch:
+
+    FILTER = {"requestType": "SetSourceFilterEnabled",
+              "requestData": {"sourceName": "Cam", "filterName": "Blur", "filterEnabled": True}}
+
+    def test_switch_program_batches_extra_requests(self):
+        program = main.switch_program("A", main.action_requests({"requests": [self.FILTER]}))
+        kind, requests = next(program)
+        assert kind == "batch"
+        assert requests == (("SetCurrentProgramScene", {"sceneName": "A"}),
+                            ("SetSourceFilterEnabled", self.FILTER["requestData"]))
+        with pytest.raises(StopIteration) as done:
+            program.send([{}, main.ObsRequestError("SetSourceFilterEnabled", 600, "nope")])
+        assert done.value.value is None   # only the switch's own failure is returned
+
+    def test_switch_program_without_requests_is_a_plain_switch(self):
+        assert next(main.switch_program("A")) == ("scene", "A")
+
+    def test_static_trigger_sends_one_batch(self):
+        with FakeObsServer(scenes=["A", "B"]) as server:
+            client = main.obs.ReqClient(host="127.0.0.1", port=server.port, password="", timeout=5)
+            try:
+                entry = {"action": "static", "scene": "B", "requests": [self.FILTER]}
+                with patch.dict(main.MIDI_MAP, {60: entry}, clear=True):
+                    main.handle_midi(note_on(60), client)
+                    assert main.lanes.wait_idle(timeout=2)
+            finally:
+                client.disconnect()
+        assert server.program_scene == "B"
+        assert server.filters == {("Cam", "Blur"): True}
+        assert server.batches == [(main.BATCH_EXECUTION_TYPES["serial_frame"], 2)]
+        assert server.request_count("SetCurrentProgramScene") == 1
+
+    def test_loop_batches_only_its_first_switch(self):
+        with FakeObsServer(scenes=["P_1", "P_2"]) as server:
+            client = main.obs.ReqClient(host="127.0.0.1", port=server.port, password="", timeout=5)
+            try:
+                play_on_lanes(client, main.loop_program(
+                    ["P_1", "P_2"], 0.001, "cycle", max_repeats=2,
+                    clock=main.TickClock(0.001, policy="catch_up"),
+                    requests=main.action_requests({"requests": [self.FILTER]})))
+            finally:
+                client.disconnect()
+        assert server.batches == [(main.BATCH_EXECUTION_TYPES["serial_frame"], 2)]
+        assert server.request_count("SetCurrentProgramScene") == 4
+
+    def test_unknown_execution_type_raises(self):
+        with pytest.raises(ValueError):
+            main._batch_payload("1", [("GetVersion", None)], "sometimes", False)
+
+
+# ---------------------------------------------------------------------------
+# Session recording
+# ---------------------------------------------------------------------------
+
+class TestSessionRecorder:
+
+    def test_records_midi_and_requests_with_timestamps(self, tmp_path):
+        fake = FakeClock()
+        recorder = main.SessionRecorder(clock=fake)
+        path = str(tmp_path / "session.jsonl")
+        seed = recorder.open(path, {"36": {"action": "static", "scene": "A"}}, seed=7)
+        handled = []
+        handler = recorder.wrap(lambda msg, port: handled.append((msg.note, port)))
+        fake.advance(0.5)
+        handler(note_on(36), "Pads")
+        sent = fake.now
+        fake.advance(0.002)
+        recorder.request({"requestType": "SetCurrentProgramScene", "requestData": {"sceneName": "A"}},
+                         {"requestStatus": {"result": True, "code": 100}}, sent)
+        recorder.close()
+        header, records = main.read_session(path)
+        assert seed == header["seed"] == 7
+        assert header["flags"]["LATE_TICK_POLICY"] == main.LATE_TICK_POLICY
+        assert handled == [(36, "Pads")]
+        assert records[0] == {"us": 500_000, "port": "Pads", "midi": [0x90, 36, 100]}
+        assert records[1]["us"] == 500_000 and records[1]["rtt_us"] == 2_000
+
+    def test_closed_recorder_passes_handlers_through(self):
+        recorder = main.SessionRecorder()
+        handler = lambda msg, port: None
+        assert recorder.wrap(handler) is handler
+        recorder.midi(note_on(36), None)   # no file: ignored
+
+    def test_read_session_rejects_other_files(self, tmp_path):
+        path = tmp_path / "x.jsonl"
+        path.write_text('{"results": []}\n')
+        with pytest.raises(ValueError):
+            main.read_session(str(path))
+
+    def test_scale_tempo(self):
+        raw = {
+            "36": {"action": "loop", "prefix": "A_", "style": "cycle", "bpm": 120, "steps": 4},
+            "37": {"action": "sequence", "steps": [{"action": "loop", "prefix": "B_", "style": "cycle",
+                                                    "tick": 0.5}]},
+            "ports": {"Pads": {"36": {"action": "loop", "prefix": "C_", "style": "cycle", "tick": 1.0}}},
+        }
+        scaled = main.scale_tempo(raw, 2.0)
+        assert scaled["36"]["bpm"] == 240 and scaled["36"]["steps"] == 4
+        assert scaled["37"]["steps"][0]["tick"] == 0.25
+        assert scaled["ports"]["Pads"]["36"]["tick"] == 0.5
+        assert raw["36"]["bpm"] == 120
+
+
+# ---------------------------------------------------------------------------
+# Benchmark harness
+# ---------------------------------------------------------------------------
+
+import bench
+
+
+class TestBench:
+
+    def test_trigger_bench_reports_every_stage(self):
+        result = bench.bench_trigger(notes=3, obs_latency=0.0, scenes=3, gap=0.05)
+        assert result["notes"] == 3
+        for stage in ("handle", "dispatch", "obs_request", "note_to_switch", "note_to_program"):
+            assert result[f"{stage}_p50_ms"] <= result[f"{stage}_max_ms"]
+
+    def test_fake_obs_logs_switch_times(self):
+        with FakeObsServer(scene_count=2) as server:
+            server.execute("SetCurrentProgramScene", {"sceneName": "LOOP_A_2"})
+            server.execute("GetSceneList", {})
+            log = server.request_log("SetCurrentProgramScene")
+        assert [data for _, data in log] == [{"sceneName": "LOOP_A_2"}]
+
+    def test_replay_reproduces_a_recorded_random_loop(self, tmp_path):
+        path = str(tmp_path / "session.jsonl")
+        config = {"36": {"action": "loop", "prefix": "LOOP_A_", "style": "random", "tick": 0.1},
+                  "37": {"action": "static", "scene": "LOOP_A_1"}}
+        recorder = main.SessionRecorder()
+        with FakeObsServer(scene_count=6) as server, \
+                patch.object(main, "recorder", recorder), \
+                patch.object(main, "MIDI_MAP", main.build_action_map(config)), \
+                patch.object(main, "scene_catalog", main.SceneCatalog()):
+            recorder.open(path, config)
+            client = main.ObsConnection(host="127.0.0.1", port=server.port, password="").connect()
+            try:
+                main.scene_catalog.load(client)
+                handler = recorder.wrap(lambda msg, port: main.handle_midi(msg, client, port))
+                handler(note_on(36), None)
+                time.sleep(0.45)
+                handler(note_on(37), None)
+                assert main.lanes.wait_idle(timeout=2)
+            finally:
+                recorder.close()
+                client.close()
+        result = bench.bench_replay(path, speed=2.0, obs_latency=0.0, scenes=0)
+        assert result["recorded_switches"] == 6
+        assert result["matching_switches"] >= 5
+
+    def test_compare_matches_results_by_name(self):
+        baseline = {"results": [{"name": "a", "p50_ms": 2.0, "label": "x"}, {"mode": "poll", "cpu": 0}]}
+        current = {"results": [{"name": "a", "p50_ms": 1.0, "label": "y"}, {"mode": "poll", "cpu": 1}]}
+        assert bench.compare(baseline, current) == [
+            {"name": "a", "metric": "p50_ms", "baseline": 2.0, "current": 1.0, "change_percent": -50.0},
+            {"name": "poll", "metric": "cpu", "baseline": 0, "current": 1, "change_percent": None},
+        ]
@@ -0,0 +1,37 @@
+import { describe, it, expect } from 'vitest'
+import { joinConfig, splitConfig } from '../configFile.js'
+import type { ConfigFile } from '../types.js'
+
+describe('splitConfig', () => {
+  it('returns only notes for a plain note map', () => {
+    const data: ConfigFile = { '36': { action: 'static', scene: 'A' } }
+    expect(splitConfig(data)).toEqual({ entries: data, sections: {} })
+  })
+
+  it('keeps the "ports" section out of the notes', () => {
+    const ports = { Launchpad: { '36': { action: 'stop' as const } } }
+    const { entries, sections } = splitConfig({ ports, '48': { action: 'stop' } })
+    expect(Object.keys(entries)).toEqual(['48'])
+    expect(sections).toEqual({ ports })
+  })
+
+  it('keeps the "cc" section out of the notes', () => {
+    const cc = {
+      '7': { requestType: 'SetInputVolume', requestData: { inputName: 'Mic', inputVolumeDb: '$value' } },
+    }
+    const { entries, sections } = splitConfig({ '36': { action: 'stop' }, cc })
+    expect(Object.keys(entries)).toEqual(['36'])
+    expect(sections).toEqual({ cc })
+  })
+})
+
+describe('joinConfig', () => {
+  it('round-trips a config with its sections', () => {
+    const data: ConfigFile = {
+      '36': { action: 'static', scene: 'A' },
+      ports: { Keys: { '60': { action: 'stop' } } },
+    }
+    const { entries, sections } = splitConfig(data)
+    expect(joinConfig(entries, sections)).toEqual(data)
+  })
+})
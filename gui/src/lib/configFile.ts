@@ -0,0 +1,39 @@
+/**
+ * Splits a config file into its MIDI note entries and the top-level
+ * sections that are not notes, and joins them back for saving.
+ * No Svelte dependencies — safe to import in unit tests.
+ */
+
+import type { ActionConfig, ConfigFile, ConfigSections } from './types.js'
+
+/** Top-level config keys that hold a section rather than a MIDI note. */
+export const SECTION_KEYS: readonly (keyof ConfigSections)[] = ['ports', 'cc']
+
+function isSectionKey(key: string): key is keyof ConfigSections {
+  return (SECTION_KEYS as readonly string[]).includes(key)
+}
+
+/** Separates the note → action entries of a parsed config from its sections. */
+export function splitConfig(data: ConfigFile): {
+  entries: Record<string, ActionConfig>
+  sections: ConfigSections
+} {
+  const entries: Record<string, ActionConfig> = {}
+  const sections: ConfigSections = {}
+  for (const [key, value] of Object.entries(data)) {
+    if (isSectionKey(key)) {
+      Object.assign(sections, { [key]: value })
+    } else if (value !== undefined) {
+      entries[key] = value as ActionConfig
+    }
+  }
+  return { entries, sections }
+}
+
+/** Joins note entries and sections into one config, the sections last. */
+export function joinConfig(
+  entries: Record<string, ActionConfig>,
+  sections: ConfigSections,
+): ConfigFile {
+  return { ...entries, ...sections }
+}
@@ -1,7 +1,10 @@
-import type { ActionConfig } from './types.js'
+import type { ActionConfig, ConfigFile, ConfigSections } from './types.js'
+import { joinConfig, splitConfig } from './configFile.js'
 
 class ConfigStore {
   entries: Record<string, ActionConfig> = $state({})
+  /** Sections other than notes ("ports", "cc"): not edited here, but saved back as loaded. */
+  sections: ConfigSections = $state({})
 
   add(noteStr: string, action: ActionConfig) {
     this.entries[noteStr] = action
@@ -26,14 +29,21 @@ class ConfigStore {
     return { action: 'static', scene: this.nextSceneName() }
   }
 
-  /** Replace all entries (used for import / localStorage restore). */
-  load(data: Record<string, ActionConfig>) {
+  /** Replace all entries and sections (used for import / localStorage restore). */
+  load(data: ConfigFile) {
+    const { entries, sections } = splitConfig(data)
     for (const key of Object.keys(this.entries)) {
       delete this.entries[key]
     }
-    for (const [key, value] of Object.entries(data)) {
+    for (const [key, value] of Object.entries(entries)) {
       this.entries[key] = value
     }
+    this.sections = sections
+  }
+
+  /** The whole config, notes and sections, as it is saved. */
+  toConfig(): ConfigFile {
+    return joinConfig(this.entries, this.sections)
   }
 }
 
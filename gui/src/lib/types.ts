@@ -48,3 +48,28 @@ export type ActionConfig =
   | StopAction
   | PauseAction
   | SequenceAction
+
+/** MIDI port name (or part of one) → that port's own note map. */
+export type PortMaps = Record<string, Record<string, ActionConfig>>
+
+/** One MIDI CC mapping: an OBS request whose "$value" placeholder follows the controller. */
+export interface CcMapping {
+  requestType: string
+  requestData: Record<string, unknown>
+  range?: [number, number]
+  curve?: string
+  smoothing?: number
+  integer?: boolean
+}
+
+/** Top-level config sections that are not MIDI notes; the editor keeps them as loaded. */
+export interface ConfigSections {
+  ports?: PortMaps
+  /** MIDI controller number → CC mapping. */
+  cc?: Record<string, CcMapping>
+}
+
+/** A whole config file: MIDI note → action, plus the optional sections. */
+export interface ConfigFile extends ConfigSections {
+  [key: string]: ActionConfig | ConfigSections[keyof ConfigSections]
+}